@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Example compile server, speaking the protocol described in USAGE.md.
+
+This one just forwards each request to a compile command, so it only saves the
+permuter from spawning a shell per candidate. Real servers get their speedup by
+keeping the compiler (or its emulator, e.g. qemu-irix or wine) resident between
+requests. To use it, put this in settings.toml:
+
+compile_server = "../../compile_server_example.py ./compile.sh"
+"""
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+
+
+def read_exact(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        sys.exit(0)
+    return data
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} compile-command...", file=sys.stderr)
+        sys.exit(1)
+    cmd = sys.argv[1:]
+    inf = sys.stdin.buffer
+    outf = sys.stdout.buffer
+    with tempfile.TemporaryDirectory(prefix="permuter-server") as tmpdir:
+        c_name = os.path.join(tmpdir, "in.c")
+        o_name = os.path.join(tmpdir, "out.o")
+        while True:
+            (length,) = struct.unpack(">I", read_exact(inf, 4))
+            with open(c_name, "wb") as f:
+                f.write(read_exact(inf, length))
+            proc = subprocess.run(
+                cmd + [c_name, "-o", o_name],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+            if proc.returncode == 0:
+                with open(o_name, "rb") as f:
+                    status, payload = 0, f.read()
+            else:
+                status, payload = 1, proc.stdout
+            outf.write(struct.pack(">BI", status, len(payload)) + payload)
+            outf.flush()
+
+
+if __name__ == "__main__":
+    main()
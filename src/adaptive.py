@@ -0,0 +1,138 @@
+"""Online adaptation of randomization pass weights, for --adaptive-weights.
+
+Each candidate is credited to the randomization pass that produced it. The
+parent process keeps per-pass tallies of what those candidates led to, and
+periodically turns them into new sampling weights which are sent back to the
+workers. Weights are picked by probability matching on smoothed success rates,
+mixed with the original weights (as in EXP3) so that no pass ever starves."""
+from enum import Enum
+from typing import Dict, List, Mapping
+
+# Fraction of the sampling weight that stays distributed according to the
+# original weights.
+DEFAULT_WEIGHT_FLOOR = 0.2
+
+# Number of credited results between weight updates.
+DEFAULT_UPDATE_INTERVAL = 200
+
+# Tallies are halved whenever their total exceeds this, so that the weights
+# can follow the search as it moves on to different kinds of improvements.
+DEFAULT_HISTORY = 20000
+
+# Strength of the prior pulling each pass's success rate towards the overall
+# success rate, in number of pseudo-trials.
+PRIOR_TRIALS = 20.0
+
+
+class PassOutcome(Enum):
+    better_or_equal = 1
+    worse = 2
+    compile_error = 3
+    duplicate = 4
+
+
+class PassBandit:
+    def __init__(
+        self,
+        base_weights: Mapping[str, float],
+        *,
+        floor: float = DEFAULT_WEIGHT_FLOOR,
+        update_interval: int = DEFAULT_UPDATE_INTERVAL,
+        history: int = DEFAULT_HISTORY,
+    ) -> None:
+        self.base_weights = dict(base_weights)
+        self.floor = floor
+        self.update_interval = update_interval
+        self.history = history
+        self.tallies: Dict[str, Dict[PassOutcome, float]] = {
+            name: {outcome: 0.0 for outcome in PassOutcome}
+            for name in self.base_weights
+        }
+        self._total = 0.0
+        self._since_update = 0
+
+    def record(self, pass_name: str, outcome: PassOutcome) -> bool:
+        """Credit a pass with an outcome. Returns True when it is time to send
+        out new weights."""
+        tally = self.tallies.get(pass_name)
+        if tally is None:
+            return False
+        tally[outcome] += 1
+        self._total += 1
+        if self._total > self.history:
+            for t in self.tallies.values():
+                for o in t:
+                    t[o] /= 2
+            self._total /= 2
+        self._since_update += 1
+        if self._since_update >= self.update_interval:
+            self._since_update = 0
+            return True
+        return False
+
+    def _trials(self, name: str) -> float:
+        return sum(self.tallies[name].values())
+
+    def _successes(self, name: str) -> float:
+        return self.tallies[name][PassOutcome.better_or_equal]
+
+    def weights(self) -> Dict[str, float]:
+        """Compute sampling weights from the tallies so far. Weights sum to
+        the same total as the original ones, and disabled passes (weight 0)
+        stay disabled."""
+        base_total = sum(self.base_weights.values())
+        active = [name for name, w in self.base_weights.items() if w > 0]
+        if not active:
+            return dict(self.base_weights)
+        all_successes = sum(self._successes(name) for name in active)
+        all_trials = sum(self._trials(name) for name in active)
+        mean_rate = (all_successes + 1) / (all_trials + 2)
+        scores = {
+            name: self.base_weights[name]
+            * (self._successes(name) + PRIOR_TRIALS * mean_rate)
+            / (self._trials(name) + PRIOR_TRIALS)
+            for name in active
+        }
+        score_total = sum(scores.values())
+        ret = {name: 0.0 for name in self.base_weights}
+        for name in active:
+            share = (1 - self.floor) * scores[name] / score_total
+            share += self.floor * self.base_weights[name] / base_total
+            ret[name] = share * base_total
+        return ret
+
+    def get_str_stats(self) -> str:
+        """Return a table of learned weights along with per-pass outcome rates,
+        highest weight first."""
+        weights = self.weights()
+        lines = [
+            f"  {'pass'.ljust(32)} {'weight':>8} {'base':>8} {'tries':>8} "
+            f"{'ok':>6} {'error':>6} {'dup':>6}"
+        ]
+        for name in sorted(weights, key=lambda n: -weights[n]):
+            if self.base_weights[name] == 0:
+                continue
+            trials = self._trials(name)
+            tally = self.tallies[name]
+
+            def pct(outcome: PassOutcome) -> str:
+                if trials == 0:
+                    return "-"
+                return f"{100 * tally[outcome] / trials:.0f}%"
+
+            lines.append(
+                f"  {name.ljust(32)} {weights[name]:>8.2f} "
+                f"{self.base_weights[name]:>8.2f} {trials:>8.0f} "
+                f"{pct(PassOutcome.better_or_equal):>6} "
+                f"{pct(PassOutcome.compile_error):>6} "
+                f"{pct(PassOutcome.duplicate):>6}"
+            )
+        return "\n".join(lines)
+
+    def weight_overrides_toml(self) -> str:
+        """Format the learned weights as a [weight_overrides] block for
+        settings.toml."""
+        lines: List[str] = ["[weight_overrides]"]
+        for name, weight in sorted(self.weights().items()):
+            lines.append(f"{name} = {weight:.2f}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,350 @@
+"""In-process API for running the permuter from other tools, without going
+through the command line. Inputs are passed in memory, results come back as
+a stream of events, and nothing is written to disk except temporary files,
+unless an output directory is given.
+
+    with PermuterPool(workers=4) as pool:
+        for event in pool.permute(Function(source, target_o, "./compile.sh")):
+            if isinstance(event, Improvement):
+                print(event.score)
+
+The pool's worker processes are started on first use, and kept around for
+later calls to permute(), which may also run concurrently."""
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+import os
+import tempfile
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Generator,
+    Iterator,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .candidate import CandidateResult
+from .compiler import Compiler
+from .helpers import get_default_randomization_weights, merge_randomization_weights
+from .main import DEFAULT_RAND_KEEP_PROB, write_candidate
+from .permuter import EvalError, Permuter
+from .pool import POOL_QUEUE_DEPTH, PoolResult, WorkerPool
+from .scorer import Scorer
+
+# How long to wait for a result at a time, so that concurrent calls to
+# permute() take turns reading results, and stats ticks go out on time.
+POLL_INTERVAL = 0.1
+
+
+@dataclass
+class Function:
+    """A function to permute."""
+
+    # C source containing the function, already run through the preprocessor
+    # like base.c is (see src/preprocess.py).
+    source: str
+    # Contents of the object file to match.
+    target_o: bytes
+    # Compile script, invoked as "<compile_cmd> input.c -o output.o", like
+    # compile.sh.
+    compile_cmd: str
+    fn_name: Optional[str] = None
+    compiler_type: str = "base"
+    weight_overrides: Mapping[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class Found:
+    score: int
+    base_score: int
+    source: str
+    hash: str
+    # Where the result was written, if an output directory was given.
+    output_dir: Optional[str]
+
+
+class Improvement(Found):
+    """A result with a better score than any so far."""
+
+
+class Tie(Found):
+    """A result with the same score as the best so far, but different asm."""
+
+
+class Alternative(Found):
+    """A result that is better than the base, or different from it with the
+    same score, but worse than the best so far. Not sent with best_only."""
+
+
+@dataclass
+class Error:
+    """An internal error in the permuter while evaluating a candidate."""
+
+    message: str
+    # Reproduces the failure, with the permuter's --seed flag.
+    seed: Optional[Tuple[int, int]]
+
+
+@dataclass
+class StatsTick:
+    """Periodic statistics, also sent once at the end."""
+
+    iterations: int
+    # Candidates that failed to compile.
+    errors: int
+    seconds: float
+    base_score: int
+    best_score: int
+
+
+Event = Union[Improvement, Tie, Alternative, Error, StatsTick]
+
+
+def _create_permuter(
+    function: Function,
+    *,
+    keep_prob: float,
+    stack_differences: bool,
+    algorithm: str,
+    better_only: bool,
+    best_only: bool,
+    score_threshold: Optional[int],
+    output_dir: Optional[str],
+) -> Permuter:
+    # Like the permuter@home evaluator, hand the target to the scorer through
+    # a temporary file, which is only needed while setting up.
+    fd, path = tempfile.mkstemp(suffix=".o", prefix="permuter", text=False)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(function.target_o)
+        scorer = Scorer(
+            path,
+            stack_differences=stack_differences,
+            algorithm=algorithm,
+            debug_mode=False,
+        )
+    finally:
+        os.unlink(path)
+
+    compiler = Compiler(function.compile_cmd, show_errors=False, debug_mode=False)
+    randomization_weights = merge_randomization_weights(
+        get_default_randomization_weights(function.compiler_type),
+        function.weight_overrides,
+    )
+    return Permuter(
+        dir=output_dir or "unused",
+        fn_name=function.fn_name,
+        compiler=compiler,
+        scorer=scorer,
+        source_file="<memory>",
+        source=function.source,
+        randomization_weights=randomization_weights,
+        force_seed=None,
+        force_rng_seed=None,
+        keep_prob=keep_prob,
+        need_profiler=False,
+        need_all_sources=False,
+        show_errors=False,
+        best_only=best_only,
+        better_only=better_only,
+        score_threshold=score_threshold,
+        debug_mode=False,
+        speed=100,
+    )
+
+
+class PermuterPool:
+    """A pool of worker processes that permute() calls run on."""
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[WorkerPool] = None
+        # Protects the pool, and results read by one call that belong to
+        # another.
+        self._lock = threading.Lock()
+        self._results: Dict[int, Deque[PoolResult]] = {}
+
+    def __enter__(self) -> "PermuterPool":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    def _get_pool(self) -> WorkerPool:
+        if self._pool is None:
+            self._pool = WorkerPool(self.workers)
+        return self._pool
+
+    def _next_result(self, perm_id: int, timeout: float) -> Optional[PoolResult]:
+        with self._lock:
+            pending = self._results[perm_id]
+            if pending:
+                return pending.popleft()
+            pool = self._get_pool()
+            deadline = time.monotonic() + timeout
+            while True:
+                item = pool.get_result(timeout=max(deadline - time.monotonic(), 0))
+                if item is None or item.perm_id == perm_id:
+                    return item
+                if item.perm_id in self._results:
+                    self._results[item.perm_id].append(item)
+
+    def permute(
+        self,
+        function: Function,
+        *,
+        keep_prob: float = DEFAULT_RAND_KEEP_PROB,
+        stack_differences: bool = False,
+        algorithm: str = "difflib",
+        better_only: bool = False,
+        best_only: bool = False,
+        score_threshold: Optional[int] = None,
+        stop_on_zero: bool = True,
+        max_iterations: Optional[int] = None,
+        max_time: Optional[float] = None,
+        stats_interval: float = 1.0,
+        output_dir: Optional[str] = None,
+    ) -> Generator[Event, None, None]:
+        """Permute a function, yielding events as they happen. This goes on
+        until score 0 is found (with stop_on_zero), all permutations have been
+        tried, max_iterations candidates have been evaluated, max_time seconds
+        have passed, or the iterator is closed. Raises
+        CandidateConstructionFailure if the base source doesn't compile.
+
+        Results are written to output-* directories in output_dir, if given."""
+        permuter = _create_permuter(
+            function,
+            keep_prob=keep_prob,
+            stack_differences=stack_differences,
+            algorithm=algorithm,
+            better_only=better_only,
+            best_only=best_only,
+            score_threshold=score_threshold,
+            output_dir=output_dir,
+        )
+        with self._lock:
+            pool = self._get_pool()
+            perm_id = pool.add_permuter(permuter)
+            self._results[perm_id] = deque()
+
+        def stats() -> StatsTick:
+            return StatsTick(
+                iterations=iterations,
+                errors=errors,
+                seconds=time.monotonic() - start,
+                base_score=permuter.base_score,
+                best_score=permuter.best_score,
+            )
+
+        seeds: Optional[Iterator[int]] = permuter.seed_iterator(
+            0, shard=0, num_shards=1
+        )
+        submitted = 0
+        outstanding = 0
+        iterations = 0
+        errors = 0
+        start = time.monotonic()
+        last_tick = start
+        try:
+            while True:
+                with self._lock:
+                    while (
+                        seeds is not None
+                        and outstanding < POOL_QUEUE_DEPTH * self.workers
+                    ):
+                        seed = next(seeds, None)
+                        if seed is None or submitted == max_iterations:
+                            seeds = None
+                            break
+                        pool.submit(perm_id, seed)
+                        submitted += 1
+                        outstanding += 1
+                if not outstanding:
+                    break
+                if max_time is not None and time.monotonic() - start >= max_time:
+                    break
+
+                item = self._next_result(perm_id, POLL_INTERVAL)
+                if item is not None:
+                    outstanding -= 1
+                    result = item.result
+                    if isinstance(result, EvalError):
+                        yield Error(result.exc_str or "", result.seed)
+                    else:
+                        iterations += 1
+                        if result.score == permuter.scorer.PENALTY_INF:
+                            errors += 1
+                        event = self._output(permuter, result, output_dir)
+                        if event is not None:
+                            yield event
+                        if result.score == 0 and stop_on_zero:
+                            break
+
+                if time.monotonic() - last_tick >= stats_interval:
+                    last_tick = time.monotonic()
+                    yield stats()
+            yield stats()
+        finally:
+            with self._lock:
+                del self._results[perm_id]
+                pool.remove_permuter(perm_id)
+
+    @staticmethod
+    def _output(
+        permuter: Permuter, result: CandidateResult, output_dir: Optional[str]
+    ) -> Optional[Union[Improvement, Tie, Alternative]]:
+        if not permuter.should_output(result):
+            return None
+        assert result.source is not None and result.hash is not None
+        former_best = permuter.best_score
+        permuter.record_result(result)
+        written: Optional[str] = None
+        if output_dir is not None:
+            written = write_candidate(permuter, result, no_context_output=False)
+        args = (result.score, permuter.base_score, result.source, result.hash, written)
+        if result.score < former_best:
+            return Improvement(*args)
+        if result.score == former_best:
+            return Tie(*args)
+        return Alternative(*args)
+
+    async def apermute(self, function: Function, **kwargs: Any) -> AsyncIterator[Event]:
+        """Like permute(), as an async iterator. The work of waiting for
+        results happens in the event loop's default executor."""
+        loop = asyncio.get_running_loop()
+        events = self.permute(function, **kwargs)
+        pending: "Optional[asyncio.Future[Optional[Event]]]" = None
+        try:
+            while True:
+                pending = loop.run_in_executor(None, next, events, None)
+                event = await asyncio.shield(pending)
+                pending = None
+                if event is None:
+                    break
+                yield event
+        finally:
+            if pending is not None:
+                # Cancelled while next() was running. The generator can't be
+                # closed until that returns.
+                await asyncio.wait([pending])
+            await loop.run_in_executor(None, events.close)
+
+
+def permute(function: Function, *, workers: int = 1, **kwargs: Any) -> Iterator[Event]:
+    """Permute a single function, with a pool of its own. See
+    PermuterPool.permute for the options."""
+    with PermuterPool(workers) as pool:
+        yield from pool.permute(function, **kwargs)
@@ -8,10 +8,12 @@ They make a number of simplifying assumptions:
 For the purposes of the randomizer these restrictions are acceptable."""
 
 from dataclasses import dataclass, field
-from typing import Union, Dict, Set, List
+from typing import Union, Dict, Optional, Sequence, Set, List, Tuple
 
 from pycparser import c_ast as ca
 
+from .cache import LRUCache
+
 Type = Union[ca.PtrDecl, ca.ArrayDecl, ca.TypeDecl, ca.FuncDecl]
 SimpleType = Union[ca.PtrDecl, ca.TypeDecl]
 
@@ -280,9 +282,10 @@ def allowed_basic_type(
     return True
 
 
-def build_typemap(ast: ca.FileAST, target_fn: ca.FuncDef) -> TypeMap:
-    ret = TypeMap()
-    for item in ast.ext:
+def _add_to_typemap(
+    ret: TypeMap, items: Sequence[ca.Node], target_fn: Optional[ca.FuncDef]
+) -> None:
+    for item in items:
         if isinstance(item, ca.Typedef):
             ret.typedefs[item.name] = item.type
     within_fn: bool = False
@@ -325,7 +328,49 @@ def build_typemap(ast: ca.FileAST, target_fn: ca.FuncDef) -> TypeMap:
                 self.visit(fn.body)
                 within_fn = False
 
-    Visitor().visit(ast)
+    visitor = Visitor()
+    for item in items:
+        visitor.visit(item)
+
+
+# Typemaps for the parts of the AST before and after the target function,
+# keyed by their exact top-level nodes. That context is shared between
+# candidates and rarely changes, so this saves walking it over and over.
+_context_typemaps: "LRUCache[Tuple[ca.Node, ...], TypeMap]" = LRUCache(32)
+
+
+def _context_typemap(items: Tuple[ca.Node, ...]) -> TypeMap:
+    ret = _context_typemaps.get(items)
+    if ret is None:
+        ret = TypeMap()
+        _add_to_typemap(ret, items, None)
+        _context_typemaps.put(items, ret)
+    return ret
+
+
+def build_typemap(ast: ca.FileAST, target_fn: ca.FuncDef) -> TypeMap:
+    try:
+        fn_index = ast.ext.index(target_fn)
+    except ValueError:
+        ret = TypeMap()
+        _add_to_typemap(ret, ast.ext, target_fn)
+        return ret
+
+    fn_part = TypeMap()
+    _add_to_typemap(fn_part, [target_fn], target_fn)
+    parts = [
+        _context_typemap(tuple(ast.ext[:fn_index])),
+        fn_part,
+        _context_typemap(tuple(ast.ext[fn_index + 1 :])),
+    ]
+
+    # Merging in AST order gives the same result as a single walk, down to
+    # dict iteration order.
+    ret = TypeMap(local_vars=fn_part.local_vars)
+    for part in parts:
+        ret.typedefs.update(part.typedefs)
+        ret.var_types.update(part.var_types)
+        ret.struct_defs.update(part.struct_defs)
     return ret
 
 
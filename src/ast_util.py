@@ -14,11 +14,45 @@ from .error import CandidateConstructionFailure
 from .ast_types import SimpleType, set_decl_name
 
 
-@dataclass
 class Indices:
+    """Positions of the starts and ends of all nodes within a subtree, in
+    traversal order. Computed on first use, since most randomization passes
+    don't need them."""
+
     starts: Dict[ca.Node, int]
     ends: Dict[ca.Node, int]
 
+    def __init__(self, top_node: ca.Node) -> None:
+        self._top_node = top_node
+
+    def __getattr__(self, name: str) -> Dict[ca.Node, int]:
+        # Only called for missing attributes, so after the first computation
+        # lookups of starts/ends are plain attribute accesses.
+        if name not in ("starts", "ends"):
+            raise AttributeError(name)
+        self._compute()
+        ret: Dict[ca.Node, int] = self.__dict__[name]
+        return ret
+
+    def _compute(self) -> None:
+        starts: Dict[ca.Node, int] = {}
+        ends: Dict[ca.Node, int] = {}
+        cur_index = 1
+
+        class Visitor(ca.NodeVisitor):
+            def generic_visit(self, node: ca.Node) -> None:
+                nonlocal cur_index
+                assert node not in starts, "nodes should only appear once in AST"
+                starts[node] = cur_index
+                cur_index += 2
+                super().generic_visit(node)
+                ends[node] = cur_index
+                cur_index += 2
+
+        Visitor().visit(self._top_node)
+        self.starts = starts
+        self.ends = ends
+
 
 Block = Union[ca.Compound, ca.Case, ca.Default]
 if TYPE_CHECKING:
@@ -46,10 +80,32 @@ def process_pragmas(source: str) -> str:
     source = source.replace(" = FIXEDADDR(", " : (")
     if "#pragma" not in source:
         return source
-    lines = source.split("\n")
     out: List[str] = []
-    same_line = 0
-    ignore = 0
+    state = _expand_pragma_lines(source.split("\n"), out, _PragmaState())
+    state.check_done()
+    return "".join(out).rstrip() + "\n"
+
+
+@dataclass
+class _PragmaState:
+    same_line: int = 0
+    ignore: int = 0
+
+    def is_initial(self) -> bool:
+        return self.same_line == 0 and self.ignore == 0
+
+    def check_done(self) -> None:
+        assert self.same_line == 0
+        assert self.ignore == 0, "unbalanced ignore pragmas"
+
+
+def _expand_pragma_lines(
+    lines: List[str], out: List[str], state: _PragmaState
+) -> _PragmaState:
+    """Expand permuter pragmas in a list of lines, appending to out. Returns
+    the pragma nesting state at the end."""
+    same_line = state.same_line
+    ignore = state.ignore
     for line in lines:
         stripped = line.strip()
         if stripped.startswith("#pragma _permuter "):
@@ -82,8 +138,58 @@ def process_pragmas(source: str) -> str:
         elif line and out and not out[-1].endswith("\n"):
             line = " " + line.lstrip()
         out.append(line)
-    assert same_line == 0
-    assert ignore == 0, "unbalanced ignore pragmas"
+    return _PragmaState(same_line=same_line, ignore=ignore)
+
+
+@dataclass
+class SourceChunk:
+    """Generated C code for a single top-level AST node, for splicing together
+    with other chunks by join_chunks."""
+
+    text: str
+    has_pragma: bool
+    # Text with pragmas expanded, assuming the chunk is not inside a pragma
+    # block, or None if the chunk itself leaves a block open.
+    expanded: Optional[str]
+
+
+def ext_to_chunk(node: ca.Node) -> SourceChunk:
+    source = PatchedCGenerator().visit(node)
+    # Mirror the separators of CGenerator.visit_FileAST.
+    if isinstance(node, ca.Pragma):
+        source += "\n"
+    elif not isinstance(node, ca.FuncDef):
+        source += ";\n"
+    source = source.replace(" = FIXEDADDR(", " : (")
+    expanded: Optional[str] = None
+    if source.endswith("\n"):
+        try:
+            out: List[str] = []
+            state = _expand_pragma_lines(source[:-1].split("\n"), out, _PragmaState())
+            if state.is_initial():
+                expanded = "".join(out)
+        except AssertionError:
+            pass
+    return SourceChunk(text=source, has_pragma="#pragma" in source, expanded=expanded)
+
+
+def join_chunks(chunks: List[SourceChunk]) -> Optional[str]:
+    """Combine chunks into the same output as to_c would give for a FileAST
+    consisting of their nodes. Pre-expanded text is used for chunks outside
+    of pragma blocks; the rest are expanded here. Returns None in the odd case
+    of a chunk not ending in a newline, when this doesn't work."""
+    if not any(chunk.has_pragma for chunk in chunks):
+        return "".join(chunk.text for chunk in chunks)
+    out: List[str] = []
+    state = _PragmaState()
+    for chunk in chunks:
+        if not chunk.text.endswith("\n"):
+            return None
+        if chunk.expanded is not None and state.is_initial():
+            out.append(chunk.expanded)
+        else:
+            state = _expand_pragma_lines(chunk.text[:-1].split("\n"), out, state)
+    state.check_done()
     return "".join(out).rstrip() + "\n"
 
 
@@ -104,6 +210,51 @@ class PatchedCGenerator(c_generator.CGenerator):
         return super().visit_If(n2)  # type: ignore
 
 
+_node_slots: Dict[type, List[str]] = {}
+
+
+def _get_node_slots(cls: type) -> List[str]:
+    slots = _node_slots.get(cls)
+    if slots is None:
+        slots = [
+            slot
+            for klass in cls.__mro__
+            for slot in getattr(klass, "__slots__", ())
+            if slot != "__weakref__"
+        ]
+        _node_slots[cls] = slots
+    return slots
+
+
+def clone_ast(node: ca.Node) -> ca.Node:
+    """A faster copy.deepcopy for ASTs. Nodes and lists are copied (preserving
+    any sharing between them, like deepcopy), while leaf values such as
+    strings and source coordinates, which we never mutate, are shared."""
+    memo: Dict[int, Any] = {}
+
+    def clone(value: Any) -> Any:
+        if isinstance(value, ca.Node):
+            ret = memo.get(id(value))
+            if ret is None:
+                cls = type(value)
+                ret = cls.__new__(cls)
+                memo[id(value)] = ret
+                for slot in _get_node_slots(cls):
+                    setattr(ret, slot, clone(getattr(value, slot)))
+            return ret
+        if isinstance(value, list):
+            ret = memo.get(id(value))
+            if ret is None:
+                ret = []
+                memo[id(value)] = ret
+                ret.extend(clone(item) for item in value)
+            return ret
+        return value
+
+    ret: ca.Node = clone(node)
+    return ret
+
+
 def extract_fn(ast: ca.FileAST, fn_name: str) -> Tuple[ca.FuncDef, int]:
     ret = []
     for i, node in enumerate(ast.ext):
@@ -153,22 +304,9 @@ def parse_c(source: str, *, from_import: bool = False) -> ca.FileAST:
 
 
 def compute_node_indices(top_node: ca.Node) -> Indices:
-    starts: Dict[ca.Node, int] = {}
-    ends: Dict[ca.Node, int] = {}
-    cur_index = 1
-
-    class Visitor(ca.NodeVisitor):
-        def generic_visit(self, node: ca.Node) -> None:
-            nonlocal cur_index
-            assert node not in starts, "nodes should only appear once in AST"
-            starts[node] = cur_index
-            cur_index += 2
-            super().generic_visit(node)
-            ends[node] = cur_index
-            cur_index += 2
-
-    Visitor().visit(top_node)
-    return Indices(starts, ends)
+    """Get node indices for a subtree. The subtree must not be modified until
+    they have been used for the first time."""
+    return Indices(top_node)
 
 
 def equal_ast(
@@ -0,0 +1,300 @@
+"""Batch mode (--batch): permuting a whole tree of input directories, a few at
+a time, with a budget for each."""
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
+import glob
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .candidate import CandidateResult
+from .error import CandidateConstructionFailure
+from .main import (
+    Options,
+    create_permuter,
+    describe_result,
+    shard_seed_iterators,
+    write_candidate,
+)
+from .permuter import EvalError, Permuter
+from .pool import PoolResult, WorkerPool
+from .printer import Printer
+from .schedule import SeedScheduler
+
+# Files that make a directory an input directory.
+INPUT_FILES = ["base.c", "target.o", "compile.sh"]
+
+# How long to wait for results before checking budgets, in seconds.
+POLL_INTERVAL = 0.1
+
+
+def find_directories(patterns: List[str]) -> Iterator[str]:
+    """Lazily yield the input directories below each of the given paths or
+    glob patterns, in sorted order."""
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            roots = sorted(glob.glob(pattern))
+        else:
+            roots = [pattern]
+        for root in roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith("output-"))
+                if all(f in filenames for f in INPUT_FILES):
+                    yield dirpath
+
+
+@dataclass
+class BatchEntry:
+    dir: str
+    # "running", or why the function was retired: "matched", "budget",
+    # "stalled", "exhausted" (all seeds tried), "failed" or "interrupted".
+    status: str = "running"
+    permuter: Optional[Permuter] = None
+    error: Optional[str] = None
+    perm_id: Optional[int] = None
+    seeds: Optional[Iterator[int]] = None
+    seeds_exhausted: bool = False
+    sched_index: int = -1
+    iterations: int = 0
+    # Time spent by workers evaluating candidates, in seconds.
+    seconds: float = 0.0
+    last_improvement: float = 0.0
+    outputs: List[str] = field(default_factory=list)
+    # What summary() says about the permuter, once it has been released.
+    fn_name: Optional[str] = None
+    base_score: Optional[int] = None
+    best_score: Optional[int] = None
+
+    def release(self) -> None:
+        """Drop the permuter of a retired function, keeping only what
+        summary() needs."""
+        if self.permuter is not None:
+            self.fn_name = self.permuter.fn_name
+            self.base_score = self.permuter.base_score
+            self.best_score = self.permuter.best_score
+        self.permuter = None
+        self.seeds = None
+
+    def summary(self) -> Dict[str, object]:
+        ret: Dict[str, object] = {"dir": self.dir, "status": self.status}
+        if self.permuter is not None:
+            ret["function"] = self.permuter.fn_name
+            ret["base_score"] = self.permuter.base_score
+            ret["best_score"] = self.permuter.best_score
+        elif self.fn_name is not None:
+            ret["function"] = self.fn_name
+            ret["base_score"] = self.base_score
+            ret["best_score"] = self.best_score
+        if self.error is not None:
+            ret["error"] = self.error
+        ret["iterations"] = self.iterations
+        ret["seconds"] = round(self.seconds, 3)
+        ret["outputs"] = self.outputs
+        return ret
+
+
+class BatchRunner:
+    """Keeps options.threads workers busy with the next functions in line,
+    setting each up in the background while the others run. Functions are
+    retired when they match, run out of budget or stop improving, and share
+    the workers equally in the meantime."""
+
+    def __init__(self, options: Options) -> None:
+        self.options = options
+        self.printer = Printer()
+        self.entries: List[BatchEntry] = []
+        self.pool = WorkerPool(max(options.threads, 1))
+        self.scheduler = SeedScheduler("time", [])
+        self._active: Dict[int, BatchEntry] = {}
+        self._pending = find_directories(options.directories)
+        self._loader = ThreadPoolExecutor(max_workers=1)
+        self._loading: "Optional[Tuple[BatchEntry, Future[Permuter]]]" = None
+        self._start = time.monotonic()
+
+    def _load(self, d: str) -> Permuter:
+        return create_permuter(self.options, d)[0]
+
+    def _start_loading(self) -> None:
+        if self._loading is not None or len(self._active) >= self.pool.num_workers:
+            return
+        d = next(self._pending, None)
+        if d is None:
+            return
+        entry = BatchEntry(d)
+        self.entries.append(entry)
+        self._loading = (entry, self._loader.submit(self._load, d))
+
+    def _finish_loading(self) -> None:
+        if self._loading is None or not self._loading[1].done():
+            return
+        entry, future = self._loading
+        self._loading = None
+        try:
+            permuter = future.result()
+        except CandidateConstructionFailure as e:
+            self._retire(entry, "failed", e.message)
+            return
+        except Exception as e:
+            self._retire(entry, "failed", str(e) or type(e).__name__)
+            return
+        entry.permuter = permuter
+        if permuter.base_score == 0:
+            self._retire(entry, "matched")
+            return
+        entry.perm_id = self.pool.add_permuter(permuter)
+        entry.seeds = shard_seed_iterators([permuter], [0], 0, 1)[0]
+        entry.sched_index = self.scheduler.add(1.0, list(self._active))
+        self._active[entry.sched_index] = entry
+        self.printer.print(f"base score = {permuter.base_score}", permuter, None)
+
+    def _retire(
+        self, entry: BatchEntry, status: str, error: Optional[str] = None
+    ) -> None:
+        entry.status = status
+        entry.error = error
+        self._active.pop(entry.sched_index, None)
+        if entry.perm_id is not None:
+            self.pool.remove_permuter(entry.perm_id)
+        if entry.permuter is not None:
+            msg = (
+                f"{status}: best score {entry.permuter.best_score} "
+                f"(base {entry.permuter.base_score}), "
+                f"{entry.iterations} iterations"
+            )
+        else:
+            msg = f"{entry.dir} {status}: {error}"
+        self.printer.print(msg, entry.permuter, None)
+        entry.release()
+        self.write_summary()
+
+    def _fill_pool(self) -> None:
+        while self.pool.has_room():
+            runnable = [i for i, e in self._active.items() if not e.seeds_exhausted]
+            if not runnable:
+                break
+            entry = self._active[self.scheduler.pick(runnable)]
+            assert entry.seeds is not None and entry.perm_id is not None
+            seed = next(entry.seeds, None)
+            if seed is None:
+                entry.seeds_exhausted = True
+                continue
+            self.pool.submit(entry.perm_id, seed)
+
+    def _handle_result(self, item: PoolResult) -> None:
+        entry = next(
+            (e for e in self._active.values() if e.perm_id == item.perm_id), None
+        )
+        if entry is None:
+            # Retired while the seed was being evaluated.
+            return
+        permuter = entry.permuter
+        assert permuter is not None
+        result = item.result
+        entry.seconds += item.seconds
+        improved = False
+        if isinstance(result, EvalError):
+            if result.exc_str is not None:
+                self.printer.print("internal permuter failure.", permuter, None)
+                print(result.exc_str)
+        else:
+            entry.iterations += 1
+            former_best = permuter.best_score
+            improved = result.score < former_best
+            if improved:
+                entry.last_improvement = entry.seconds
+            if permuter.should_output(result):
+                permuter.record_result(result)
+                color, msg = describe_result(permuter, result.score, former_best)
+                self.printer.print(msg, permuter, None, color=color)
+                entry.outputs.append(
+                    write_candidate(permuter, result, self.options.no_context_output)
+                )
+        self.scheduler.record(entry.sched_index, item.seconds, improved)
+        if isinstance(result, CandidateResult) and result.score == 0:
+            self._retire(entry, "matched")
+
+    def _check_budgets(self) -> None:
+        options = self.options
+        for entry in list(self._active.values()):
+            if (
+                options.batch_iterations
+                and entry.iterations >= options.batch_iterations
+            ):
+                self._retire(entry, "budget")
+            elif options.batch_budget and entry.seconds >= options.batch_budget:
+                self._retire(entry, "budget")
+            elif (
+                options.batch_stall
+                and entry.seconds - entry.last_improvement >= options.batch_stall
+            ):
+                self._retire(entry, "stalled")
+            elif entry.seeds_exhausted and entry.perm_id is not None:
+                if not self.pool.outstanding(entry.perm_id):
+                    self._retire(entry, "exhausted")
+
+    def _print_status(self) -> None:
+        if self.options.quiet:
+            return
+        done = [e for e in self.entries if e.status != "running"]
+        matched = sum(1 for e in done if e.status == "matched")
+        iterations = sum(e.iterations for e in self.entries)
+        self.printer.progress(
+            f"batch: {len(done)} done ({matched} matched), "
+            f"{len(self._active)} running, {iterations} iterations"
+        )
+
+    def run(self) -> List[BatchEntry]:
+        try:
+            while True:
+                if (
+                    self.options.batch_total
+                    and time.monotonic() - self._start >= self.options.batch_total
+                ):
+                    break
+                self._finish_loading()
+                self._start_loading()
+                if not self._active and self._loading is None:
+                    break
+                self._fill_pool()
+                item = self.pool.get_result(timeout=POLL_INTERVAL)
+                while item is not None:
+                    self._handle_result(item)
+                    item = self.pool.get_result(timeout=0)
+                self._check_budgets()
+                self._print_status()
+        except KeyboardInterrupt:
+            print()
+        finally:
+            for entry in self.entries:
+                if entry.status == "running":
+                    entry.status = "interrupted"
+            self.write_summary()
+            self._loader.shutdown(wait=False)
+        self.pool.close()
+        return self.entries
+
+    def write_summary(self) -> None:
+        """Write the state of all functions so far to the summary file,
+        atomically replacing it."""
+        path = self.options.batch_summary
+        summary = {
+            "elapsed": round(time.monotonic() - self._start, 3),
+            "functions": [entry.summary() for entry in self.entries],
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+            f.write("\n")
+        os.replace(tmp_path, path)
+
+
+def run_batch(options: Options) -> List[BatchEntry]:
+    entries = BatchRunner(options).run()
+    matched = sum(1 for e in entries if e.status == "matched")
+    print(f"\n{matched} of {len(entries)} functions matched.")
+    print(f"Wrote summary to {options.batch_summary}.")
+    if not entries:
+        print("No input directories found!", file=sys.stderr)
+    return entries
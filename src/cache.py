@@ -0,0 +1,337 @@
+"""Caches used to avoid redoing compiler and scorer work for candidates that
+have been seen before."""
+from array import array
+import atexit
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Generic, List, Optional, Tuple, TypeVar
+import zlib
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8; workers then go without shared state.
+    shared_memory = None  # type: ignore
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """A mapping with a bounded number of entries, which evicts the least
+    recently used entry when it grows beyond its capacity."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._data: "OrderedDict[K, V]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        # Doesn't count as a use, and is safe to call from other threads.
+        return key in self._data
+
+    def get(self, key: K) -> Optional[V]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+
+
+_TABLE_ARRAYS = ["_keys", "_values", "_referenced", "_hands"]
+
+
+class DigestTable:
+    """Fixed-capacity map from digests (truncated to 64 bits) to integers,
+    stored in flat arrays to keep memory use low and predictable. Entries are
+    grouped into sets of WAYS slots; when a set is full, one of its entries
+    is evicted using the second-chance (CLOCK) algorithm, so recently used
+    entries tend to survive."""
+
+    WAYS = 8
+    # Memory used per entry: key, value and reference bit.
+    BYTES_PER_ENTRY = 17
+
+    def __init__(self, max_bytes: int) -> None:
+        self._num_sets = max(1, max_bytes // (self.BYTES_PER_ENTRY * self.WAYS))
+        size = self._num_sets * self.WAYS
+        # A key of 0 marks an empty slot.
+        self._keys = array("Q", bytes(8 * size))
+        self._values = array("q", bytes(8 * size))
+        self._referenced = array("B", bytes(size))
+        self._hands = array("B", bytes(self._num_sets))
+
+    def __getstate__(self) -> dict:
+        # Permuters get pickled when sent to worker processes, and the tables
+        # are mostly empty at that point. Compress to avoid shipping megabytes
+        # of zeros around.
+        state = self.__dict__.copy()
+        for name in _TABLE_ARRAYS:
+            state[name] = (state[name].typecode, zlib.compress(state[name].tobytes()))
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        for name in _TABLE_ARRAYS:
+            typecode, data = state[name]
+            state[name] = array(typecode, zlib.decompress(data))
+        self.__dict__.update(state)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._keys)
+
+    def _locate(self, digest: bytes) -> Tuple[int, int]:
+        key = int.from_bytes(digest[:8], "little") or 1
+        return key, (key % self._num_sets) * self.WAYS
+
+    def _find(self, key: int, start: int) -> int:
+        try:
+            return start + self._keys[start : start + self.WAYS].index(key)
+        except ValueError:
+            return -1
+
+    def get(self, digest: bytes) -> Optional[int]:
+        key, start = self._locate(digest)
+        ind = self._find(key, start)
+        if ind == -1:
+            return None
+        self._referenced[ind] = 1
+        return self._values[ind]
+
+    def __contains__(self, digest: object) -> bool:
+        if not isinstance(digest, bytes):
+            return False
+        return self.get(digest) is not None
+
+    def put(self, digest: bytes, value: int) -> bool:
+        """Insert or update an entry. Returns True if this evicted another
+        entry."""
+        key, start = self._locate(digest)
+        ind = self._find(key, start)
+        evicted = False
+        if ind == -1:
+            ind = self._find(0, start)
+        if ind == -1:
+            set_index = start // self.WAYS
+            hand = self._hands[set_index]
+            while self._referenced[start + hand]:
+                self._referenced[start + hand] = 0
+                hand = (hand + 1) % self.WAYS
+            ind = start + hand
+            self._hands[set_index] = (hand + 1) % self.WAYS
+            evicted = True
+        self._keys[ind] = key
+        self._values[ind] = value
+        self._referenced[ind] = 1
+        return evicted
+
+
+class SharedState:
+    """Best scores and seen asm hashes for each permuter, kept in a shared
+    memory segment. The parent process writes to it, and local workers read
+    from it without locking, to avoid sending results that the parent would
+    drop anyway. Reads may be stale, which only makes workers send more than
+    needed. Seen hashes are stored in a direct-mapped table, so they can get
+    overwritten by later ones."""
+
+    # Sentinel best score for permuters that have not reported one yet.
+    NO_SCORE = 2**63 - 1
+
+    def __init__(self, num_permuters: int, max_bytes: int) -> None:
+        self._num_permuters = num_permuters
+        self._slots = max(1, max_bytes // (8 * num_permuters))
+        size = 8 * num_permuters * (1 + self._slots)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        # Forked workers inherit this object as is, so compare pids to tell
+        # whether this is the process that created the segment.
+        self._owner_pid: Optional[int] = os.getpid()
+        self._attach()
+        for i in range(num_permuters):
+            self._table[i] = self.NO_SCORE
+
+    def _attach(self) -> None:
+        # Layout: one best score per permuter, followed by each permuter's
+        # table of hashes. A key of 0 marks an empty slot.
+        assert self._shm.buf is not None
+        self._table = self._shm.buf.cast("q")
+        self._closed = False
+        # Ctrl+C and sys.exit skip the normal cleanup. Without this the
+        # segment would leak, and garbage collecting it with the view still
+        # alive would raise BufferError on exit.
+        atexit.register(self.close)
+
+    def __getstate__(self) -> dict:
+        return {
+            "name": self._shm.name,
+            "num_permuters": self._num_permuters,
+            "slots": self._slots,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self._num_permuters = state["num_permuters"]
+        self._slots = state["slots"]
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._owner_pid = None
+        self._attach()
+
+    def _slot(self, perm_index: int, digest: bytes) -> Tuple[int, int]:
+        key = int.from_bytes(digest[:8], "little", signed=True) or 1
+        ind = self._num_permuters + perm_index * self._slots
+        return key, ind + key % self._slots
+
+    def best_score(self, perm_index: int) -> int:
+        return self._table[perm_index]
+
+    def set_best_score(self, perm_index: int, score: int) -> None:
+        self._table[perm_index] = score
+
+    def seen(self, perm_index: int, digest: bytes) -> bool:
+        key, ind = self._slot(perm_index, digest)
+        return self._table[ind] == key
+
+    def add_seen(self, perm_index: int, digest: bytes) -> None:
+        key, ind = self._slot(perm_index, digest)
+        self._table[ind] = key
+
+    def close(self) -> None:
+        """Detach from the segment, and remove it if it was created here."""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._table.release()
+        self._shm.close()
+        if self._owner_pid == os.getpid():
+            self._shm.unlink()
+
+
+def cache_namespace(filenames: List[str], settings: str) -> bytes:
+    """Digest of everything besides the source that affects a candidate's
+    score, so that disk cache entries are never reused across different
+    compilers, targets or scorer settings."""
+    h = hashlib.sha256(settings.encode("utf-8"))
+    for fname in filenames:
+        with open(fname, "rb") as f:
+            data = f.read()
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.digest()
+
+
+class DiskCache:
+    """Persistent cache from source hashes to (score, hash) pairs, backed by
+    an sqlite database. It may be shared between worker processes, and
+    between runs of the permuter. When the database grows beyond max_bytes,
+    the least recently used quarter of the entries is dropped."""
+
+    # How many insertions to do between checks of the database size.
+    EVICTION_INTERVAL = 256
+
+    # Hits only update an entry's last-used time once it is this old, in
+    # seconds, so that lookups don't need to take the write lock. Eviction
+    # only needs a rough idea of what is stale.
+    TOUCH_INTERVAL = 3600.0
+
+    # How long to wait for another process's lock, in seconds. Workers would
+    # rather recompute a candidate than wait on each other.
+    BUSY_TIMEOUT = 0.1
+
+    def __init__(self, path: str, *, namespace: bytes, max_bytes: int) -> None:
+        self.path = path
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._puts = 0
+        # Create the database up front, so that configuration errors show up
+        # immediately rather than inside a worker.
+        self._get_conn()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_conn_pid"] = None
+        return state
+
+    def _get_conn(self) -> sqlite3.Connection:
+        # sqlite connections must not be carried across fork(), so each
+        # worker opens its own.
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "key BLOB PRIMARY KEY, score INTEGER, hash TEXT, last_used REAL"
+                ") WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used)"
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _key(self, source_hash: bytes) -> bytes:
+        return hashlib.sha256(self.namespace + source_hash).digest()
+
+    def get(self, source_hash: bytes) -> Optional[Tuple[int, str]]:
+        key = self._key(source_hash)
+        try:
+            conn = self._get_conn()
+            row = conn.execute(
+                "SELECT score, hash, last_used FROM scores WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            # The cache is only an optimization; treat errors (e.g. timeouts
+            # from lock contention) as misses.
+            return None
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[2] > self.TOUCH_INTERVAL:
+            try:
+                conn.execute(
+                    "UPDATE scores SET last_used = ? WHERE key = ?", (now, key)
+                )
+            except sqlite3.Error:
+                pass
+        return row[0], row[1]
+
+    def put(self, source_hash: bytes, score: int, hash: str) -> None:
+        try:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+                (self._key(source_hash), score, hash, time.time()),
+            )
+            self._puts += 1
+            if self._puts % self.EVICTION_INTERVAL == 0:
+                self._maybe_evict(conn)
+        except sqlite3.Error:
+            pass
+
+    def _maybe_evict(self, conn: sqlite3.Connection) -> None:
+        (page_size,) = conn.execute("PRAGMA page_size").fetchone()
+        (page_count,) = conn.execute("PRAGMA page_count").fetchone()
+        (free_pages,) = conn.execute("PRAGMA freelist_count").fetchone()
+        if (page_count - free_pages) * page_size <= self.max_bytes:
+            return
+        # Freed pages get reused by later insertions, so the file stays
+        # roughly within bounds without needing a VACUUM.
+        conn.execute(
+            "DELETE FROM scores WHERE key IN (SELECT key FROM scores "
+            "ORDER BY last_used LIMIT (SELECT COUNT(*) / 4 FROM scores))"
+        )
@@ -1,20 +1,37 @@
 import copy
 from dataclasses import dataclass, field
 import functools
-from typing import Mapping, Optional, Tuple
+from typing import Dict, List, Mapping, Optional, Tuple, Union
 
 from pycparser import c_ast as ca
 
+from .adaptive import PassOutcome
 from .compiler import Compiler
 from .randomizer import Randomizer
 from .scorer import Scorer
 from .perm.perm import EvalState
 from .perm.ast import apply_ast_perms
 from .helpers import try_remove
-from .profiler import Profiler
+from .profiler import Profiler, Timer
 from . import ast_util
 
 
+# Top-level nodes of a shared AST, by id, along with their generated code and
+# their index within the AST.
+SharedChunks = Dict[int, Tuple[ca.Node, ast_util.SourceChunk, int]]
+
+
+@dataclass
+class CandidateSnapshot:
+    """A randomized candidate in a form that can be sent between processes:
+    the PERM macro seed that produces the source it was created from, and its
+    top-level nodes. Those that are unchanged from that source are given as
+    indices into its AST."""
+
+    seed: int
+    ext: List[Union[int, "ca.ExternalDeclaration"]]
+
+
 @dataclass
 class CandidateResult:
     """Represents the result of scoring a candidate, and is sent from child to
@@ -24,6 +41,12 @@ class CandidateResult:
     hash: Optional[str]
     source: Optional[str]
     profiler: Optional[Profiler] = None
+    # With --adaptive-weights, the randomization pass that produced the
+    # candidate, and how that turned out.
+    pass_outcome: Optional[Tuple[str, PassOutcome]] = None
+    # With --search=population, the candidate itself, if it might make it into
+    # the population.
+    snapshot: Optional[CandidateSnapshot] = None
 
 
 @dataclass
@@ -38,6 +61,7 @@ class Candidate:
     fn_name: str
     rng_seed: int
     randomizer: Randomizer
+    shared_chunks: SharedChunks = field(default_factory=dict)
     score_value: Optional[int] = field(init=False, default=None)
     score_hash: Optional[str] = field(init=False, default=None)
     _cache_source: Optional[str] = field(init=False, default=None)
@@ -46,11 +70,19 @@ class Candidate:
     @functools.lru_cache(maxsize=16)
     def _cached_shared_ast(
         source: str, fn_name: str
-    ) -> Tuple[ca.FuncDef, int, ca.FileAST]:
+    ) -> Tuple[ca.FuncDef, int, ca.FileAST, SharedChunks]:
         ast = ast_util.parse_c(source)
         orig_fn, fn_index = ast_util.extract_fn(ast, fn_name)
         ast_util.normalize_ast(orig_fn, ast)
-        return orig_fn, fn_index, ast
+        # The context outside of the target function is never mutated, only
+        # replaced, so its generated code can be reused across candidates.
+        # The nodes are stored alongside to keep them alive, so ids stay unique.
+        shared_chunks: SharedChunks = {
+            id(node): (node, ast_util.ext_to_chunk(node), i)
+            for i, node in enumerate(ast.ext)
+            if node is not orig_fn
+        }
+        return orig_fn, fn_index, ast, shared_chunks
 
     @staticmethod
     def from_source(
@@ -59,42 +91,152 @@ class Candidate:
         fn_name: str,
         randomization_weights: Mapping[str, float],
         rng_seed: int,
+        *,
+        snapshot: Optional[CandidateSnapshot] = None,
+        profiler: Optional[Profiler] = None,
     ) -> "Candidate":
+        """Create a candidate from C source, or, if a snapshot is given, recreate
+        the candidate it was taken of. The source should then be the one
+        produced by the snapshot's seed."""
         # Use the same AST for all instances of the same original source, but
         # with the target function deeply copied. Since we never change the
         # AST outside of the target function, this is fine, and it saves us
-        # performance (deepcopy is really slow).
-        orig_fn, fn_index, ast = Candidate._cached_shared_ast(source, fn_name)
+        # performance (copying is slow, even with clone_ast over deepcopy).
+        orig_fn, fn_index, ast, shared_chunks = Candidate._cached_shared_ast(
+            source, fn_name
+        )
+        shared_ext = ast.ext
         ast = copy.copy(ast)
-        ast.ext = copy.copy(ast.ext)
-        fn_copy = copy.deepcopy(orig_fn)
-        ast.ext[fn_index] = fn_copy
-        apply_ast_perms(fn_copy, eval_state)
+        timer = Timer()
+        if snapshot is None:
+            ast.ext = copy.copy(shared_ext)
+            fn_copy = ast_util.clone_ast(orig_fn)
+            assert isinstance(fn_copy, ca.FuncDef)
+            if profiler is not None:
+                profiler.add_stat(Profiler.StatType.deepcopy, timer.tick())
+            ast.ext[fn_index] = fn_copy
+            apply_ast_perms(fn_copy, eval_state)
+        else:
+            # Randomization may also have inserted or replaced nodes outside
+            # of the function. Those are never mutated, so only the function
+            # needs copying.
+            ast.ext = [
+                shared_ext[item] if isinstance(item, int) else item
+                for item in snapshot.ext
+            ]
+            fn_index = next(
+                i
+                for i, node in enumerate(ast.ext)
+                if isinstance(node, ca.FuncDef) and node.decl.name == fn_name
+            )
+            fn_copy = ast_util.clone_ast(ast.ext[fn_index])
+            assert isinstance(fn_copy, ca.FuncDef)
+            ast.ext[fn_index] = fn_copy
+            if profiler is not None:
+                profiler.add_stat(Profiler.StatType.deepcopy, timer.tick())
         return Candidate(
             ast=ast,
             fn_name=fn_name,
             rng_seed=rng_seed,
             randomizer=Randomizer(randomization_weights, rng_seed),
+            shared_chunks=shared_chunks,
+        )
+
+    def snapshot(self, seed: int, *, copy_fn: bool = True) -> CandidateSnapshot:
+        """Take a snapshot of the candidate, created from the source for the
+        given PERM macro seed. The function only needs to be copied if the
+        candidate is going to be randomized further."""
+        ext: List[Union[int, "ca.ExternalDeclaration"]] = []
+        for node in self.ast.ext:
+            shared = self.shared_chunks.get(id(node))
+            if shared is not None:
+                ext.append(shared[2])
+            elif (
+                copy_fn
+                and isinstance(node, ca.FuncDef)
+                and node.decl.name == self.fn_name
+            ):
+                fn_copy = ast_util.clone_ast(node)
+                assert isinstance(fn_copy, ca.FuncDef)
+                ext.append(fn_copy)
+            else:
+                ext.append(node)
+        return CandidateSnapshot(seed=seed, ext=ext)
+
+    def clone(
+        self,
+        randomization_weights: Mapping[str, float],
+        rng_seed: int,
+        profiler: Optional[Profiler] = None,
+    ) -> "Candidate":
+        """Create a copy of the candidate that can be randomized independently
+        of it. As with snapshots, only the target function needs copying."""
+        timer = Timer()
+        ast = copy.copy(self.ast)
+        ast.ext = copy.copy(self.ast.ext)
+        for i, node in enumerate(ast.ext):
+            if isinstance(node, ca.FuncDef) and node.decl.name == self.fn_name:
+                fn_copy = ast_util.clone_ast(node)
+                assert isinstance(fn_copy, ca.FuncDef)
+                ast.ext[i] = fn_copy
+        if profiler is not None:
+            profiler.add_stat(Profiler.StatType.deepcopy, timer.tick())
+        return Candidate(
+            ast=ast,
+            fn_name=self.fn_name,
+            rng_seed=rng_seed,
+            randomizer=Randomizer(randomization_weights, rng_seed),
+            shared_chunks=self.shared_chunks,
         )
 
-    def randomize_ast(self) -> None:
-        self.randomizer.randomize(self.ast, self.fn_name)
+    def randomize_ast(self, profiler: Optional[Profiler] = None) -> str:
+        """Apply a random randomization pass, returning its name."""
+        timer = Timer()
+        pass_name = self.randomizer.randomize(self.ast, self.fn_name, profiler)
+        if profiler is not None:
+            profiler.add_stat(Profiler.StatType.randomize, timer.tick())
         self._cache_source = None
+        return pass_name
 
-    def get_source(self) -> str:
+    def get_source(self, profiler: Optional[Profiler] = None) -> str:
         if self._cache_source is None:
-            self._cache_source = ast_util.to_c(self.ast)
+            # Only generate code for the parts of the AST that differ from the
+            # shared one, falling back to doing it all at once if pragmas get
+            # in the way.
+            timer = Timer()
+            chunks = []
+            for node in self.ast.ext:
+                shared = self.shared_chunks.get(id(node))
+                if shared is not None:
+                    chunks.append(shared[1])
+                else:
+                    chunks.append(ast_util.ext_to_chunk(node))
+            to_c_time = timer.tick()
+            source = ast_util.join_chunks(chunks)
+            pragmas_time = timer.tick()
+            if source is None:
+                source = ast_util.to_c(self.ast)
+                to_c_time += timer.tick()
+            if profiler is not None:
+                profiler.add_stat(Profiler.StatType.to_c, to_c_time)
+                profiler.add_stat(Profiler.StatType.process_pragmas, pragmas_time)
+            self._cache_source = source
         return self._cache_source
 
     def compile(self, compiler: Compiler, show_errors: bool = False) -> Optional[str]:
         source: str = self.get_source()
         return compiler.compile(source, show_errors=show_errors)
 
-    def score(self, scorer: Scorer, o_file: Optional[str]) -> CandidateResult:
+    def score(
+        self,
+        scorer: Scorer,
+        o_file: Optional[str],
+        profiler: Optional[Profiler] = None,
+    ) -> CandidateResult:
         self.score_value = None
         self.score_hash = None
         try:
-            self.score_value, self.score_hash = scorer.score(o_file)
+            self.score_value, self.score_hash = scorer.score(o_file, profiler)
         finally:
             if o_file:
                 try_remove(o_file)
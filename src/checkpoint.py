@@ -0,0 +1,140 @@
+"""Saving and restoring the state of a permuter run, so that it can be resumed
+after being interrupted without redoing or re-outputting earlier work."""
+from collections import deque
+from dataclasses import dataclass
+import os
+import pickle
+from typing import Deque, Dict, Iterable, List, Optional, Set
+
+from .adaptive import PassBandit
+from .cache import DigestTable
+from .error import CheckpointMismatch
+from .search import Population
+
+# File name for checkpoints, written to each input directory.
+CHECKPOINT_FILE = "permuter_checkpoint.pkl"
+
+# Default number of seconds between checkpoints.
+DEFAULT_CHECKPOINT_INTERVAL = 600.0
+
+# Bumped whenever the format changes, to make old checkpoints be ignored.
+CHECKPOINT_VERSION = 3
+
+# Upper bound on the number of seeds handed out to permuter@home that are
+# remembered for replaying on resume. Results that never come back (e.g.
+# because a server went away) would otherwise make the list grow forever.
+MAX_UNANSWERED_SEEDS = 100_000
+
+
+@dataclass
+class Checkpoint:
+    version: int
+    # Digest of the input files and scorer settings; see cache_namespace.
+    namespace: bytes
+    best_score: int
+    hashes: Set[bytes]
+    score_for_source: DigestTable
+    # The key that determines the order of seeds, and the number of seeds at
+    # the start of that order that have been fully evaluated. Only meaningful
+    # for permuters that don't randomize.
+    seed_key: int
+    seed_position: int
+    # Seeds handed out to permuter@home after the ones counted by
+    # seed_position, that might not have been evaluated, and are evaluated
+    # again on resume.
+    unanswered_seeds: List[int]
+    population: Optional[Population]
+    bandit: Optional[PassBandit]
+
+
+class SeedProgress:
+    """Tracks how far into a permuter's order of seeds evaluation has come.
+    The order is split into interleaved shards, each evaluated in order by its
+    own worker, so the position to resume from is that of the earliest seed
+    that hasn't finished in any shard.
+
+    Seeds handed out to permuter@home come back in no particular order, and
+    without saying which seed they were for. They are counted as done when
+    handed out, but kept in a list until as many results have come back as
+    seeds were handed out, so that a checkpoint can include the ones that
+    might still be missing."""
+
+    def __init__(
+        self, position: int, num_shards: int, unanswered: Iterable[int] = ()
+    ) -> None:
+        self._start = position
+        self._num_shards = num_shards
+        self._done = [0] * num_shards
+        self._replay = list(unanswered)
+        self._unanswered: Deque[int] = deque(maxlen=MAX_UNANSWERED_SEEDS)
+        self._num_unanswered = 0
+
+    def shard_start(self, shard: int) -> int:
+        """Return how many seeds of a shard to skip when starting out."""
+        return max(self._start - shard + self._num_shards - 1, 0) // self._num_shards
+
+    def finish(self, shard: int, count: int = 1) -> None:
+        self._done[shard] += count
+
+    def take_replay(self) -> Optional[int]:
+        """Return a seed that was handed out to permuter@home before resuming
+        but might not have been evaluated, to hand out again, or None if there
+        are no more."""
+        return self._replay.pop() if self._replay else None
+
+    def hand_out(self, shard: int, seed: int, *, replayed: bool = False) -> None:
+        """Record that a seed was handed out to permuter@home."""
+        if not replayed:
+            self.finish(shard)
+        self._unanswered.append(seed)
+        self._num_unanswered += 1
+
+    def answer(self) -> None:
+        """Record that a result came back from permuter@home."""
+        self._num_unanswered = max(self._num_unanswered - 1, 0)
+        if self._num_unanswered == 0:
+            self._unanswered.clear()
+
+    def unanswered(self) -> List[int]:
+        """Return the seeds to save for replaying on resume."""
+        return self._replay + list(self._unanswered)
+
+    def position(self) -> int:
+        return min(
+            (self.shard_start(shard) + done) * self._num_shards + shard
+            for shard, done in enumerate(self._done)
+        )
+
+
+def save_checkpoint(path: str, checkpoint: Checkpoint) -> None:
+    """Write a checkpoint, atomically replacing any earlier one."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str, namespace: bytes) -> Optional[Checkpoint]:
+    """Read a checkpoint, returning None if there isn't one. Raises
+    CheckpointMismatch if it was made for different inputs or settings, or by
+    a different version of the permuter."""
+    try:
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        raise CheckpointMismatch(f"unable to read {path}: {e}")
+    if (
+        not isinstance(checkpoint, Checkpoint)
+        or checkpoint.version != CHECKPOINT_VERSION
+    ):
+        raise CheckpointMismatch(f"{path} is from a different permuter version")
+    if checkpoint.namespace != namespace:
+        raise CheckpointMismatch(
+            f"{path} was made for a different base.c, target.o, compile.sh "
+            "or scoring options"
+        )
+    return checkpoint
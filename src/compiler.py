@@ -1,18 +1,150 @@
 from typing import Optional
+import os
+import select
+import signal
+import struct
+import sys
 import tempfile
+import threading
+import time
 import subprocess
 import shutil
 
 from .helpers import try_remove
 
+# Compile server protocol, see USAGE.md. Requests are a big-endian u32 length
+# followed by that many bytes of C source; responses are a status byte (0 on
+# success), a big-endian u32 length, and either the object file or the
+# compiler's error output.
+_SERVER_REQUEST = struct.Struct(">I")
+_SERVER_RESPONSE = struct.Struct(">BI")
+
+# How long to wait for the compile server to answer a request, in seconds,
+# before giving up on it. Generous, since compiles under emulation can be slow.
+SERVER_TIMEOUT = 60.0
+
+
+class _CompileServerDied(Exception):
+    pass
+
+
+def _read_exact(fd: int, n: int, deadline: float) -> bytes:
+    """Read n bytes from a pipe, unless it is closed first or the deadline
+    (a time.monotonic() value) passes, in which case the server is assumed to
+    be dead or hung."""
+    ret = b""
+    while len(ret) < n:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            raise _CompileServerDied
+        chunk = os.read(fd, n - len(ret))
+        if not chunk:
+            raise _CompileServerDied
+        ret += chunk
+    return ret
+
 
 class Compiler:
     def __init__(
-        self, compile_cmd: str, *, show_errors: bool, debug_mode: bool
+        self,
+        compile_cmd: str,
+        *,
+        show_errors: bool,
+        debug_mode: bool,
+        server_cmd: Optional[str] = None,
+        server_timeout: float = SERVER_TIMEOUT,
     ) -> None:
         self.compile_cmd = compile_cmd
         self.show_errors = show_errors
         self.debug_mode = debug_mode
+        self.server_cmd = server_cmd
+        self.server_timeout = server_timeout
+        self._server: "Optional[subprocess.Popen[bytes]]" = None
+        self._server_pid: Optional[int] = None
+        self._server_failed = False
+        # With --pipeline, compiles happen in several threads, which take
+        # turns using the server.
+        self._server_lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Server processes belong to the process that started them, and can't
+        # be pickled anyway.
+        state = self.__dict__.copy()
+        state["_server"] = None
+        state["_server_pid"] = None
+        del state["_server_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._server_lock = threading.Lock()
+
+    def _get_server(self) -> "subprocess.Popen[bytes]":
+        # Each process (in particular, each forked worker) keeps its own
+        # server, since they can't share a pipe.
+        if self._server is None or self._server_pid != os.getpid():
+            assert self.server_cmd is not None
+            self._server = subprocess.Popen(
+                self.server_cmd,
+                shell=True,
+                cwd=os.path.dirname(self.compile_cmd) or None,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=None if self.show_errors else subprocess.DEVNULL,
+                # In a process group of its own, so that the shell and
+                # anything it started can be killed together.
+                start_new_session=True,
+            )
+            self._server_pid = os.getpid()
+        return self._server
+
+    def _stop_server(self) -> None:
+        server = self._server
+        self._server = None
+        if server is not None and self._server_pid == os.getpid():
+            try:
+                os.killpg(server.pid, signal.SIGKILL)
+                server.wait()
+            except OSError:
+                pass
+
+    def _compile_with_server(self, source: str, o_name: str, show_errors: bool) -> bool:
+        server = self._get_server()
+        assert server.stdin is not None and server.stdout is not None
+        data = source.encode("utf-8")
+        # Read from the file descriptor directly rather than through
+        # server.stdout, whose buffering would get in the way of select.
+        fd = server.stdout.fileno()
+        try:
+            server.stdin.write(_SERVER_REQUEST.pack(len(data)) + data)
+            server.stdin.flush()
+            deadline = time.monotonic() + self.server_timeout
+            status, length = _SERVER_RESPONSE.unpack(
+                _read_exact(fd, _SERVER_RESPONSE.size, deadline)
+            )
+            payload = _read_exact(fd, length, deadline)
+        except (OSError, ValueError):
+            raise _CompileServerDied from None
+
+        if status != 0:
+            if show_errors:
+                sys.stderr.write(payload.decode("utf-8", "replace"))
+            return False
+        with open(o_name, "wb") as f:
+            f.write(payload)
+        return True
+
+    def _compile_with_script(self, c_name: str, o_name: str, show_errors: bool) -> bool:
+        try:
+            stderr = 2 if show_errors else subprocess.DEVNULL
+            subprocess.check_call(
+                [self.compile_cmd, c_name, "-o", o_name],
+                stdout=stderr,
+                stderr=stderr,
+            )
+            return True
+        except subprocess.CalledProcessError:
+            return False
 
     def compile(self, source: str, *, show_errors: bool = False) -> Optional[str]:
         """Try to compile a piece of C code. Returns the filename of the resulting .o
@@ -39,17 +171,22 @@ class Compiler:
             o_name = f2.name
 
         try:
-            stderr = 2 if show_errors else subprocess.DEVNULL
-            subprocess.check_call(
-                [self.compile_cmd, c_name, "-o", o_name],
-                stdout=stderr,
-                stderr=stderr,
-            )
-        except subprocess.CalledProcessError:
-            if not show_errors:
-                try_remove(c_name)
-            try_remove(o_name)
-            return None
+            success: Optional[bool] = None
+            if self.server_cmd is not None and not self._server_failed:
+                with self._server_lock:
+                    try:
+                        success = self._compile_with_server(source, o_name, show_errors)
+                    except _CompileServerDied:
+                        # Fall back to compile.sh for the rest of this process.
+                        print(
+                            "Compile server died or stopped responding; "
+                            "falling back to compile.sh.",
+                            file=sys.stderr,
+                        )
+                        self._server_failed = True
+                        self._stop_server()
+            if success is None:
+                success = self._compile_with_script(c_name, o_name, show_errors)
         except KeyboardInterrupt:
             # If Ctrl+C happens during this call, make a best effort in
             # removing the .c and .o files. This is totally racy, but oh well...
@@ -57,6 +194,12 @@ class Compiler:
             try_remove(o_name)
             raise
 
+        if not success:
+            if not show_errors:
+                try_remove(c_name)
+            try_remove(o_name)
+            return None
+
         if self.debug_mode:
             debug_filepath = "./debug_compiled_object.o"
             print(
@@ -0,0 +1,553 @@
+"""A long-lived permuter process, which keeps a pool of workers warm and runs
+jobs submitted to it over a local UNIX socket. See ./daemon.py -h.
+
+The protocol is newline-delimited JSON: the client sends a single request
+object, and the daemon answers with one or more objects, the last of which
+either has "ok" or "error" set, or is a "done" event."""
+import argparse
+from dataclasses import dataclass, field
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+from .candidate import CandidateResult
+from .error import CandidateConstructionFailure
+from .helpers import json_array, json_prop, plural
+from .main import (
+    Options,
+    create_permuter,
+    cycle_seeds,
+    shard_seed_iterators,
+    write_candidate,
+)
+from .permuter import EvalError, Permuter
+from .pool import PoolResult, WorkerPool
+from .printer import Printer
+from .schedule import SeedScheduler
+
+DEFAULT_SOCKET = os.path.expanduser("~/.decomp-permuter.sock")
+
+# How long the dispatcher waits for results before checking for new jobs.
+POLL_INTERVAL = 0.05
+
+# How often progress is sent to clients watching a job, in seconds.
+PROGRESS_INTERVAL = 1.0
+
+# Options that can be set per job, with their JSON types.
+JOB_OPTIONS: Dict[str, type] = {
+    "better_only": bool,
+    "best_only": bool,
+    "stop_on_zero": bool,
+    "keep_prob": float,
+    "score_threshold": int,
+    "stack_differences": bool,
+    "algorithm": str,
+    "no_context_output": bool,
+}
+
+Event = Dict[str, object]
+
+
+@dataclass
+class Job:
+    id: int
+    options: Options
+    permuters: List[Permuter]
+    seeds: Iterator[Tuple[int, int]]
+    # Index in the daemon's SeedScheduler.
+    sched_index: int
+    # "running", "paused", "done" or "cancelled".
+    state: str = "running"
+    # Ids of the permuters in the worker pool, once they have been sent there.
+    perm_ids: Optional[List[int]] = None
+    in_pool: bool = False
+    seeds_exhausted: bool = False
+    iterations: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    watchers: "List[queue.Queue[Event]]" = field(default_factory=list)
+    # What info() says about each function, once the job is finished and its
+    # permuters have been released.
+    functions: Optional[List[Event]] = None
+
+    def is_finished(self) -> bool:
+        return self.state in ("done", "cancelled")
+
+    def release(self) -> None:
+        """Drop the permuters of a finished job, which hold on to ASTs, caches
+        and scorer state, keeping only what info() needs."""
+        self.functions = self._functions()
+        self.permuters = []
+        self.seeds = iter(())
+
+    def _functions(self) -> List[Event]:
+        if self.functions is not None:
+            return self.functions
+        return [
+            {
+                "name": p.fn_name,
+                "dir": p.dir,
+                "base_score": p.base_score,
+                "best_score": p.best_score,
+            }
+            for p in self.permuters
+        ]
+
+    def info(self) -> Event:
+        return {
+            "job": self.id,
+            "state": self.state,
+            "iterations": self.iterations,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "functions": self._functions(),
+        }
+
+
+class Daemon:
+    """Job bookkeeping. Requests are handled in one thread per connection,
+    while run() hands out seeds and processes results; a lock protects the
+    state shared between them. The worker pool is only touched by run()."""
+
+    def __init__(self, num_workers: int) -> None:
+        self.pool = WorkerPool(num_workers)
+        # Jobs get equal shares of worker time, adjusted by priority.
+        self.scheduler = SeedScheduler("time", [])
+        self.jobs: Dict[int, Job] = {}
+        self._perm_jobs: Dict[int, Tuple[Job, int]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_progress = time.monotonic()
+
+    def _active(self) -> List[Job]:
+        return [
+            job
+            for job in self.jobs.values()
+            if job.state == "running" and not job.seeds_exhausted
+        ]
+
+    def _emit(self, job: Job, event: Event) -> None:
+        event = {"event": event["event"], "job": job.id, **event}
+        for watcher in job.watchers:
+            watcher.put(event)
+
+    def _finish(self, job: Job, state: str) -> None:
+        job.state = state
+        job.release()
+        self._emit(job, {"event": "done", **job.info()})
+        job.watchers = []
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                self._sync_pool()
+                self._fill_pool()
+            result = self.pool.get_result(timeout=POLL_INTERVAL)
+            while result is not None:
+                with self._lock:
+                    self._handle_result(result)
+                result = self.pool.get_result(timeout=0)
+            with self._lock:
+                self._send_progress()
+        self.pool.close()
+
+    def _sync_pool(self) -> None:
+        for job in self.jobs.values():
+            if job.perm_ids is None and not job.is_finished():
+                job.perm_ids = []
+                for permuter in job.permuters:
+                    perm_id = self.pool.add_permuter(permuter)
+                    self._perm_jobs[perm_id] = (job, len(job.perm_ids))
+                    job.perm_ids.append(perm_id)
+                job.in_pool = True
+            if job.in_pool and job.perm_ids is not None:
+                outstanding = sum(self.pool.outstanding(i) for i in job.perm_ids)
+                if job.seeds_exhausted and not outstanding and not job.is_finished():
+                    self._finish(job, "done")
+                if job.is_finished():
+                    for perm_id in job.perm_ids:
+                        self.pool.remove_permuter(perm_id)
+                    job.in_pool = False
+
+    def _fill_pool(self) -> None:
+        while self.pool.has_room():
+            active = {job.sched_index: job for job in self._active() if job.in_pool}
+            if not active:
+                break
+            job = active[self.scheduler.pick(list(active))]
+            item = next(job.seeds, None)
+            if item is None:
+                job.seeds_exhausted = True
+                continue
+            perm_index, seed = item
+            assert job.perm_ids is not None
+            self.pool.submit(job.perm_ids[perm_index], seed)
+
+    def _handle_result(self, item: PoolResult) -> None:
+        job, perm_index = self._perm_jobs[item.perm_id]
+        if job.is_finished():
+            return
+        permuter = job.permuters[perm_index]
+        result = item.result
+        former_best = permuter.best_score
+        job.seconds += item.seconds
+
+        if isinstance(result, EvalError):
+            self._emit(
+                job,
+                {
+                    "event": "error",
+                    "function": permuter.fn_name,
+                    "message": result.exc_str or "internal permuter failure",
+                },
+            )
+            self.scheduler.record(job.sched_index, item.seconds, False)
+            return
+
+        job.iterations += 1
+        if result.score == permuter.scorer.PENALTY_INF:
+            job.errors += 1
+        self.scheduler.record(job.sched_index, item.seconds, result.score < former_best)
+        if not permuter.should_output(result):
+            return
+
+        permuter.record_result(result)
+        if result.score < former_best:
+            kind = "best"
+        elif result.score == former_best:
+            kind = "tie"
+        elif result.score < permuter.base_score:
+            kind = "better"
+        else:
+            kind = "different"
+        output_dir = write_candidate(permuter, result, job.options.no_context_output)
+        self._emit(
+            job,
+            {
+                "event": "result",
+                "kind": kind,
+                "function": permuter.fn_name,
+                "score": result.score,
+                "base_score": permuter.base_score,
+                "output_dir": output_dir,
+            },
+        )
+        if result.score == 0 and job.options.stop_on_zero:
+            self._finish(job, "done")
+
+    def _send_progress(self) -> None:
+        if time.monotonic() - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = time.monotonic()
+        for job in self.jobs.values():
+            if job.watchers:
+                self._emit(job, {"event": "progress", **job.info()})
+
+    def submit(self, request: Event) -> Job:
+        directories = json_array(json_prop(request, "directories", list), str)
+        if not directories:
+            raise ValueError("no directories given")
+        priority = json_prop(request, "priority", float, 1.0)
+        if priority <= 0:
+            raise ValueError("priority must be positive")
+        job_options = json_prop(request, "options", dict, {})
+        kwargs: Dict[str, Any] = {}
+        for name, t in JOB_OPTIONS.items():
+            if job_options.get(name) is not None:
+                kwargs[name] = json_prop(job_options, name, t)
+        options = Options(directories=directories, **kwargs)
+
+        # Setting up permuters compiles and scores the base source, which is
+        # done here in the connection's thread so as not to hold up others.
+        permuters = [create_permuter(options, d)[0] for d in directories]
+        seeds = cycle_seeds(shard_seed_iterators(permuters, [0] * len(permuters), 0, 1))
+        with self._lock:
+            active = [job.sched_index for job in self._active()]
+            job = Job(
+                id=len(self.jobs) + 1,
+                options=options,
+                permuters=permuters,
+                seeds=iter(seeds),
+                sched_index=self.scheduler.add(priority, active),
+            )
+            self.jobs[job.id] = job
+        return job
+
+    def _get_job(self, request: Event) -> Job:
+        job_id = json_prop(request, "job", int)
+        if job_id not in self.jobs:
+            raise ValueError(f"no job {job_id}")
+        return self.jobs[job_id]
+
+    def control(self, request: Event) -> Event:
+        """Handle a request that doesn't stream anything back."""
+        cmd = json_prop(request, "cmd", str)
+        with self._lock:
+            if cmd == "list":
+                return {"ok": True, "jobs": [job.info() for job in self.jobs.values()]}
+            if cmd == "shutdown":
+                self.stop()
+                return {"ok": True}
+            job = self._get_job(request)
+            if job.is_finished():
+                raise ValueError(f"job {job.id} is already {job.state}")
+            if cmd == "pause":
+                job.state = "paused"
+            elif cmd == "resume":
+                if job.state == "paused":
+                    active = [j.sched_index for j in self._active()]
+                    self.scheduler.rejoin(job.sched_index, active)
+                job.state = "running"
+            elif cmd == "cancel":
+                self._finish(job, "cancelled")
+            else:
+                raise ValueError(f"unknown command {cmd}")
+            return {"ok": True, **job.info()}
+
+    def watch(self, request: Event, send: Callable[[Event], None]) -> None:
+        """Stream a job's events, until it is finished."""
+        watcher: "queue.Queue[Event]" = queue.Queue()
+        with self._lock:
+            job = self._get_job(request)
+            if job.is_finished():
+                send({"event": "done", **job.info()})
+                return
+            job.watchers.append(watcher)
+        try:
+            while True:
+                event = watcher.get()
+                send(event)
+                if event["event"] == "done":
+                    break
+        finally:
+            with self._lock:
+                if watcher in job.watchers:
+                    job.watchers.remove(watcher)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: "_Server"
+
+    def send(self, obj: Event) -> None:
+        self.wfile.write(json.dumps(obj).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        daemon = self.server.daemon
+        try:
+            request = json.loads(self.rfile.readline())
+            cmd = json_prop(request, "cmd", str)
+            if cmd == "submit":
+                job = daemon.submit(request)
+                self.send({"ok": True, "job": job.id})
+                if json_prop(request, "watch", bool, False):
+                    daemon.watch({"job": job.id}, self.send)
+            elif cmd == "watch":
+                daemon.watch(request, self.send)
+            else:
+                self.send(daemon.control(request))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except CandidateConstructionFailure as e:
+            self.send({"error": e.message})
+        except Exception as e:
+            self.send({"error": str(e) or type(e).__name__})
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: Daemon) -> None:
+        super().__init__(path, _RequestHandler)
+        self.daemon = daemon
+
+
+def request(socket_path: str, obj: Event) -> Iterator[Event]:
+    """Send a request to a running daemon, and yield its responses."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(obj).encode("utf-8") + b"\n")
+        f: IO[bytes] = sock.makefile("rb")
+        for line in f:
+            yield json.loads(line)
+
+
+def serve(socket_path: str, num_workers: int) -> None:
+    try:
+        list(request(socket_path, {"cmd": "list"}))
+        print(f"A daemon is already listening on {socket_path}.", file=sys.stderr)
+        sys.exit(1)
+    except OSError:
+        pass
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+
+    daemon = Daemon(num_workers)
+    server = _Server(socket_path, daemon)
+    os.chmod(socket_path, 0o600)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    print(f"Listening on {socket_path} with {plural(num_workers, 'worker')}.")
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.shutdown()
+        server.server_close()
+        os.unlink(socket_path)
+    print("Exiting.")
+
+
+def _format_job(info: Event) -> str:
+    functions = info["functions"]
+    assert isinstance(functions, list)
+    scores = ", ".join(
+        f"{f['name']} {f['best_score']} (base {f['base_score']})" for f in functions
+    )
+    seconds = info["seconds"]
+    assert isinstance(seconds, float)
+    return (
+        f"job {info['job']} [{info['state']}] {scores}, "
+        f"{info['iterations']} iterations, {round(seconds)}s of worker time"
+    )
+
+
+def _print_events(events: Iterator[Event]) -> None:
+    printer = Printer()
+    for event in events:
+        if "error" in event:
+            printer.print(f"Error: {event['error']}", None, None)
+            sys.exit(1)
+        kind = event.get("event")
+        if kind is None:
+            if "functions" in event:
+                printer.print(_format_job(event), None, None)
+            elif "job" in event:
+                printer.print(f"Submitted job {event['job']}.", None, None)
+            continue
+        prefix = f"[job {event['job']}] "
+        if kind == "progress":
+            printer.progress(prefix + _format_job(event))
+        elif kind == "result":
+            printer.print(
+                f"{prefix}[{event['function']}] {event['kind']} score "
+                f"{event['score']} (base {event['base_score']}), "
+                f"wrote to {event['output_dir']}",
+                None,
+                None,
+            )
+        elif kind == "error":
+            printer.print(
+                f"{prefix}[{event['function']}] {event['message']}", None, None
+            )
+        elif kind == "done":
+            printer.print(_format_job(event), None, None)
+
+
+def main() -> None:
+    multiprocessing.freeze_support()
+    # Parsing C is deeply recursive; see src/main.py.
+    sys.setrecursionlimit(10000)
+
+    parser = argparse.ArgumentParser(
+        description="""Run the permuter as a long-lived daemon, which keeps its
+            worker processes around between jobs, and talk to it."""
+    )
+    parser.add_argument(
+        "--socket",
+        dest="socket",
+        metavar="PATH",
+        default=os.environ.get("PERMUTER_SOCKET", DEFAULT_SOCKET),
+        help="UNIX socket to listen on or connect to (default: %(default)s).",
+    )
+    subparsers = parser.add_subparsers(dest="cmd", metavar="<command>")
+    serve_parser = subparsers.add_parser("serve", help="Start the daemon.")
+    serve_parser.add_argument(
+        "-j",
+        dest="threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: %(default)s).",
+    )
+    submit_parser = subparsers.add_parser(
+        "submit", help="Submit a job for one or more directories."
+    )
+    submit_parser.add_argument("directories", nargs="+", metavar="directory")
+    submit_parser.add_argument(
+        "--priority",
+        type=float,
+        default=1.0,
+        help="Share of worker time relative to other jobs (default: %(default)s).",
+    )
+    submit_parser.add_argument("--better-only", action="store_true")
+    submit_parser.add_argument("--best-only", action="store_true")
+    submit_parser.add_argument("--stop-on-zero", action="store_true")
+    submit_parser.add_argument("--only-if-below", dest="score_threshold", type=int)
+    submit_parser.add_argument("--keep-prob", type=float)
+    submit_parser.add_argument(
+        "--stack-diffs", dest="stack_differences", action="store_true"
+    )
+    submit_parser.add_argument("--algorithm", choices=["levenshtein", "difflib"])
+    submit_parser.add_argument("--no-context-output", action="store_true")
+    submit_parser.add_argument(
+        "--watch", action="store_true", help="Stream progress until the job is done."
+    )
+    subparsers.add_parser("list", help="List jobs.")
+    for cmd, help in [
+        ("pause", "Pause a job."),
+        ("resume", "Resume a paused job."),
+        ("cancel", "Stop a job for good."),
+        ("watch", "Stream progress and results of a job until it is done."),
+    ]:
+        job_parser = subparsers.add_parser(cmd, help=help)
+        job_parser.add_argument("job", type=int)
+    subparsers.add_parser("shutdown", help="Stop the daemon.")
+
+    args = parser.parse_args()
+    if args.cmd is None:
+        parser.print_help()
+        return
+    if args.cmd == "serve":
+        serve(args.socket, max(args.threads, 1))
+        return
+
+    obj: Event = {"cmd": args.cmd}
+    if args.cmd == "submit":
+        obj["directories"] = [os.path.abspath(d) for d in args.directories]
+        obj["priority"] = args.priority
+        obj["watch"] = args.watch
+        obj["options"] = {name: getattr(args, name, None) for name in JOB_OPTIONS}
+    elif args.cmd in ("pause", "resume", "cancel", "watch"):
+        obj["job"] = args.job
+
+    try:
+        responses = request(args.socket, obj)
+        if args.cmd == "list":
+            for response in responses:
+                if "error" in response:
+                    print(f"Error: {response['error']}", file=sys.stderr)
+                    sys.exit(1)
+                jobs = response["jobs"]
+                assert isinstance(jobs, list)
+                for info in jobs:
+                    print(_format_job(info))
+                if not jobs:
+                    print("No jobs.")
+        else:
+            _print_events(responses)
+    except OSError as e:
+        print(f"Could not connect to the daemon at {args.socket}: {e}", file=sys.stderr)
+        sys.exit(1)
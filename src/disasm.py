@@ -0,0 +1,422 @@
+"""In-process disassembler, producing the same text as binutils objdump -drz
+would for the parts of it that simplify_objdump looks at. This saves spawning
+an objdump process per candidate. Only MIPS is supported so far; PPC and ARM
+still fall back to objdump. test/disasm has object files to compare against
+objdump with."""
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .elf import ElfFile, Relocation, Section, read_elf
+
+MIPS_GPR_NAMES = [
+    "zero",
+    "at",
+    "v0",
+    "v1",
+    "a0",
+    "a1",
+    "a2",
+    "a3",
+    "t0",
+    "t1",
+    "t2",
+    "t3",
+    "t4",
+    "t5",
+    "t6",
+    "t7",
+    "s0",
+    "s1",
+    "s2",
+    "s3",
+    "s4",
+    "s5",
+    "s6",
+    "s7",
+    "t8",
+    "t9",
+    "k0",
+    "k1",
+    "gp",
+    "sp",
+    "s8",
+    "ra",
+]
+
+MIPS_RELOC_NAMES: Dict[int, str] = {
+    0: "R_MIPS_NONE",
+    1: "R_MIPS_16",
+    2: "R_MIPS_32",
+    3: "R_MIPS_REL32",
+    4: "R_MIPS_26",
+    5: "R_MIPS_HI16",
+    6: "R_MIPS_LO16",
+    7: "R_MIPS_GPREL16",
+    8: "R_MIPS_LITERAL",
+    9: "R_MIPS_GOT16",
+    10: "R_MIPS_PC16",
+    11: "R_MIPS_CALL16",
+    12: "R_MIPS_GPREL32",
+    37: "R_MIPS_JALR",
+}
+
+# (name, operands, match, mask), in the order of binutils' mips-opc.c, which
+# the disassembler tries first-to-last. Restricted to MIPS I-III plus the
+# VR4300-specific bits, matching "objdump -m mips:4300". Operand letters
+# follow binutils as well.
+MIPS_OPCODES: List[Tuple[str, str, int, int]] = [
+    ("nop", "", 0x00000000, 0xFFFFFFFF),
+    ("ssnop", "", 0x00000040, 0xFFFFFFFF),
+    ("ehb", "", 0x000000C0, 0xFFFFFFFF),
+    ("li", "t,j", 0x24000000, 0xFFE00000),
+    ("li", "t,i", 0x34000000, 0xFFE00000),
+    ("move", "d,s", 0x0000002D, 0xFC1F07FF),
+    ("move", "d,s", 0x00000021, 0xFC1F07FF),
+    ("move", "d,s", 0x00000025, 0xFC1F07FF),
+    ("b", "p", 0x10000000, 0xFFFF0000),
+    ("b", "p", 0x04010000, 0xFFFF0000),
+    ("bal", "p", 0x04110000, 0xFFFF0000),
+    ("abs.d", "D,S", 0x46200005, 0xFFFF003F),
+    ("abs.s", "D,S", 0x46000005, 0xFFFF003F),
+    ("add.d", "D,S,T", 0x46200000, 0xFFE0003F),
+    ("add.s", "D,S,T", 0x46000000, 0xFFE0003F),
+    ("add", "d,v,t", 0x00000020, 0xFC0007FF),
+    ("addi", "t,r,j", 0x20000000, 0xFC000000),
+    ("addiu", "t,r,j", 0x24000000, 0xFC000000),
+    ("addu", "d,v,t", 0x00000021, 0xFC0007FF),
+    ("and", "d,v,t", 0x00000024, 0xFC0007FF),
+    ("andi", "t,r,i", 0x30000000, 0xFC000000),
+    ("bc1f", "p", 0x45000000, 0xFFFF0000),
+    ("bc1fl", "p", 0x45020000, 0xFFFF0000),
+    ("bc1t", "p", 0x45010000, 0xFFFF0000),
+    ("bc1tl", "p", 0x45030000, 0xFFFF0000),
+    ("beqz", "s,p", 0x10000000, 0xFC1F0000),
+    ("beqzl", "s,p", 0x50000000, 0xFC1F0000),
+    ("beq", "s,t,p", 0x10000000, 0xFC000000),
+    ("beql", "s,t,p", 0x50000000, 0xFC000000),
+    ("bgez", "s,p", 0x04010000, 0xFC1F0000),
+    ("bgezl", "s,p", 0x04030000, 0xFC1F0000),
+    ("bgezal", "s,p", 0x04110000, 0xFC1F0000),
+    ("bgezall", "s,p", 0x04130000, 0xFC1F0000),
+    ("bgtz", "s,p", 0x1C000000, 0xFC1F0000),
+    ("bgtzl", "s,p", 0x5C000000, 0xFC1F0000),
+    ("blez", "s,p", 0x18000000, 0xFC1F0000),
+    ("blezl", "s,p", 0x58000000, 0xFC1F0000),
+    ("bltz", "s,p", 0x04000000, 0xFC1F0000),
+    ("bltzl", "s,p", 0x04020000, 0xFC1F0000),
+    ("bltzal", "s,p", 0x04100000, 0xFC1F0000),
+    ("bltzall", "s,p", 0x04120000, 0xFC1F0000),
+    ("bnez", "s,p", 0x14000000, 0xFC1F0000),
+    ("bnezl", "s,p", 0x54000000, 0xFC1F0000),
+    ("bne", "s,t,p", 0x14000000, 0xFC000000),
+    ("bnel", "s,t,p", 0x54000000, 0xFC000000),
+    ("break", "", 0x0000000D, 0xFFFFFFFF),
+    ("break", "c", 0x0000000D, 0xFC00FFFF),
+    ("break", "c,q", 0x0000000D, 0xFC00003F),
+]
+
+_FP_CONDITIONS = [
+    "f",
+    "un",
+    "eq",
+    "ueq",
+    "olt",
+    "ult",
+    "ole",
+    "ule",
+    "sf",
+    "ngle",
+    "seq",
+    "ngl",
+    "lt",
+    "nge",
+    "le",
+    "ngt",
+]
+for _i, _cond in enumerate(_FP_CONDITIONS):
+    MIPS_OPCODES.append((f"c.{_cond}.d", "S,T", 0x46200030 + _i, 0xFFE007FF))
+    MIPS_OPCODES.append((f"c.{_cond}.s", "S,T", 0x46000030 + _i, 0xFFE007FF))
+
+MIPS_OPCODES += [
+    ("cache", "k,o(b)", 0xBC000000, 0xFC000000),
+    ("ceil.l.d", "D,S", 0x4620000A, 0xFFFF003F),
+    ("ceil.l.s", "D,S", 0x4600000A, 0xFFFF003F),
+    ("ceil.w.d", "D,S", 0x4620000E, 0xFFFF003F),
+    ("ceil.w.s", "D,S", 0x4600000E, 0xFFFF003F),
+    ("cfc1", "t,G", 0x44400000, 0xFFE007FF),
+    ("ctc1", "t,G", 0x44C00000, 0xFFE007FF),
+    ("cvt.d.l", "D,S", 0x46A00021, 0xFFFF003F),
+    ("cvt.d.s", "D,S", 0x46000021, 0xFFFF003F),
+    ("cvt.d.w", "D,S", 0x46800021, 0xFFFF003F),
+    ("cvt.l.d", "D,S", 0x46200025, 0xFFFF003F),
+    ("cvt.l.s", "D,S", 0x46000025, 0xFFFF003F),
+    ("cvt.s.d", "D,S", 0x46200020, 0xFFFF003F),
+    ("cvt.s.l", "D,S", 0x46A00020, 0xFFFF003F),
+    ("cvt.s.w", "D,S", 0x46800020, 0xFFFF003F),
+    ("cvt.w.d", "D,S", 0x46200024, 0xFFFF003F),
+    ("cvt.w.s", "D,S", 0x46000024, 0xFFFF003F),
+    ("dadd", "d,v,t", 0x0000002C, 0xFC0007FF),
+    ("daddi", "t,r,j", 0x60000000, 0xFC000000),
+    ("daddiu", "t,r,j", 0x64000000, 0xFC000000),
+    ("daddu", "d,v,t", 0x0000002D, 0xFC0007FF),
+    ("ddiv", "z,s,t", 0x0000001E, 0xFC00FFFF),
+    ("ddivu", "z,s,t", 0x0000001F, 0xFC00FFFF),
+    ("div", "z,s,t", 0x0000001A, 0xFC00FFFF),
+    ("div.d", "D,S,T", 0x46200003, 0xFFE0003F),
+    ("div.s", "D,S,T", 0x46000003, 0xFFE0003F),
+    ("divu", "z,s,t", 0x0000001B, 0xFC00FFFF),
+    ("dmfc0", "t,G", 0x40200000, 0xFFE007FF),
+    ("dmfc1", "t,S", 0x44200000, 0xFFE007FF),
+    ("dmtc0", "t,G", 0x40A00000, 0xFFE007FF),
+    ("dmtc1", "t,S", 0x44A00000, 0xFFE007FF),
+    ("dmult", "s,t", 0x0000001C, 0xFC00FFFF),
+    ("dmultu", "s,t", 0x0000001D, 0xFC00FFFF),
+    ("dneg", "d,w", 0x0000002E, 0xFFE007FF),
+    ("dnegu", "d,w", 0x0000002F, 0xFFE007FF),
+    ("dsll32", "d,w,<", 0x0000003C, 0xFFE0003F),
+    ("dsll", "d,w,<", 0x00000038, 0xFFE0003F),
+    ("dsllv", "d,t,s", 0x00000014, 0xFC0007FF),
+    ("dsra32", "d,w,<", 0x0000003F, 0xFFE0003F),
+    ("dsra", "d,w,<", 0x0000003B, 0xFFE0003F),
+    ("dsrav", "d,t,s", 0x00000017, 0xFC0007FF),
+    ("dsrl32", "d,w,<", 0x0000003E, 0xFFE0003F),
+    ("dsrl", "d,w,<", 0x0000003A, 0xFFE0003F),
+    ("dsrlv", "d,t,s", 0x00000016, 0xFC0007FF),
+    ("dsub", "d,v,t", 0x0000002E, 0xFC0007FF),
+    ("dsubu", "d,v,t", 0x0000002F, 0xFC0007FF),
+    ("eret", "", 0x42000018, 0xFFFFFFFF),
+    ("floor.l.d", "D,S", 0x4620000B, 0xFFFF003F),
+    ("floor.l.s", "D,S", 0x4600000B, 0xFFFF003F),
+    ("floor.w.d", "D,S", 0x4620000F, 0xFFFF003F),
+    ("floor.w.s", "D,S", 0x4600000F, 0xFFFF003F),
+    ("jal", "a", 0x0C000000, 0xFC000000),
+    ("jalr", "s", 0x0000F809, 0xFC1FFFFF),
+    ("jalr", "d,s", 0x00000009, 0xFC1F07FF),
+    ("jr", "s", 0x00000008, 0xFC1FFFFF),
+    ("j", "a", 0x08000000, 0xFC000000),
+    ("lb", "t,o(b)", 0x80000000, 0xFC000000),
+    ("lbu", "t,o(b)", 0x90000000, 0xFC000000),
+    ("ld", "t,o(b)", 0xDC000000, 0xFC000000),
+    ("ldc1", "T,o(b)", 0xD4000000, 0xFC000000),
+    ("ldl", "t,o(b)", 0x68000000, 0xFC000000),
+    ("ldr", "t,o(b)", 0x6C000000, 0xFC000000),
+    ("lh", "t,o(b)", 0x84000000, 0xFC000000),
+    ("lhu", "t,o(b)", 0x94000000, 0xFC000000),
+    ("ll", "t,o(b)", 0xC0000000, 0xFC000000),
+    ("lld", "t,o(b)", 0xD0000000, 0xFC000000),
+    ("lui", "t,u", 0x3C000000, 0xFFE00000),
+    ("lw", "t,o(b)", 0x8C000000, 0xFC000000),
+    ("lwc1", "T,o(b)", 0xC4000000, 0xFC000000),
+    ("lwl", "t,o(b)", 0x88000000, 0xFC000000),
+    ("lwr", "t,o(b)", 0x98000000, 0xFC000000),
+    ("lwu", "t,o(b)", 0x9C000000, 0xFC000000),
+    ("mfc0", "t,G", 0x40000000, 0xFFE007FF),
+    ("mfc1", "t,S", 0x44000000, 0xFFE007FF),
+    ("mfhi", "d", 0x00000010, 0xFFFF07FF),
+    ("mflo", "d", 0x00000012, 0xFFFF07FF),
+    ("mov.d", "D,S", 0x46200006, 0xFFFF003F),
+    ("mov.s", "D,S", 0x46000006, 0xFFFF003F),
+    ("mtc0", "t,G", 0x40800000, 0xFFE007FF),
+    ("mtc1", "t,S", 0x44800000, 0xFFE007FF),
+    ("mthi", "s", 0x00000011, 0xFC1FFFFF),
+    ("mtlo", "s", 0x00000013, 0xFC1FFFFF),
+    ("mul.d", "D,S,T", 0x46200002, 0xFFE0003F),
+    ("mul.s", "D,S,T", 0x46000002, 0xFFE0003F),
+    ("mult", "s,t", 0x00000018, 0xFC00FFFF),
+    ("multu", "s,t", 0x00000019, 0xFC00FFFF),
+    ("neg.d", "D,S", 0x46200007, 0xFFFF003F),
+    ("neg.s", "D,S", 0x46000007, 0xFFFF003F),
+    ("neg", "d,w", 0x00000022, 0xFFE007FF),
+    ("negu", "d,w", 0x00000023, 0xFFE007FF),
+    ("nor", "d,v,t", 0x00000027, 0xFC0007FF),
+    ("or", "d,v,t", 0x00000025, 0xFC0007FF),
+    ("ori", "t,r,i", 0x34000000, 0xFC000000),
+    ("round.l.d", "D,S", 0x46200008, 0xFFFF003F),
+    ("round.l.s", "D,S", 0x46000008, 0xFFFF003F),
+    ("round.w.d", "D,S", 0x4620000C, 0xFFFF003F),
+    ("round.w.s", "D,S", 0x4600000C, 0xFFFF003F),
+    ("sb", "t,o(b)", 0xA0000000, 0xFC000000),
+    ("sc", "t,o(b)", 0xE0000000, 0xFC000000),
+    ("scd", "t,o(b)", 0xF0000000, 0xFC000000),
+    ("sd", "t,o(b)", 0xFC000000, 0xFC000000),
+    ("sdc1", "T,o(b)", 0xF4000000, 0xFC000000),
+    ("sdl", "t,o(b)", 0xB0000000, 0xFC000000),
+    ("sdr", "t,o(b)", 0xB4000000, 0xFC000000),
+    ("sh", "t,o(b)", 0xA4000000, 0xFC000000),
+    ("sll", "d,w,<", 0x00000000, 0xFFE0003F),
+    ("sllv", "d,t,s", 0x00000004, 0xFC0007FF),
+    ("slt", "d,v,t", 0x0000002A, 0xFC0007FF),
+    ("slti", "t,r,j", 0x28000000, 0xFC000000),
+    ("sltiu", "t,r,j", 0x2C000000, 0xFC000000),
+    ("sltu", "d,v,t", 0x0000002B, 0xFC0007FF),
+    ("sqrt.d", "D,S", 0x46200004, 0xFFFF003F),
+    ("sqrt.s", "D,S", 0x46000004, 0xFFFF003F),
+    ("sra", "d,w,<", 0x00000003, 0xFFE0003F),
+    ("srav", "d,t,s", 0x00000007, 0xFC0007FF),
+    ("srl", "d,w,<", 0x00000002, 0xFFE0003F),
+    ("srlv", "d,t,s", 0x00000006, 0xFC0007FF),
+    ("sub.d", "D,S,T", 0x46200001, 0xFFE0003F),
+    ("sub.s", "D,S,T", 0x46000001, 0xFFE0003F),
+    ("sub", "d,v,t", 0x00000022, 0xFC0007FF),
+    ("subu", "d,v,t", 0x00000023, 0xFC0007FF),
+    ("sw", "t,o(b)", 0xAC000000, 0xFC000000),
+    ("swc1", "T,o(b)", 0xE4000000, 0xFC000000),
+    ("swl", "t,o(b)", 0xA8000000, 0xFC000000),
+    ("swr", "t,o(b)", 0xB8000000, 0xFC000000),
+    ("sync", "", 0x0000000F, 0xFFFFFFFF),
+    ("syscall", "", 0x0000000C, 0xFFFFFFFF),
+    ("syscall", "B", 0x0000000C, 0xFC00003F),
+    ("teqi", "s,j", 0x040C0000, 0xFC1F0000),
+    ("teq", "s,t", 0x00000034, 0xFC00FFFF),
+    ("teq", "s,t,q", 0x00000034, 0xFC00003F),
+    ("tgei", "s,j", 0x04080000, 0xFC1F0000),
+    ("tge", "s,t", 0x00000030, 0xFC00FFFF),
+    ("tge", "s,t,q", 0x00000030, 0xFC00003F),
+    ("tgeiu", "s,j", 0x04090000, 0xFC1F0000),
+    ("tgeu", "s,t", 0x00000031, 0xFC00FFFF),
+    ("tgeu", "s,t,q", 0x00000031, 0xFC00003F),
+    ("tlbp", "", 0x42000008, 0xFFFFFFFF),
+    ("tlbr", "", 0x42000001, 0xFFFFFFFF),
+    ("tlbwi", "", 0x42000002, 0xFFFFFFFF),
+    ("tlbwr", "", 0x42000006, 0xFFFFFFFF),
+    ("tlti", "s,j", 0x040A0000, 0xFC1F0000),
+    ("tlt", "s,t", 0x00000032, 0xFC00FFFF),
+    ("tlt", "s,t,q", 0x00000032, 0xFC00003F),
+    ("tltiu", "s,j", 0x040B0000, 0xFC1F0000),
+    ("tltu", "s,t", 0x00000033, 0xFC00FFFF),
+    ("tltu", "s,t,q", 0x00000033, 0xFC00003F),
+    ("tnei", "s,j", 0x040E0000, 0xFC1F0000),
+    ("tne", "s,t", 0x00000036, 0xFC00FFFF),
+    ("tne", "s,t,q", 0x00000036, 0xFC00003F),
+    ("trunc.l.d", "D,S", 0x46200009, 0xFFFF003F),
+    ("trunc.l.s", "D,S", 0x46000009, 0xFFFF003F),
+    ("trunc.w.d", "D,S", 0x4620000D, 0xFFFF003F),
+    ("trunc.w.s", "D,S", 0x4600000D, 0xFFFF003F),
+    ("xor", "d,v,t", 0x00000026, 0xFC0007FF),
+    ("xori", "t,r,i", 0x38000000, 0xFC000000),
+]
+
+# Opcodes grouped by major opcode, keeping table order within each group.
+_MIPS_BY_MAJOR: Dict[int, List[Tuple[str, str, int, int]]] = {}
+for _op in MIPS_OPCODES:
+    _MIPS_BY_MAJOR.setdefault(_op[2] >> 26, []).append(_op)
+
+# Decoded text of instructions whose operands don't depend on their address.
+_mips_cache: Dict[int, str] = {}
+
+
+def _sext16(value: int) -> int:
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def _mips_operand(letter: str, word: int, pc: int) -> str:
+    if letter in "sv" or letter == "r":
+        return MIPS_GPR_NAMES[(word >> 21) & 31]
+    if letter in "tw":
+        return MIPS_GPR_NAMES[(word >> 16) & 31]
+    if letter == "d":
+        return MIPS_GPR_NAMES[(word >> 11) & 31]
+    if letter == "z":
+        return MIPS_GPR_NAMES[0]
+    if letter == "b":
+        return MIPS_GPR_NAMES[(word >> 21) & 31]
+    if letter == "S":
+        return f"$f{(word >> 11) & 31}"
+    if letter == "T":
+        return f"$f{(word >> 16) & 31}"
+    if letter == "D":
+        return f"$f{(word >> 6) & 31}"
+    if letter == "G":
+        return f"${(word >> 11) & 31}"
+    if letter in "jo":
+        return str(_sext16(word & 0xFFFF))
+    if letter in "iu":
+        return hex(word & 0xFFFF)
+    if letter == "<":
+        return hex((word >> 6) & 31)
+    if letter == "k":
+        return hex((word >> 16) & 31)
+    if letter == "c":
+        return hex((word >> 16) & 0x3FF)
+    if letter == "q":
+        return hex((word >> 6) & 0x3FF)
+    if letter == "B":
+        return hex((word >> 6) & 0xFFFFF)
+    if letter == "p":
+        target = (pc + 4 + (_sext16(word & 0xFFFF) << 2)) & 0xFFFFFFFF
+        return f"{target:x}"
+    if letter == "a":
+        target = ((pc + 4) & 0xF0000000) | ((word & 0x3FFFFFF) << 2)
+        return f"{target:x}"
+    raise AssertionError(f"bad operand letter {letter}")
+
+
+def disassemble_mips_word(word: int, pc: int) -> str:
+    """Disassemble a single instruction into objdump's "mnemonic\\targs" form."""
+    cached = _mips_cache.get(word)
+    if cached is not None:
+        return cached
+    for name, operands, match, mask in _MIPS_BY_MAJOR.get(word >> 26, []):
+        if word & mask != match:
+            continue
+        if not operands:
+            text = name
+        else:
+            args = []
+            for part in operands.split(","):
+                if part == "o(b)":
+                    base = _mips_operand("b", word, pc)
+                    args.append(f"{_mips_operand('o', word, pc)}({base})")
+                else:
+                    args.append(_mips_operand(part, word, pc))
+            text = name + "\t" + ",".join(args)
+        if "p" not in operands and "a" not in operands:
+            _mips_cache[word] = text
+        return text
+    return hex(word)
+
+
+def _format_reloc(reloc: Relocation, names: Dict[int, str]) -> str:
+    name = names.get(reloc.type, f"R_UNKNOWN_{reloc.type}")
+    sym = reloc.sym_name
+    if reloc.addend:
+        sym += f"+{reloc.addend:#x}" if reloc.addend > 0 else f"-{-reloc.addend:#x}"
+    return f"\t\t\t{reloc.offset:x}: {name}\t{sym}"
+
+
+def _disassemble_mips(elf: ElfFile, section: Section) -> List[str]:
+    data = section.data
+    words = struct.iter_unpack(">I" if elf.big_endian else "<I", data[: len(data) & ~3])
+    relocs = section.relocations
+    reloc_ind = 0
+    out: List[str] = []
+    for i, (word,) in enumerate(words):
+        pc = 4 * i
+        out.append(f"{pc:4x}:\t{word:08x} \t{disassemble_mips_word(word, pc)}")
+        while reloc_ind < len(relocs) and relocs[reloc_ind].offset < pc + 4:
+            out.append(_format_reloc(relocs[reloc_ind], MIPS_RELOC_NAMES))
+            reloc_ind += 1
+    return out
+
+
+SectionDisassembler = Callable[[ElfFile, Section], List[str]]
+
+DISASSEMBLERS: Dict[str, SectionDisassembler] = {
+    "mips": _disassemble_mips,
+}
+
+
+def builtin_objdump(o_filename: str, arch_name: str) -> Optional[List[str]]:
+    """Produce objdump -drz style output lines for an object file, or None if
+    the architecture isn't supported by the built-in disassembler (currently
+    PPC and ARM)."""
+    disassembler = DISASSEMBLERS.get(arch_name)
+    if disassembler is None:
+        return None
+    elf = read_elf(o_filename)
+    # The first line of objdump output is empty; simplify_objdump skips it.
+    lines = [""]
+    for section in elf.text_sections():
+        lines.append(f"Disassembly of section {section.name}:")
+        lines.extend(disassembler(elf, section))
+    return lines
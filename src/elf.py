@@ -0,0 +1,163 @@
+"""Minimal reader for relocatable ELF files, just capable enough to pull out
+executable sections together with their relocations."""
+from dataclasses import dataclass
+import struct
+from typing import Dict, List, Optional
+
+SHT_SYMTAB = 2
+SHT_RELA = 4
+SHT_REL = 9
+SHF_EXECINSTR = 4
+STT_SECTION = 3
+
+
+class ElfError(Exception):
+    pass
+
+
+@dataclass
+class Relocation:
+    offset: int
+    type: int
+    sym_name: str
+    # None for REL relocations, where the addend lives in the instruction.
+    addend: Optional[int]
+
+
+@dataclass
+class Section:
+    index: int
+    name: str
+    type: int
+    flags: int
+    data: bytes
+    link: int
+    info: int
+    relocations: List[Relocation]
+
+
+@dataclass
+class ElfFile:
+    big_endian: bool
+    machine: int
+    sections: List[Section]
+
+    def text_sections(self) -> List[Section]:
+        """Return all non-empty executable sections, in file order."""
+        return [s for s in self.sections if s.flags & SHF_EXECINSTR and len(s.data) > 0]
+
+
+def parse_elf(data: bytes) -> ElfFile:
+    if data[:4] != b"\x7fELF":
+        raise ElfError("not an ELF file")
+    if data[4] not in (1, 2):
+        raise ElfError("unknown ELF class")
+    is_64 = data[4] == 2
+    big_endian = data[5] == 2
+    e = ">" if big_endian else "<"
+    # Address-sized fields, and the layouts of section headers, symbols and
+    # relocations, which all depend on the ELF class.
+    a = "Q" if is_64 else "I"
+    shdr_fmt = e + ("IIQQQQIIQQ" if is_64 else "IIIIIIIIII")
+    sym_fmt = e + ("IBBHQQ" if is_64 else "IIIBBH")
+    rel_fmt = e + a + a
+    rela_fmt = e + a + a + ("q" if is_64 else "i")
+    info_shift = 32 if is_64 else 8
+
+    def unpack(fmt: str, offset: int) -> tuple:
+        return struct.unpack_from(e + fmt, data, offset)
+
+    (machine,) = unpack("H", 18)
+    (shoff,) = unpack(a, 40 if is_64 else 32)
+    shentsize, shnum, shstrndx = unpack("HHH", 58 if is_64 else 46)
+    if shoff == 0 or shnum == 0:
+        raise ElfError("ELF file has no section headers")
+
+    sections: List[Section] = []
+    name_offsets: List[int] = []
+    for i in range(shnum):
+        (
+            sh_name,
+            sh_type,
+            sh_flags,
+            _,
+            sh_offset,
+            sh_size,
+            sh_link,
+            sh_info,
+            _,
+            _,
+        ) = struct.unpack_from(shdr_fmt, data, shoff + i * shentsize)
+        # SHT_NOBITS sections (.bss) have no data in the file.
+        contents = b"" if sh_type == 8 else data[sh_offset : sh_offset + sh_size]
+        sections.append(
+            Section(
+                index=i,
+                name="",
+                type=sh_type,
+                flags=sh_flags,
+                data=contents,
+                link=sh_link,
+                info=sh_info,
+                relocations=[],
+            )
+        )
+        name_offsets.append(sh_name)
+
+    def read_str(table: bytes, offset: int) -> str:
+        end = table.find(b"\0", offset)
+        return table[offset : end if end != -1 else len(table)].decode("latin1")
+
+    shstrtab = sections[shstrndx].data
+    for section, name_offset in zip(sections, name_offsets):
+        section.name = read_str(shstrtab, name_offset)
+
+    symbol_names: Dict[int, List[str]] = {}
+
+    def get_symbol_names(symtab_index: int) -> List[str]:
+        if symtab_index not in symbol_names:
+            symtab = sections[symtab_index]
+            strtab = sections[symtab.link].data
+            names = []
+            for fields in struct.iter_unpack(sym_fmt, symtab.data):
+                if is_64:
+                    st_name, st_info, _, st_shndx, _, _ = fields
+                else:
+                    st_name, _, _, st_info, _, st_shndx = fields
+                if st_info & 0xF == STT_SECTION and st_shndx < len(sections):
+                    names.append(sections[st_shndx].name)
+                else:
+                    names.append(read_str(strtab, st_name))
+            symbol_names[symtab_index] = names
+        return symbol_names[symtab_index]
+
+    for section in sections:
+        if section.type not in (SHT_REL, SHT_RELA) or section.info >= len(sections):
+            continue
+        names = get_symbol_names(section.link)
+        is_rela = section.type == SHT_RELA
+        target = sections[section.info]
+        for fields in struct.iter_unpack(
+            rela_fmt if is_rela else rel_fmt, section.data
+        ):
+            r_offset, r_info = fields[0], fields[1]
+            sym = r_info >> info_shift
+            target.relocations.append(
+                Relocation(
+                    offset=r_offset,
+                    type=r_info & ((1 << info_shift) - 1),
+                    sym_name=names[sym] if 0 < sym < len(names) else "*ABS*",
+                    addend=fields[2] if is_rela else None,
+                )
+            )
+
+    for section in sections:
+        # objdump lists relocations sorted by address (stably).
+        section.relocations.sort(key=lambda r: r.offset)
+
+    return ElfFile(big_endian=big_endian, machine=machine, sections=sections)
+
+
+def read_elf(filename: str) -> ElfFile:
+    with open(filename, "rb") as f:
+        return parse_elf(f.read())
@@ -9,3 +9,8 @@ class ServerError(Exception):
 @dataclass
 class CandidateConstructionFailure(Exception):
     message: str
+
+
+@dataclass
+class CheckpointMismatch(Exception):
+    message: str
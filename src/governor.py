@@ -0,0 +1,200 @@
+"""Throttling local workers to a share of the machine, with --throttle and
+--speed. Rather than slowing every iteration down, workers are paused and
+resumed as a whole; at most one of them runs at a reduced duty cycle."""
+from dataclasses import dataclass
+import os
+import time
+from typing import TYPE_CHECKING, MutableSequence, Optional
+
+if TYPE_CHECKING:
+    import multiprocessing.synchronize
+
+# How often the governor re-evaluates the target, in seconds.
+THROTTLE_INTERVAL = 5.0
+
+# How often a paused worker checks whether it has been resumed, in seconds.
+PAUSE_POLL_INTERVAL = 0.2
+
+# Number of workers (or cores) worth of work to keep running no matter what,
+# so that progress never stops completely and results keep flowing.
+MIN_CAPACITY = 0.1
+
+# How many workers to add or remove per unit of difference between the target
+# and the actual load average, each THROTTLE_INTERVAL. The load average moves
+# slowly, so this is kept low to avoid oscillating.
+LOAD_GAIN = 0.5
+
+THROTTLE_KINDS = ["cpu", "load", "cgroup"]
+
+
+@dataclass
+class ThrottleTarget:
+    # "cpu": percent of the machine's cores.
+    # "load": 1-minute system load average.
+    # "cgroup": percent of the CPU quota of the cgroup we run in.
+    kind: str
+    value: float
+
+    def __str__(self) -> str:
+        if self.kind == "load":
+            return f"load {self.value:g}"
+        return f"{self.kind} {self.value:g}%"
+
+
+def parse_throttle(spec: str) -> ThrottleTarget:
+    """Parse a --throttle argument: "cpu=PERCENT", "load=N" or
+    "cgroup[=PERCENT]". Raises ValueError on failure."""
+    kind, sep, value_str = spec.partition("=")
+    if kind not in THROTTLE_KINDS:
+        raise ValueError(f"unknown throttle target '{kind}'")
+    if not sep:
+        if kind != "cgroup":
+            raise ValueError(f"'{kind}' needs a value, e.g. {kind}=50")
+        return ThrottleTarget(kind, 100.0)
+    try:
+        value = float(value_str.rstrip("%"))
+    except ValueError:
+        raise ValueError(f"invalid number '{value_str}'") from None
+    if value <= 0 or (kind != "load" and value > 100):
+        raise ValueError(f"value {value_str} is out of range")
+    return ThrottleTarget(kind, value)
+
+
+def load_average() -> Optional[float]:
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def cgroup_cpu_limit(root: str = "/sys/fs/cgroup") -> Optional[float]:
+    """Return the number of cores that the current cgroup is allowed to use,
+    or None if there's no limit or it can't be determined."""
+    try:
+        # cgroup v2
+        with open(os.path.join(root, "cpu.max"), encoding="utf-8") as f:
+            quota_str, period_str = f.read().split()
+        if quota_str == "max":
+            return None
+        return int(quota_str) / int(period_str)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+            quota = int(f.read())
+        with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+            period = int(f.read())
+        if quota <= 0 or period <= 0:
+            return None
+        return quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def set_capacity(duties: MutableSequence[float], capacity: float) -> None:
+    """Spread a number of workers' worth of work over the workers: as many
+    as possible run all the time, the next one runs part of the time, and the
+    rest are paused."""
+    for i in range(len(duties)):
+        duties[i] = min(max(capacity - i, 0.0), 1.0)
+
+
+def throttle(
+    duties: MutableSequence[float],
+    index: int,
+    seconds: float,
+    stop_event: "Optional[multiprocessing.synchronize.Event]" = None,
+) -> None:
+    """Called by a worker after spending some seconds on an iteration. Sleeps
+    for long enough to keep to its duty cycle, and, if it is paused, until it
+    is resumed or told to stop."""
+
+    def sleep(t: float) -> bool:
+        if stop_event is None:
+            time.sleep(t)
+            return False
+        return stop_event.wait(t)
+
+    duty = duties[index]
+    if 0 < duty < 1:
+        if sleep(seconds * (1 / duty - 1)):
+            return
+    while duties[index] <= 0:
+        if sleep(PAUSE_POLL_INTERVAL):
+            return
+
+
+class Governor:
+    """Adjusts how many local workers run, to keep to a ThrottleTarget.
+    Workers report how many seconds they spend evaluating candidates, which
+    is used to report the effective number of busy cores."""
+
+    def __init__(
+        self,
+        target: ThrottleTarget,
+        duties: MutableSequence[float],
+        *,
+        cpu_count: Optional[int] = None,
+    ) -> None:
+        self.target = target
+        self.duties = duties
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.load: Optional[float] = None
+        self.throughput: Optional[float] = None
+        self._busy = 0.0
+        self._last_update: Optional[float] = None
+        self.capacity = self._clamp(self._open_loop_capacity() or len(duties))
+        set_capacity(self.duties, self.capacity)
+
+    def _clamp(self, capacity: float) -> float:
+        return min(max(capacity, MIN_CAPACITY), float(len(self.duties)))
+
+    def _open_loop_capacity(self) -> Optional[float]:
+        if self.target.kind == "cpu":
+            return self.cpu_count * self.target.value / 100
+        if self.target.kind == "cgroup":
+            cores = cgroup_cpu_limit() or self.cpu_count
+            return cores * self.target.value / 100
+        return None
+
+    def record(self, seconds: float) -> None:
+        """Record time that a worker spent working."""
+        self._busy += seconds
+
+    def update(self, now: Optional[float] = None, load: Optional[float] = None) -> bool:
+        """Re-evaluate the target, if it's time to. Returns True if the number
+        of running workers changed."""
+        if now is None:
+            now = time.monotonic()
+        if self._last_update is None:
+            self._last_update = now
+            return False
+        elapsed = now - self._last_update
+        if elapsed < THROTTLE_INTERVAL:
+            return False
+        self._last_update = now
+        self.throughput = self._busy / elapsed
+        self._busy = 0.0
+
+        capacity = self._open_loop_capacity()
+        if capacity is None:
+            self.load = load if load is not None else load_average()
+            if self.load is None:
+                return False
+            capacity = self.capacity + (self.target.value - self.load) * LOAD_GAIN
+        capacity = self._clamp(capacity)
+        if abs(capacity - self.capacity) < 1e-6:
+            return False
+        self.capacity = capacity
+        set_capacity(self.duties, capacity)
+        return True
+
+    def get_str_stats(self) -> str:
+        ret = f"throttle: {self.capacity:.1f}/{len(self.duties)} workers"
+        if self.throughput is not None:
+            ret += f", {self.throughput:.1f} cores busy"
+        ret += f" (target {self.target}"
+        if self.load is not None:
+            ret += f", now {self.load:.1f}"
+        return ret + ")"
@@ -1,6 +1,7 @@
 import argparse
 from dataclasses import dataclass, field
 import itertools
+import json
 import multiprocessing
 from multiprocessing import Queue
 import os
@@ -11,20 +12,36 @@ import threading
 import time
 
 from typing import (
+    TYPE_CHECKING,
     Callable,
     Dict,
     Iterable,
     Iterator,
     List,
     Mapping,
+    MutableSequence,
     Optional,
     Set,
     Tuple,
 )
 
+if TYPE_CHECKING:
+    import multiprocessing.synchronize
+
+from .adaptive import PassBandit
+from .cache import DiskCache, SharedState, cache_namespace, shared_memory
 from .candidate import CandidateResult
+from .checkpoint import (
+    CHECKPOINT_FILE,
+    DEFAULT_CHECKPOINT_INTERVAL,
+    Checkpoint,
+    SeedProgress,
+    load_checkpoint,
+    save_checkpoint,
+)
 from .compiler import Compiler
-from .error import CandidateConstructionFailure
+from .error import CandidateConstructionFailure, CheckpointMismatch
+from .governor import Governor, ThrottleTarget, parse_throttle, throttle
 from .helpers import (
     get_settings,
     get_default_randomization_weights,
@@ -40,6 +57,8 @@ MIN_PRIO = 0.01
 MAX_PRIO = 2.0
 
 from .permuter import (
+    DEFAULT_CACHE_MEMORY,
+    Control,
     EvalError,
     EvalResult,
     Feedback,
@@ -47,28 +66,79 @@ from .permuter import (
     Message,
     NeedMoreWork,
     Permuter,
+    PopulationUpdate,
+    ReplicaSwap,
     Task,
+    WeightUpdate,
+    WorkBatch,
     WorkDone,
+    WorkStats,
 )
 from .preprocess import preprocess
 from .printer import Printer
 from .profiler import Profiler
 from .randomizer import RANDOMIZATION_PASSES
 from .scorer import Scorer
+from .schedule import SCHEDULE_POLICIES, SeedScheduler
+from .search import (
+    DEFAULT_ANNEAL_TIME,
+    DEFAULT_POPULATION_SIZE,
+    AnnealSchedule,
+    Population,
+    PopulationEntry,
+    ReplicaExchange,
+    ReplicaState,
+    replica_level,
+)
+
+# File name for the weights learned with --adaptive-weights, written to each
+# input directory on exit.
+LEARNED_WEIGHTS_FILE = "learned_weights.toml"
+
+# File name of the --disk-cache database, when no path is given.
+DEFAULT_DISK_CACHE = "permuter_cache.sqlite3"
+
+# Defaults for --batch: how much evaluation time each function gets, and after
+# how much of it without improvement the function is given up on, in seconds.
+DEFAULT_BATCH_BUDGET = 600.0
+DEFAULT_BATCH_STALL = 180.0
+DEFAULT_BATCH_SUMMARY = "permuter_batch_summary.json"
+
+# How often local workers send results to the main thread, in seconds.
+RESULT_BATCH_INTERVAL = 0.1
+
+# Size of the table of seen hashes that is shared with local workers.
+SHARED_STATE_MEMORY = 2**20
 
 # The probability that the randomizer continues transforming the output it
 # generated last time.
 DEFAULT_RAND_KEEP_PROB = 0.6
 
+# How often to write out timings with --timings-file, in seconds.
+TIMINGS_INTERVAL = 10.0
+
 
 @dataclass
 class Options:
     directories: List[str]
     show_errors: bool = False
     show_timings: bool = False
+    timings_file: Optional[str] = None
     print_diffs: bool = False
     stack_differences: bool = False
     algorithm: str = "difflib"
+    builtin_disasm: bool = False
+    disk_cache: Optional[str] = None
+    disk_cache_size: int = 512
+    cache_memory: int = DEFAULT_CACHE_MEMORY // 2**20
+    adaptive_weights: bool = False
+    search: str = "chain"
+    population_size: int = DEFAULT_POPULATION_SIZE
+    anneal_temp: Optional[float] = None
+    anneal_time: float = DEFAULT_ANNEAL_TIME
+    anneal_iterations: Optional[int] = None
+    resume: bool = False
+    checkpoint_interval: Optional[float] = None
     abort_exceptions: bool = False
     better_only: bool = False
     best_only: bool = False
@@ -78,12 +148,22 @@ class Options:
     keep_prob: float = DEFAULT_RAND_KEEP_PROB
     force_seed: Optional[str] = None
     threads: int = 1
+    pipeline: int = 1
+    best_of: int = 1
+    schedule: str = "round-robin"
     use_network: bool = False
     network_debug: bool = False
     network_priority: float = 1.0
     no_context_output: bool = False
     debug_mode: bool = False
     speed: int = 100
+    throttle: Optional[ThrottleTarget] = None
+    batch: bool = False
+    batch_budget: float = DEFAULT_BATCH_BUDGET
+    batch_iterations: Optional[int] = None
+    batch_stall: float = DEFAULT_BATCH_STALL
+    batch_total: Optional[float] = None
+    batch_summary: str = DEFAULT_BATCH_SUMMARY
 
 
 def restricted_float(lo: float, hi: float) -> Callable[[str], float]:
@@ -102,6 +182,13 @@ def restricted_float(lo: float, hi: float) -> Callable[[str], float]:
     return convert
 
 
+def throttle_target(x: str) -> ThrottleTarget:
+    try:
+        return parse_throttle(x)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"invalid --throttle value: {e}")
+
+
 @dataclass
 class EvalContext:
     options: Options
@@ -112,12 +199,31 @@ class EvalContext:
     internal_error_stack_traces: Set[str] = field(default_factory=set)
     overall_profiler: Profiler = field(default_factory=Profiler)
     permuters: List[Permuter] = field(default_factory=list)
+    # Learned randomization weights with --adaptive-weights, by permuter index.
+    bandits: Dict[int, PassBandit] = field(default_factory=dict)
+    # With --search=population, the authoritative copies of the populations
+    # that workers pick candidates from, by permuter index.
+    populations: Dict[int, Population] = field(default_factory=dict)
+    # With --search=tempering, swap decisions, by permuter index.
+    exchanges: Dict[int, ReplicaExchange] = field(default_factory=dict)
+    # Checkpoint identities, by permuter index; see cache_namespace.
+    checkpoint_namespaces: List[bytes] = field(default_factory=list)
+    # Progress through the seeds of permuters that don't randomize, by
+    # permuter index.
+    seed_progress: Dict[int, SeedProgress] = field(default_factory=dict)
+    last_checkpoint: float = field(default_factory=time.monotonic)
+    last_timings_dump: float = field(default_factory=time.monotonic)
+    # Time spent evaluating candidates locally, by permuter index.
+    perm_time: List[float] = field(default_factory=list)
+    # With --throttle, decides how many local workers run.
+    governor: Optional[Governor] = None
 
 
 def write_candidate(
     perm: Permuter, result: CandidateResult, no_context_output: bool
-) -> None:
-    """Write the candidate's C source and score to the next output directory"""
+) -> str:
+    """Write the candidate's C source and score to the next output directory,
+    returning its path"""
     ctr = 0
     while True:
         ctr += 1
@@ -140,6 +246,27 @@ def write_candidate(
     with open(os.path.join(output_dir, "diff.txt"), "x", encoding="utf-8") as f:
         f.write(perm.diff(source) + "\n")
     print(f"wrote to {output_dir}")
+    return output_dir
+
+
+def describe_result(
+    permuter: Permuter, score_value: int, former_best: int
+) -> Tuple[str, str]:
+    """Return the color and message to print for a result that is being
+    output, given the best score before it."""
+    if score_value < former_best:
+        color = "\u001b[32;1m"
+        msg = f"found new best score! ({score_value} vs {permuter.base_score})"
+    elif score_value == former_best:
+        color = "\u001b[32;1m"
+        msg = f"tied best score! ({score_value} vs {permuter.base_score})"
+    elif score_value < permuter.base_score:
+        color = "\u001b[33m"
+        msg = f"found a better score! ({score_value} vs {permuter.base_score})"
+    else:
+        color = "\u001b[33m"
+        msg = f"found different asm with same score ({score_value})"
+    return color, msg
 
 
 def post_score(
@@ -175,13 +302,42 @@ def post_score(
     score_value = result.score
 
     if profiler is not None:
-        for stattype in profiler.time_stats:
-            context.overall_profiler.add_stat(stattype, profiler.time_stats[stattype])
+        context.overall_profiler.merge(profiler)
+        maybe_dump_timings(context)
 
     context.iteration += 1
     if score_value == permuter.scorer.PENALTY_INF:
-        disp_score = "inf"
         context.errors += 1
+
+    if permuter.should_output(result):
+        former_best = permuter.best_score
+        permuter.record_result(result)
+        permuter.publish_result(result)
+        color, msg = describe_result(permuter, score_value, former_best)
+        context.printer.print(msg, permuter, who, color=color)
+        write_candidate(permuter, result, context.options.no_context_output)
+    print_status(context, permuter, score_value)
+    return score_value == 0
+
+
+def post_stats(context: EvalContext, stats: WorkStats) -> None:
+    """Count the results that a local worker summed up instead of sending."""
+    permuter = context.permuters[stats.perm_index]
+    if stats.profiler is not None:
+        context.overall_profiler.merge(stats.profiler)
+        maybe_dump_timings(context)
+    context.iteration += stats.iterations
+    context.errors += stats.errors
+    context.perm_time[stats.perm_index] += stats.seconds
+    if stats.last_score is not None:
+        print_status(context, permuter, stats.last_score)
+
+
+def print_status(context: EvalContext, permuter: Permuter, score_value: int) -> None:
+    if context.options.quiet:
+        return
+    if score_value == permuter.scorer.PENALTY_INF:
+        disp_score = "inf"
     else:
         disp_score = str(score_value)
 
@@ -189,39 +345,130 @@ def post_score(
     if context.internal_errors:
         status_line += f"{context.internal_errors} permuter failures, "
     status_line += f"score = {disp_score}"
+    for exchange in context.exchanges.values():
+        status_line += ", " + exchange.get_str_stats()
+    total_time = sum(context.perm_time)
+    if len(context.permuters) > 1 and total_time > 0:
+        shares = ", ".join(
+            f"{p.unique_name} {round(100 * t / total_time)}%"
+            for p, t in zip(context.permuters, context.perm_time)
+        )
+        status_line += f", time: {shares}"
+    if context.governor is not None:
+        status_line += ", " + context.governor.get_str_stats()
     if context.options.show_timings:
         status_line += "  \t" + context.overall_profiler.get_str_stats()
+    context.printer.progress(status_line)
 
-    if permuter.should_output(result):
-        former_best = permuter.best_score
-        permuter.record_result(result)
-        if score_value < former_best:
-            color = "\u001b[32;1m"
-            msg = f"found new best score! ({score_value} vs {permuter.base_score})"
-        elif score_value == former_best:
-            color = "\u001b[32;1m"
-            msg = f"tied best score! ({score_value} vs {permuter.base_score})"
-        elif score_value < permuter.base_score:
-            color = "\u001b[33m"
-            msg = f"found a better score! ({score_value} vs {permuter.base_score})"
-        else:
-            color = "\u001b[33m"
-            msg = f"found different asm with same score ({score_value})"
-        context.printer.print(msg, permuter, who, color=color)
-        write_candidate(permuter, result, context.options.no_context_output)
-    if not context.options.quiet:
-        context.printer.progress(status_line)
-    return score_value == 0
+
+def update_search(
+    context: EvalContext, perm_index: int, result: EvalResult
+) -> List[Control]:
+    """Feed a result back into the search state kept by the parent process:
+    learned weights and populations. Returns the changes that should be passed
+    on to the workers."""
+    if not isinstance(result, CandidateResult):
+        return []
+    ret: List[Control] = []
+    bandit = context.bandits.get(perm_index)
+    if (
+        bandit is not None
+        and result.pass_outcome is not None
+        and bandit.record(*result.pass_outcome)
+    ):
+        ret.append(WeightUpdate(perm_index, bandit.weights()))
+    population = context.populations.get(perm_index)
+    if population is not None and result.snapshot is not None:
+        assert result.hash is not None
+        entry = PopulationEntry(result.score, result.hash, result.snapshot)
+        if population.add(entry):
+            ret.append(PopulationUpdate(perm_index, entry))
+    return ret
+
+
+def update_search_stats(context: EvalContext, stats: WorkStats) -> List[Control]:
+    """Like update_search, for the pass outcomes summed up by a local worker."""
+    bandit = context.bandits.get(stats.perm_index)
+    if bandit is None:
+        return []
+    send = False
+    for (pass_name, outcome), count in stats.pass_outcomes.items():
+        for _ in range(count):
+            if bandit.record(pass_name, outcome):
+                send = True
+    return [WeightUpdate(stats.perm_index, bandit.weights())] if send else []
+
+
+def num_seed_shards(options: Options) -> int:
+    """Seeds are split into one shard per local worker, plus one that is handed
+    out to permuter@home servers."""
+    return max(options.threads + int(options.use_network), 1)
+
+
+def shard_seed_starts(context: EvalContext, shard: int) -> List[int]:
+    """Return how many seeds of a shard to skip for each permuter, because
+    they were evaluated by earlier runs."""
+    ret: List[int] = []
+    for perm_index in range(len(context.permuters)):
+        progress = context.seed_progress.get(perm_index)
+        ret.append(progress.shard_start(shard) if progress is not None else 0)
+    return ret
+
+
+def shard_seed_iterators(
+    permuters: List[Permuter], starts: List[int], shard: int, num_shards: int
+) -> List[Iterator[int]]:
+    """Create iterators over a shard of seeds for each permuter."""
+    return [
+        permuter.seed_iterator(start, shard=shard, num_shards=num_shards)
+        for permuter, start in zip(permuters, starts)
+    ]
+
+
+def make_scheduler(
+    options: Options, permuters: List[Permuter]
+) -> Optional[SeedScheduler]:
+    if options.schedule == "round-robin" or len(permuters) < 2:
+        return None
+    return SeedScheduler(options.schedule, [p.priority for p in permuters])
+
+
+def needs_throttling(options: Options) -> bool:
+    return options.throttle is not None or options.speed != 100
+
+
+def start_throttling(context: EvalContext, duties: MutableSequence[float]) -> None:
+    """Set the share of time each local worker runs, for --speed, or start a
+    governor that keeps adjusting it, for --throttle."""
+    options = context.options
+    if options.throttle is not None:
+        context.governor = Governor(options.throttle, duties)
+    else:
+        for i in range(len(duties)):
+            duties[i] = options.speed / 100
 
 
-def cycle_seeds(permuters: List[Permuter]) -> Iterable[Tuple[int, int]]:
+def cycle_seeds(
+    seed_iterators: List[Iterator[int]], scheduler: Optional[SeedScheduler] = None
+) -> Iterable[Tuple[int, int]]:
     """
-    Return all possible (permuter index, seed) pairs, cycling over permuters.
+    Return all possible (permuter index, seed) pairs, cycling over permuters,
+    or in the order a scheduler picks them.
     If a permuter is randomized, it will keep repeating seeds infinitely.
     """
+    if scheduler is not None:
+        active = list(range(len(seed_iterators)))
+        while active:
+            perm_ind = scheduler.pick(active)
+            seed = next(seed_iterators[perm_ind], None)
+            if seed is None:
+                active.remove(perm_ind)
+            else:
+                yield perm_ind, seed
+        return
+
     iterators: List[Iterator[Tuple[int, int]]] = []
-    for perm_ind, permuter in enumerate(permuters):
-        it = permuter.seed_iterator()
+    for perm_ind, it in enumerate(seed_iterators):
         iterators.append(zip(itertools.repeat(perm_ind), it))
 
     i = 0
@@ -238,74 +485,340 @@ def cycle_seeds(permuters: List[Permuter]) -> Iterable[Tuple[int, int]]:
 
 def multiprocess_worker(
     permuters: List[Permuter],
-    input_queue: "Queue[Task]",
+    seed_starts: List[int],
+    shard: int,
+    num_shards: int,
     output_queue: "Queue[Feedback]",
+    stop_event: "multiprocessing.synchronize.Event",
+    control_queue: "Optional[Queue[Control]]" = None,
+    replica: Optional[Tuple[int, float]] = None,
+    scheduler: Optional[SeedScheduler] = None,
+    duties: Optional[MutableSequence[float]] = None,
 ) -> None:
     try:
-        while True:
-            # Read a work item from the queue. If none is immediately available,
-            # tell the main thread to fill the queues more, and then block on
-            # the queue.
-            queue_item: Task
-            try:
-                queue_item = input_queue.get(block=False)
-            except queue.Empty:
-                output_queue.put((NeedMoreWork(), -1, None))
-                queue_item = input_queue.get()
-            if isinstance(queue_item, Finished):
-                output_queue.put((queue_item, -1, None))
-                output_queue.close()
-                break
-            permuter_index, seed = queue_item
+        if replica is not None:
+            for permuter in permuters:
+                permuter.set_replica(*replica)
+        # Results are sent to the main thread in batches, to keep it from
+        # becoming a bottleneck with many workers. Most results are only
+        # counted; just the noteworthy ones are sent as is.
+        batch: List[WorkDone] = []
+        stats: Dict[int, WorkStats] = {}
+        last_send = time.monotonic()
+
+        def get_stats(permuter_index: int) -> WorkStats:
+            if permuter_index not in stats:
+                stats[permuter_index] = WorkStats(permuter_index)
+            return stats[permuter_index]
+
+        def add_result(permuter_index: int, result: EvalResult) -> None:
             permuter = permuters[permuter_index]
-
-            start = time.time()
-
-            result = permuter.try_eval_candidate(seed)
             if isinstance(result, CandidateResult) and permuter.should_output(result):
                 permuter.record_result(result)
+            if permuter.is_noteworthy(result):
+                batch.append(WorkDone(permuter_index, result))
+            else:
+                assert isinstance(result, CandidateResult)
+                get_stats(permuter_index).add(result, permuter.scorer.PENALTY_INF)
+            replica_state = permuter.replica_state(permuter_index)
+            if replica_state is not None:
+                output_queue.put((replica_state, -1, None))
+
+        seed_iterators = shard_seed_iterators(permuters, seed_starts, shard, num_shards)
+        for permuter_index, seed in cycle_seeds(seed_iterators, scheduler):
+            if stop_event.is_set():
+                break
+            permuter = permuters[permuter_index]
+
+            # Pick up any changes to the search state from the parent.
+            while control_queue is not None:
+                try:
+                    message = control_queue.get(block=False)
+                except queue.Empty:
+                    break
+                permuters[message.perm_index].apply_control(message)
 
-            if permuter.speed != 100:
-                end = time.time()
-                
-                sleep_time = (end - start) * ((100 / permuter.speed) - 1)
-                time.sleep(sleep_time)
+            start = time.time()
+            best_score = permuter.known_best_score()
 
-            output_queue.put((WorkDone(permuter_index, result), -1, None))
-            output_queue.put((NeedMoreWork(), -1, None))
+            if permuter.best_of > 1:
+                results = permuter.try_eval_best_of(seed)
+            elif permuter.pipeline > 1:
+                results = permuter.submit_candidate(seed)
+            else:
+                results = [permuter.try_eval_candidate(seed)]
+            for result in results:
+                add_result(permuter_index, result)
+
+            end = time.time()
+            get_stats(permuter_index).seconds += end - start
+            if scheduler is not None:
+                improved = permuter.known_best_score() < best_score
+                scheduler.record(permuter_index, end - start, improved)
+
+            if time.monotonic() - last_send >= RESULT_BATCH_INTERVAL:
+                output_queue.put(
+                    (WorkBatch(shard, batch, list(stats.values())), -1, None)
+                )
+                batch = []
+                stats = {}
+                last_send = time.monotonic()
+
+            if duties is not None:
+                throttle(duties, shard, end - start, stop_event)
+        for permuter_index, permuter in enumerate(permuters):
+            for result in permuter.drain_candidates():
+                add_result(permuter_index, result)
+        if batch or stats:
+            output_queue.put((WorkBatch(shard, batch, list(stats.values())), -1, None))
+        output_queue.put((Finished(), -1, None))
+        output_queue.close()
     except KeyboardInterrupt:
         # Don't clutter the output with stack traces; Ctrl+C is the expected
         # way to quit and sends KeyboardInterrupt to all processes.
         # A heartbeat thing here would be good but is too complex.
         # Don't join the queue background thread -- thread joins in relation
         # to KeyboardInterrupt usually result in deadlocks.
-        input_queue.cancel_join_thread()
         output_queue.cancel_join_thread()
 
 
+def print_exit_summary(context: EvalContext) -> None:
+    profiler = context.overall_profiler
+    if context.options.show_timings and profiler.histograms:
+        print(profiler.get_latency_str())
+    if context.options.show_timings and profiler.pass_stats:
+        print(profiler.get_pass_stats_str())
+    dump_timings(context)
+    for perm_index, bandit in context.bandits.items():
+        permuter = context.permuters[perm_index]
+        print(f"[{permuter.unique_name}] learned randomization weights:")
+        print(bandit.get_str_stats())
+        weights_file = os.path.join(permuter.dir, LEARNED_WEIGHTS_FILE)
+        with open(weights_file, "w", encoding="utf-8") as f:
+            f.write(bandit.weight_overrides_toml())
+        print(f"wrote {weights_file}")
+
+
+def resume_caveats(options: Options, checkpoint: Checkpoint) -> List[str]:
+    """Parts of a run's state that checkpoints don't capture, and that a
+    resumed run therefore starts over with, or that it won't get to."""
+    ret = []
+    if checkpoint.unanswered_seeds and not options.use_network:
+        ret.append(
+            f"{len(checkpoint.unanswered_seeds)} seeds handed out to "
+            "permuter@home before are only tried again with -J"
+        )
+    if options.threads > 1 and options.disk_cache is None:
+        ret.append(
+            "scores cached by worker processes are lost, so sources seen "
+            "before may be compiled again (--disk-cache keeps them)"
+        )
+    if options.search in ("anneal", "tempering"):
+        ret.append(f"--search={options.search} chains restart from the base source")
+    return ret
+
+
+def checkpoint_interval(options: Options) -> float:
+    """Seconds between checkpoints, or 0 if the run doesn't save any. Unless
+    given explicitly, checkpoints are only saved with --resume."""
+    if options.checkpoint_interval is not None:
+        return options.checkpoint_interval
+    return DEFAULT_CHECKPOINT_INTERVAL if options.resume else 0.0
+
+
+def save_checkpoints(context: EvalContext) -> None:
+    context.last_checkpoint = time.monotonic()
+    if not checkpoint_interval(context.options):
+        return
+    for perm_index, namespace in enumerate(context.checkpoint_namespaces):
+        permuter = context.permuters[perm_index]
+        progress = context.seed_progress.get(perm_index)
+        checkpoint = permuter.checkpoint(
+            namespace,
+            seed_position=progress.position() if progress is not None else 0,
+            unanswered_seeds=progress.unanswered() if progress is not None else [],
+            population=context.populations.get(perm_index),
+            bandit=context.bandits.get(perm_index),
+        )
+        save_checkpoint(os.path.join(permuter.dir, CHECKPOINT_FILE), checkpoint)
+
+
+def dump_timings(context: EvalContext) -> None:
+    """Write the timings so far to the --timings-file, atomically replacing
+    it."""
+    context.last_timings_dump = time.monotonic()
+    path = context.options.timings_file
+    if path is None:
+        return
+    timings = context.overall_profiler.to_json()
+    timings["iterations"] = context.iteration
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(timings, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def maybe_dump_timings(context: EvalContext) -> None:
+    if (
+        context.options.timings_file is not None
+        and time.monotonic() - context.last_timings_dump >= TIMINGS_INTERVAL
+    ):
+        dump_timings(context)
+
+
+def maybe_save_checkpoints(context: EvalContext) -> None:
+    interval = checkpoint_interval(context.options)
+    if interval and time.monotonic() - context.last_checkpoint >= interval:
+        save_checkpoints(context)
+
+
 def run(options: Options) -> List[int]:
     last_time = time.time()
+    context = EvalContext(options)
     try:
 
         def heartbeat() -> None:
             nonlocal last_time
             last_time = time.time()
 
-        return run_inner(options, heartbeat)
+        return run_inner(context, heartbeat)
     except KeyboardInterrupt:
         if time.time() - last_time > 5:
             print()
             print("Aborting stuck process.")
             raise
         print()
+        save_checkpoints(context)
+        print_exit_summary(context)
         print("Exiting.")
         sys.exit(0)
 
 
-def run_inner(options: Options, heartbeat: Callable[[], None]) -> List[int]:
+def create_permuter(
+    options: Options,
+    d: str,
+    *,
+    anneal_schedule: Optional[AnnealSchedule] = None,
+    force_seed: Optional[int] = None,
+    force_rng_seed: Optional[int] = None,
+) -> Tuple[Permuter, bytes]:
+    """Set up a permuter for an input directory, returning it together with
+    its checkpoint identity. Raises CandidateConstructionFailure if the
+    directory is unusable."""
+    compile_cmd = os.path.join(d, "compile.sh")
+    target_o = os.path.join(d, "target.o")
+    base_c = os.path.join(d, "base.c")
+    for fname in [compile_cmd, target_o, base_c]:
+        if not os.path.isfile(fname):
+            raise CandidateConstructionFailure(f"Missing file {fname}")
+    if not os.stat(compile_cmd).st_mode & 0o100:
+        raise CandidateConstructionFailure(f"{compile_cmd} must be marked executable.")
+
+    settings: Mapping[str, object] = get_settings(d)
+
+    compiler_type = json_prop(settings, "compiler_type", str, "base")
+
+    default_weights = get_default_randomization_weights(compiler_type)
+    weight_overrides = json_dict(
+        json_prop(settings, "weight_overrides", dict, {}), float
+    )
+    randomization_weights = merge_randomization_weights(
+        default_weights, weight_overrides
+    )
+
+    fn_name: Optional[str] = None
+    if "func_name" in settings:
+        fn_name = json_prop(settings, "func_name", str)
+
+    if not fn_name:
+        try:
+            with open(os.path.join(d, "function.txt"), encoding="utf-8") as f:
+                fn_name = f.read().strip()
+        except FileNotFoundError:
+            pass
+
+    if fn_name:
+        print(f"{base_c} ({fn_name})")
+    else:
+        print(base_c)
+
+    priority = json_prop(settings, "priority", float, 1.0)
+    if priority <= 0:
+        raise CandidateConstructionFailure(f"priority in {d} must be positive")
+
+    compile_server: Optional[str] = None
+    if "compile_server" in settings:
+        compile_server = json_prop(settings, "compile_server", str)
+        print(f"Using compile server: {compile_server}")
+
+    compiler = Compiler(
+        compile_cmd,
+        show_errors=options.show_errors,
+        debug_mode=options.debug_mode,
+        server_cmd=compile_server,
+    )
+    scorer = Scorer(
+        target_o,
+        stack_differences=options.stack_differences,
+        algorithm=options.algorithm,
+        debug_mode=options.debug_mode,
+        builtin_disasm=options.builtin_disasm,
+    )
+    checkpoint_namespace = cache_namespace(
+        [compile_cmd, target_o, base_c],
+        f"{options.stack_differences}:{options.algorithm}",
+    )
+    disk_cache: Optional[DiskCache] = None
+    if options.disk_cache is not None:
+        cache_path = options.disk_cache or os.path.join(d, DEFAULT_DISK_CACHE)
+        namespace = cache_namespace(
+            [compile_cmd, target_o],
+            f"{options.stack_differences}:{options.algorithm}",
+        )
+        disk_cache = DiskCache(
+            cache_path,
+            namespace=namespace,
+            max_bytes=options.disk_cache_size * 2**20,
+        )
+    c_source = preprocess(base_c)
+
+    permuter = Permuter(
+        d,
+        fn_name,
+        compiler,
+        scorer,
+        base_c,
+        c_source,
+        randomization_weights=randomization_weights,
+        force_seed=force_seed,
+        force_rng_seed=force_rng_seed,
+        keep_prob=options.keep_prob,
+        need_profiler=options.show_timings or options.timings_file is not None,
+        need_all_sources=options.print_diffs,
+        show_errors=options.show_errors,
+        best_only=options.best_only,
+        better_only=options.better_only,
+        score_threshold=options.score_threshold,
+        debug_mode=options.debug_mode,
+        speed=options.speed,
+        disk_cache=disk_cache,
+        cache_memory=options.cache_memory * 2**20,
+        adaptive_weights=options.adaptive_weights,
+        search=options.search,
+        population_size=options.population_size,
+        anneal_schedule=anneal_schedule,
+        pipeline=options.pipeline,
+        best_of=options.best_of,
+    )
+    permuter.priority = priority
+    return permuter, checkpoint_namespace
+
+
+def run_inner(context: EvalContext, heartbeat: Callable[[], None]) -> List[int]:
     print("Loading...")
 
-    context = EvalContext(options)
+    options = context.options
 
     force_seed: Optional[int] = None
     force_rng_seed: Optional[int] = None
@@ -314,85 +827,78 @@ def run_inner(options: Options, heartbeat: Callable[[], None]) -> List[int]:
         force_rng_seed = seed_parts[-1]
         force_seed = 0 if len(seed_parts) == 1 else seed_parts[0]
 
+    anneal_schedule = AnnealSchedule(
+        start_temp=options.anneal_temp,
+        period=options.anneal_iterations or options.anneal_time,
+        by_iterations=options.anneal_iterations is not None,
+    )
+
     name_counts: Dict[str, int] = {}
-    for i, d in enumerate(options.directories):
+    for d in options.directories:
         heartbeat()
-        compile_cmd = os.path.join(d, "compile.sh")
-        target_o = os.path.join(d, "target.o")
-        base_c = os.path.join(d, "base.c")
-        for fname in [compile_cmd, target_o, base_c]:
-            if not os.path.isfile(fname):
-                print(f"Missing file {fname}", file=sys.stderr)
-                sys.exit(1)
-        if not os.stat(compile_cmd).st_mode & 0o100:
-            print(f"{compile_cmd} must be marked executable.", file=sys.stderr)
-            sys.exit(1)
-
-        settings: Mapping[str, object] = get_settings(d)
-
-        compiler_type = json_prop(settings, "compiler_type", str, "base")
-
-        default_weights = get_default_randomization_weights(compiler_type)
-        weight_overrides = json_dict(
-            json_prop(settings, "weight_overrides", dict, {}), float
-        )
-        randomization_weights = merge_randomization_weights(
-            default_weights, weight_overrides
-        )
-
-        fn_name: Optional[str] = None
-        if "func_name" in settings:
-            fn_name = json_prop(settings, "func_name", str)
-
-        if not fn_name:
-            try:
-                with open(os.path.join(d, "function.txt"), encoding="utf-8") as f:
-                    fn_name = f.read().strip()
-            except FileNotFoundError:
-                pass
-
-        if fn_name:
-            print(f"{base_c} ({fn_name})")
-        else:
-            print(base_c)
-
-        compiler = Compiler(
-            compile_cmd, show_errors=options.show_errors, debug_mode=options.debug_mode
-        )
-        scorer = Scorer(
-            target_o,
-            stack_differences=options.stack_differences,
-            algorithm=options.algorithm,
-            debug_mode=options.debug_mode,
-        )
-        c_source = preprocess(base_c)
-
         try:
-            permuter = Permuter(
+            permuter, checkpoint_namespace = create_permuter(
+                options,
                 d,
-                fn_name,
-                compiler,
-                scorer,
-                base_c,
-                c_source,
-                randomization_weights=randomization_weights,
+                anneal_schedule=anneal_schedule,
                 force_seed=force_seed,
                 force_rng_seed=force_rng_seed,
-                keep_prob=options.keep_prob,
-                need_profiler=options.show_timings,
-                need_all_sources=options.print_diffs,
-                show_errors=options.show_errors,
-                best_only=options.best_only,
-                better_only=options.better_only,
-                score_threshold=options.score_threshold,
-                debug_mode=options.debug_mode,
-                speed=options.speed,
             )
         except CandidateConstructionFailure as e:
             print(e.message, file=sys.stderr)
             sys.exit(1)
+        randomization_weights = permuter.randomization_weights
+
+        checkpoint = None
+        if options.resume:
+            checkpoint_file = os.path.join(d, CHECKPOINT_FILE)
+            try:
+                checkpoint = load_checkpoint(checkpoint_file, checkpoint_namespace)
+            except CheckpointMismatch as e:
+                print(f"Ignoring checkpoint: {e.message}", file=sys.stderr)
+            if checkpoint is None:
+                print(f"Not resuming; no usable {checkpoint_file}.")
+            else:
+                permuter.restore(checkpoint)
+                print(f"Resuming from {checkpoint_file}.")
+                for caveat in resume_caveats(options, checkpoint):
+                    print(f"Note: {caveat}.", file=sys.stderr)
+
+        track_seeds = not permuter.is_random() and force_seed is None
+        if track_seeds:
+            context.seed_progress[len(context.permuters)] = SeedProgress(
+                checkpoint.seed_position if checkpoint is not None else 0,
+                num_seed_shards(options),
+                checkpoint.unanswered_seeds if checkpoint is not None else [],
+            )
 
+        if options.adaptive_weights and permuter.is_random():
+            bandit = PassBandit(randomization_weights)
+            if (
+                checkpoint is not None
+                and checkpoint.bandit is not None
+                and checkpoint.bandit.base_weights == bandit.base_weights
+            ):
+                bandit = checkpoint.bandit
+                permuter.set_randomization_weights(bandit.weights())
+            context.bandits[len(context.permuters)] = bandit
+        if permuter.population is not None:
+            context.populations[len(context.permuters)] = permuter.population.copy()
+        if options.search == "tempering" and permuter.annealer is not None:
+            # Replica i runs in local worker i.
+            if options.threads > 1:
+                context.exchanges[len(context.permuters)] = ReplicaExchange(
+                    [
+                        permuter.annealer.start_temp * replica_level(i, options.threads)
+                        for i in range(options.threads)
+                    ]
+                )
+            else:
+                # A single replica, at the starting temperature.
+                permuter.set_replica(0, replica_level(0, 1))
         context.permuters.append(permuter)
+        context.perm_time.append(0.0)
+        context.checkpoint_namespaces.append(checkpoint_namespace)
         name_counts[permuter.fn_name] = name_counts.get(permuter.fn_name, 0) + 1
     print()
 
@@ -403,44 +909,84 @@ def run_inner(options: Options, heartbeat: Callable[[], None]) -> List[int]:
     for permuter in context.permuters:
         if name_counts[permuter.fn_name] > 1:
             permuter.unique_name += f" ({permuter.dir})"
-        print(f"[{permuter.unique_name}] base score = {permuter.best_score}")
+        line = f"[{permuter.unique_name}] base score = {permuter.base_score}"
+        if permuter.best_score < permuter.base_score:
+            line += f", best so far = {permuter.best_score}"
+        print(line)
 
     if options.debug_mode:
         print("End of Debug Mode... Exiting")
         sys.exit(0)
 
     found_zero = False
-    if options.threads == 1 and not options.use_network:
+    if (
+        options.threads == 1
+        and not options.use_network
+        and options.pipeline == 1
+        and options.best_of == 1
+    ):
         # Simple single-threaded mode. This is not technically needed, but
         # makes the permuter easier to debug.
-        for permuter_index, seed in cycle_seeds(context.permuters):
+        seed_iterators = shard_seed_iterators(
+            context.permuters, shard_seed_starts(context, 0), 0, 1
+        )
+        scheduler = make_scheduler(options, context.permuters)
+        duties: Optional[List[float]] = None
+        if needs_throttling(options):
+            duties = [1.0]
+            start_throttling(context, duties)
+        for permuter_index, seed in cycle_seeds(seed_iterators, scheduler):
             heartbeat()
             permuter = context.permuters[permuter_index]
 
             start = time.time()
+            best_score = permuter.best_score
 
             result = permuter.try_eval_candidate(seed)
-            if post_score(context, permuter, result, None):
+            end = time.time()
+            context.perm_time[permuter_index] += end - start
+            if scheduler is not None:
+                improved = isinstance(result, CandidateResult) and (
+                    result.score < best_score
+                )
+                scheduler.record(permuter_index, end - start, improved)
+            is_zero = post_score(context, permuter, result, None)
+            progress = context.seed_progress.get(permuter_index)
+            if progress is not None:
+                progress.finish(0)
+            if is_zero:
                 found_zero = True
                 if options.stop_on_zero:
                     break
 
-            if permuter.speed != 100:
-                end = time.time()
+            for message in update_search(context, permuter_index, result):
+                permuter.apply_control(message)
+            maybe_save_checkpoints(context)
 
-                sleep_time = (end - start) * ((100 / permuter.speed) - 1)
-                time.sleep(sleep_time)
+            if duties is not None:
+                if context.governor is not None:
+                    context.governor.record(end - start)
+                    context.governor.update()
+                throttle(duties, 0, time.time() - start)
     else:
-        seed_iterators: List[Optional[Iterator[int]]] = [
-            permuter.seed_iterator()
-            for perm_ind, permuter in enumerate(context.permuters)
-        ]
-        seed_iterators_remaining = len(seed_iterators)
-        next_iterator_index = 0
+        # Local workers generate seeds from shards of their own, and only
+        # report back results. Seeds for permuter@home are handed out from
+        # the last shard by the main thread.
+        net_seed_iterators: List[Optional[Iterator[int]]] = []
+        if options.use_network:
+            net_seed_iterators.extend(
+                shard_seed_iterators(
+                    context.permuters,
+                    shard_seed_starts(context, options.threads),
+                    options.threads,
+                    num_seed_shards(options),
+                )
+            )
+        net_seeds_remaining = len(net_seed_iterators)
 
         # Create queues.
-        worker_task_queue: "Queue[Task]" = Queue()
         feedback_queue: "Queue[Feedback]" = Queue()
+        stop_event = multiprocessing.Event()
 
         # Connect to network and create client threads and queues.
         net_conns: "List[Tuple[threading.Thread, Queue[Task]]]" = []
@@ -475,12 +1021,49 @@ def run_inner(options: Options, heartbeat: Callable[[], None]) -> List[int]:
             cores_str = plural(int(first_stats[2]), "core")
             print(f"Connected! {servers_str} online ({cores_str}, {clients_str})")
 
-        # Start local worker threads
+        # Let local workers see what has been found so far, so that they don't
+        # send results that would be thrown away.
+        shared: Optional[SharedState] = None
+        if options.threads > 0 and shared_memory is not None:
+            shared = SharedState(len(context.permuters), SHARED_STATE_MEMORY)
+            for perm_index, permuter in enumerate(context.permuters):
+                permuter.share_state(shared, perm_index)
+
+        # With --speed or --throttle, the share of time each local worker
+        # runs, which the workers check between iterations.
+        worker_duties: Optional[MutableSequence[float]] = None
+        if needs_throttling(options) and options.threads > 0:
+            worker_duties = multiprocessing.Array("d", options.threads, lock=False)
+            start_throttling(context, worker_duties)
+
+        # Start local worker threads. If the parent keeps any search state,
+        # each also gets a queue of its own for receiving changes to it.
         processes: List[multiprocessing.Process] = []
+        control_queues: "List[Queue[Control]]" = []
         for i in range(options.threads):
+            control_queue: "Optional[Queue[Control]]" = None
+            if context.bandits or context.populations or context.exchanges:
+                control_queue = Queue()
+                # Updates are only advisory; don't hang on exit trying to
+                # deliver them.
+                control_queue.cancel_join_thread()
+                control_queues.append(control_queue)
             p = multiprocessing.Process(
                 target=multiprocess_worker,
-                args=(context.permuters, worker_task_queue, feedback_queue),
+                args=(
+                    context.permuters,
+                    shard_seed_starts(context, i),
+                    i,
+                    num_seed_shards(options),
+                    feedback_queue,
+                    stop_event,
+                    control_queue,
+                    (i, replica_level(i, options.threads))
+                    if options.search == "tempering"
+                    else None,
+                    make_scheduler(options, context.permuters),
+                    worker_duties,
+                ),
             )
             p.start()
             processes.append(p)
@@ -503,61 +1086,108 @@ def run_inner(options: Options, heartbeat: Callable[[], None]) -> List[int]:
             if source == -1:
                 active_workers -= 1
 
-        def process_result(work: WorkDone, who: Optional[str]) -> bool:
+        def send_control(messages: List[Control]) -> None:
+            for message in messages:
+                for control_queue in control_queues:
+                    control_queue.put(message)
+
+        def process_result(
+            work: WorkDone, who: Optional[str], shard: Optional[int] = None
+        ) -> bool:
             permuter = context.permuters[work.perm_index]
-            return post_score(context, permuter, work.result, who)
+            is_zero = post_score(context, permuter, work.result, who)
+            progress = context.seed_progress.get(work.perm_index)
+            if progress is not None and shard is not None:
+                progress.finish(shard)
+            send_control(update_search(context, work.perm_index, work.result))
+            maybe_save_checkpoints(context)
+            return is_zero
+
+        def process_batch(batch: WorkBatch, who: Optional[str]) -> bool:
+            for stats in batch.stats:
+                if context.governor is not None:
+                    context.governor.record(stats.seconds)
+                post_stats(context, stats)
+                progress = context.seed_progress.get(stats.perm_index)
+                if progress is not None:
+                    progress.finish(batch.shard, stats.iterations)
+                send_control(update_search_stats(context, stats))
+            found = False
+            for work in batch.results:
+                if process_result(work, who, batch.shard):
+                    found = True
+                    if options.stop_on_zero:
+                        break
+            maybe_save_checkpoints(context)
+            return found
+
+        def process_replica_state(state: ReplicaState) -> None:
+            exchange = context.exchanges.get(state.perm_index)
+            if exchange is None:
+                return
+            for replica, new_state in exchange.add_state(state):
+                control_queues[replica].put(
+                    ReplicaSwap(
+                        new_state.perm_index, new_state.snapshot, new_state.score
+                    )
+                )
 
         def get_task(perm_index: int) -> Optional[Tuple[int, int]]:
-            nonlocal next_iterator_index, seed_iterators_remaining
-            if perm_index == -1:
-                while seed_iterators_remaining > 0:
-                    task = get_task(next_iterator_index)
-                    next_iterator_index += 1
-                    next_iterator_index %= len(seed_iterators)
-                    if task is not None:
-                        return task
-            else:
-                it = seed_iterators[perm_index]
-                if it is not None:
-                    seed = next(it, None)
-                    if seed is None:
-                        seed_iterators[perm_index] = None
-                        seed_iterators_remaining -= 1
-                    else:
+            nonlocal net_seeds_remaining
+            it = net_seed_iterators[perm_index]
+            if it is not None:
+                progress = context.seed_progress.get(perm_index)
+                if progress is not None:
+                    seed = progress.take_replay()
+                    if seed is not None:
+                        progress.hand_out(options.threads, seed, replayed=True)
                         return (perm_index, seed)
+                seed = next(it, None)
+                if seed is None:
+                    net_seed_iterators[perm_index] = None
+                    net_seeds_remaining -= 1
+                else:
+                    if progress is not None:
+                        progress.hand_out(options.threads, seed)
+                    return (perm_index, seed)
             return None
 
-        # Feed the task queue with work and read from results queue.
-        # We generally match these up one-by-one to avoid overfilling queues,
-        # but workers can ask us to add more tasks into the system if they run
-        # out of work. (This will happen e.g. at the very beginning, when the
-        # queues are empty.)
-        while seed_iterators_remaining > 0:
+        # Read from the results queue, and feed permuter@home clients with
+        # work when they ask for it, until all seeds have been tried.
+        while active_workers > 0 or net_seeds_remaining > 0:
             heartbeat()
             feedback, source, who = feedback_queue.get()
+            if context.governor is not None:
+                context.governor.update()
             if isinstance(feedback, Finished):
                 process_finish(feedback, source)
             elif isinstance(feedback, Message):
                 context.printer.print(feedback.text, None, who, keep_progress=True)
-            elif isinstance(feedback, WorkDone):
-                if process_result(feedback, who):
+            elif isinstance(feedback, (WorkDone, WorkBatch)):
+                if isinstance(feedback, WorkBatch):
+                    is_zero = process_batch(feedback, who)
+                else:
+                    # Individual results only come from permuter@home.
+                    progress = context.seed_progress.get(feedback.perm_index)
+                    if progress is not None:
+                        progress.answer()
+                    is_zero = process_result(feedback, who)
+                if is_zero:
                     # Found score 0!
                     found_zero = True
                     if options.stop_on_zero:
                         break
+            elif isinstance(feedback, ReplicaState):
+                process_replica_state(feedback)
             elif isinstance(feedback, NeedMoreWork):
                 task = get_task(source)
                 if task is not None:
-                    if source == -1:
-                        worker_task_queue.put(task)
-                    else:
-                        net_conns[source][1].put(task)
+                    net_conns[source][1].put(task)
             else:
                 static_assert_unreachable(feedback)
 
         # Signal workers to stop.
-        for i in range(active_workers):
-            worker_task_queue.put(Finished())
+        stop_event.set()
 
         for conn in net_conns:
             conn[1].put(Finished())
@@ -574,7 +1204,11 @@ def run_inner(options: Options, heartbeat: Callable[[], None]) -> List[int]:
                 if not (options.stop_on_zero and found_zero):
                     if process_result(feedback, who):
                         found_zero = True
-            elif isinstance(feedback, NeedMoreWork):
+            elif isinstance(feedback, WorkBatch):
+                if not (options.stop_on_zero and found_zero):
+                    if process_batch(feedback, who):
+                        found_zero = True
+            elif isinstance(feedback, (NeedMoreWork, ReplicaState)):
                 pass
             else:
                 static_assert_unreachable(feedback)
@@ -583,10 +1217,15 @@ def run_inner(options: Options, heartbeat: Callable[[], None]) -> List[int]:
         for p in processes:
             p.join()
 
+        if shared is not None:
+            shared.close()
+
         # Wait for network connections to close (currently does not happen).
         for conn in net_conns:
             conn[0].join()
 
+    save_checkpoints(context)
+    print_exit_summary(context)
     if found_zero:
         print("\nFound zero score! Exiting.")
     return [permuter.best_score for permuter in context.permuters]
@@ -648,7 +1287,16 @@ def main() -> None:
         "--show-timings",
         dest="show_timings",
         action="store_true",
-        help="Display the time taken by permuting vs. compiling vs. scoring.",
+        help="""Display the time taken by permuting vs. compiling vs. scoring,
+            and on exit, percentiles of the time taken by each step.""",
+    )
+    parser.add_argument(
+        "--timings-file",
+        dest="timings_file",
+        metavar="FILE",
+        help=f"""Every {TIMINGS_INTERVAL:g} seconds and on exit, write counts,
+            totals and percentiles of the time taken by each step of evaluating
+            candidates to FILE, as JSON.""",
     )
     parser.add_argument(
         "--print-diffs",
@@ -699,6 +1347,123 @@ def main() -> None:
         choices=["difflib", "levenshtein"],
         help="Diff algorithm to use",
     )
+    parser.add_argument(
+        "--builtin-disasm",
+        dest="builtin_disasm",
+        action="store_true",
+        help="""Disassemble candidates in-process instead of running objdump.
+            Faster, but only supported for MIPS; other architectures still use
+            objdump. Not used for permuter@home.""",
+    )
+    parser.add_argument(
+        "--disk-cache",
+        dest="disk_cache",
+        metavar="PATH",
+        nargs="?",
+        const="",
+        help=f"""Cache scores of compiled sources in an sqlite database, shared
+            between threads and across runs. Defaults to {DEFAULT_DISK_CACHE}
+            in each function directory.""",
+    )
+    parser.add_argument(
+        "--disk-cache-size",
+        dest="disk_cache_size",
+        metavar="MB",
+        type=int,
+        default=512,
+        help="Maximum size of the disk cache (default: %(default)s MB).",
+    )
+    parser.add_argument(
+        "--cache-memory",
+        dest="cache_memory",
+        metavar="MB",
+        type=int,
+        default=DEFAULT_CACHE_MEMORY // 2**20,
+        help="""Memory to use per thread for remembering scores of already seen
+            sources. Once it is full, the least recently seen ones are
+            forgotten, and get compiled again if they come up. Asm that was
+            already outputted is always remembered (default: %(default)s MB).""",
+    )
+    parser.add_argument(
+        "--adaptive-weights",
+        dest="adaptive_weights",
+        action="store_true",
+        help="""Adjust randomization pass weights on the fly, based on which
+            passes lead to improvements. The learned weights are printed on exit
+            and saved to learned_weights.toml in each directory, in a format that
+            can be pasted into settings.toml.""",
+    )
+    parser.add_argument(
+        "--search",
+        dest="search",
+        choices=["chain", "population", "anneal", "tempering"],
+        default="chain",
+        help="""How to pick the candidates that get randomized. "chain" (the
+            default) keeps randomizing the last candidate with probability
+            --keep-prob, and otherwise starts over. "population" keeps the best
+            distinct candidates found so far, shared between local threads, and
+            picks one of them to randomize each time. "anneal" runs simulated
+            annealing in each thread, moving on to worse candidates with a
+            probability that decreases over time. "tempering" runs each local
+            thread at a different constant temperature, between --anneal-temp
+            and 1/1000 of that, and periodically swaps candidates between
+            threads with neighboring temperatures.""",
+    )
+    parser.add_argument(
+        "--population-size",
+        dest="population_size",
+        metavar="N",
+        type=int,
+        default=DEFAULT_POPULATION_SIZE,
+        help="Number of candidates to keep with --search=population (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--anneal-temp",
+        dest="anneal_temp",
+        metavar="TEMP",
+        type=float,
+        help="""Starting temperature for --search=anneal, in score units
+            (default: 5%% of the base score).""",
+    )
+    anneal_group = parser.add_mutually_exclusive_group()
+    anneal_group.add_argument(
+        "--anneal-time",
+        dest="anneal_time",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_ANNEAL_TIME,
+        help="""Length of a --search=anneal cooling cycle, after which the
+            temperature is reset (default: %(default)s seconds).""",
+    )
+    anneal_group.add_argument(
+        "--anneal-iterations",
+        dest="anneal_iterations",
+        metavar="N",
+        type=int,
+        help="Base the --search=anneal cooling cycle on iterations per thread instead of time.",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help=f"""Continue from the state saved in {CHECKPOINT_FILE} in each
+            directory by an earlier run with --resume or --checkpoint-interval,
+            without re-exploring or re-outputting what it found, and keep
+            saving checkpoints. Score caches of -j workers (unless --disk-cache is
+            used) and --search=anneal/tempering chains are not saved, and
+            start over.""",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        dest="checkpoint_interval",
+        metavar="SECONDS",
+        type=float,
+        help=f"""Save the state of the run to {CHECKPOINT_FILE} in each
+            directory this often, and on exit, for a later --resume. --resume
+            turns this on with an interval of {DEFAULT_CHECKPOINT_INTERVAL:g}
+            seconds; otherwise no checkpoints are saved by default. 0 disables
+            them.""",
+    )
     parser.add_argument(
         "--keep-prob",
         dest="keep_prob",
@@ -716,6 +1481,42 @@ def main() -> None:
         default=0,
         help="Number of own threads to use (default: 1 without -J, 0 with -J).",
     )
+    parser.add_argument(
+        "--pipeline",
+        dest="pipeline",
+        metavar="K",
+        type=int,
+        default=1,
+        help="""Keep up to K candidates compiling and disassembling in the
+            background in each thread, while the next ones are generated.
+            Raises throughput when the compiler is slow, at the cost of
+            randomization being based on slightly older results
+            (default: %(default)s, meaning no pipelining).""",
+    )
+    parser.add_argument(
+        "--schedule",
+        dest="schedule",
+        choices=SCHEDULE_POLICIES,
+        default="round-robin",
+        help="""How to split time between multiple directories. "round-robin"
+            (the default) gives each the same number of iterations, regardless
+            of how long they take. "time" gives each the same amount of time,
+            and "improvement" gives more time to the ones that have improved
+            recently. With both, a directory's share is also scaled by the
+            "priority" value in its settings.toml (default 1).""",
+    )
+    parser.add_argument(
+        "--best-of",
+        dest="best_of",
+        metavar="K",
+        type=int,
+        default=1,
+        help="""Randomize K copies of the current candidate at each step,
+            compile them in parallel, and continue from the best one, unless
+            all are worse. Helps when close to a match, where most changes
+            make things worse. Only for --search=chain
+            (default: %(default)s).""",
+    )
     parser.add_argument(
         "-J",
         dest="use_network",
@@ -768,8 +1569,97 @@ def main() -> None:
         metavar="[1-100]",
         default=100,
     )
+    parser.add_argument(
+        "--throttle",
+        dest="throttle",
+        metavar="TARGET",
+        type=throttle_target,
+        help="""Adjust the number of running local workers on the fly to keep
+            to a target: cpu=PERCENT of the machine's cores, load=N for the
+            1-minute load average, or cgroup[=PERCENT] of the CPU quota of the
+            current cgroup. Workers beyond the target are paused rather than
+            slowed down.""",
+    )
+
+    batch_group = parser.add_argument_group(
+        "batch mode",
+        """Permute every input directory found below the given directories or
+        glob patterns, a few at a time, giving each a budget.""",
+    )
+    batch_group.add_argument(
+        "--batch",
+        dest="batch",
+        action="store_true",
+        help="""Enable batch mode. Functions are set up as workers free up, and
+            retired when they match, run out of budget or stop improving.""",
+    )
+    batch_group.add_argument(
+        "--budget",
+        dest="batch_budget",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_BATCH_BUDGET,
+        help="""Evaluation time to spend on each function, summed over workers;
+            0 for no limit (default: %(default)s).""",
+    )
+    batch_group.add_argument(
+        "--budget-iterations",
+        dest="batch_iterations",
+        metavar="N",
+        type=int,
+        help="Number of iterations to spend on each function.",
+    )
+    batch_group.add_argument(
+        "--stall",
+        dest="batch_stall",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_BATCH_STALL,
+        help="""Retire functions whose best score hasn't improved for this much
+            evaluation time; 0 to never do so (default: %(default)s).""",
+    )
+    batch_group.add_argument(
+        "--total-time",
+        dest="batch_total",
+        metavar="SECONDS",
+        type=float,
+        help="Stop the whole batch after this much wall-clock time.",
+    )
+    batch_group.add_argument(
+        "--summary",
+        dest="batch_summary",
+        metavar="FILE",
+        default=DEFAULT_BATCH_SUMMARY,
+        help="""JSON file to write the outcome for each function to, as the
+            batch progresses (default: %(default)s).""",
+    )
 
     args = parser.parse_args()
+    if args.best_of > 1 and args.search != "chain":
+        parser.error("--best-of only works with --search=chain")
+    if args.throttle is not None and args.speed != 100:
+        parser.error("--throttle and --speed can't be combined")
+    if args.batch:
+        # Batch mode workers only evaluate seeds, one at a time, with none of
+        # the extra machinery of the normal main loop.
+        unsupported = [
+            flag
+            for flag, used in [
+                ("-J", args.use_network),
+                ("--search", args.search != "chain"),
+                ("--resume", args.resume),
+                ("--checkpoint-interval", args.checkpoint_interval is not None),
+                ("--pipeline", args.pipeline != 1),
+                ("--best-of", args.best_of != 1),
+                ("--speed", args.speed != 100),
+                ("--throttle", args.throttle is not None),
+                ("--schedule", args.schedule != "round-robin"),
+                ("--adaptive-weights", args.adaptive_weights),
+            ]
+            if used
+        ]
+        if unsupported:
+            parser.error(f"--batch doesn't work with {', '.join(unsupported)}")
 
     threads = args.threads
     if not threads and not args.use_network:
@@ -779,6 +1669,7 @@ def main() -> None:
         directories=args.directories,
         show_errors=args.show_errors,
         show_timings=args.show_timings,
+        timings_file=args.timings_file,
         print_diffs=args.print_diffs,
         abort_exceptions=args.abort_exceptions,
         score_threshold=args.score_threshold,
@@ -787,19 +1678,46 @@ def main() -> None:
         quiet=args.quiet,
         stack_differences=args.stack_differences,
         algorithm=args.algorithm,
+        builtin_disasm=args.builtin_disasm,
+        disk_cache=args.disk_cache,
+        disk_cache_size=args.disk_cache_size,
+        cache_memory=args.cache_memory,
+        adaptive_weights=args.adaptive_weights,
+        search=args.search,
+        population_size=args.population_size,
+        anneal_temp=args.anneal_temp,
+        anneal_time=args.anneal_time,
+        anneal_iterations=args.anneal_iterations,
+        resume=args.resume,
+        checkpoint_interval=args.checkpoint_interval,
         stop_on_zero=args.stop_on_zero,
         keep_prob=args.keep_prob,
         force_seed=args.force_seed,
         threads=threads,
+        pipeline=max(args.pipeline, 1),
+        best_of=max(args.best_of, 1),
+        schedule=args.schedule,
         use_network=args.use_network,
         network_debug=args.network_debug,
         network_priority=args.network_priority,
         no_context_output=args.no_context_output,
         debug_mode=args.debug_mode,
         speed=args.speed,
+        throttle=args.throttle,
+        batch=args.batch,
+        batch_budget=args.batch_budget,
+        batch_iterations=args.batch_iterations,
+        batch_stall=args.batch_stall,
+        batch_total=args.batch_total,
+        batch_summary=args.batch_summary,
     )
 
-    run(options)
+    if options.batch:
+        from .batch import run_batch
+
+        run_batch(options)
+    else:
+        run(options)
 
 
 if __name__ == "__main__":
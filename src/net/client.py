@@ -26,14 +26,15 @@ from .core import (
 )
 
 
-def _profiler_from_json(obj: dict) -> Profiler:
-    ret = Profiler()
+def _profiler_from_json(ret: Profiler, obj: dict) -> None:
     for key in obj:
         assert isinstance(key, str), "json properties are strings"
+        if key not in Profiler.StatType.__members__:
+            # Sent by a newer server.
+            continue
         stat = Profiler.StatType[key]
         time = json_prop(obj, key, float)
         ret.add_stat(stat, time)
-    return ret
 
 
 def _result_from_json(obj: dict, source: Optional[str]) -> EvalResult:
@@ -42,7 +43,10 @@ def _result_from_json(obj: dict, source: Optional[str]) -> EvalResult:
 
     profiler: Optional[Profiler] = None
     if "profiler" in obj:
-        profiler = _profiler_from_json(json_prop(obj, "profiler", dict))
+        profiler = Profiler()
+        _profiler_from_json(profiler, json_prop(obj, "profiler", dict))
+        if "profiler_detail" in obj:
+            _profiler_from_json(profiler, json_prop(obj, "profiler_detail", dict))
     return CandidateResult(
         score=json_prop(obj, "score", int),
         hash=json_prop(obj, "hash", str) if "hash" in obj else None,
@@ -174,8 +174,17 @@ def _send_result(item: WorkDone, port: Port) -> None:
     if res.hash is not None:
         obj["hash"] = res.hash
     if res.profiler is not None:
+        # The finer-grained stats go separately, since older clients only
+        # know about the phases.
         obj["profiler"] = {
-            st.name: res.profiler.time_stats[st] for st in Profiler.StatType
+            st.name: res.profiler.time_stats[st]
+            for st in Profiler.PHASES
+            if res.profiler.time_counts[st]
+        }
+        obj["profiler_detail"] = {
+            st.name: res.profiler.time_stats[st]
+            for st in Profiler.StatType
+            if st not in Profiler.PHASES and res.profiler.time_counts[st]
         }
 
     port.send_json(obj)
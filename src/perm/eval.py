@@ -1,34 +1,78 @@
+import hashlib
 import random
-from typing import List, Iterable, Set, Tuple
+from typing import Iterable, Optional, Tuple
 
 from .perm import Perm, EvalState
 
 
-def _gen_all_seeds(total_count: int) -> Iterable[int]:
-    """Generate all numbers 0..total_count-1 in random order, in expected time
-    O(1) per number."""
-    seen: Set[int] = set()
-    while len(seen) < total_count // 2:
-        seed = random.randrange(total_count)
-        if seed not in seen:
-            seen.add(seed)
-            yield seed
+class SeedPermutation:
+    """A keyed pseudo-random bijection on 0..count-1, for visiting seeds in
+    random order without storing them. It is a balanced Feistel network over
+    the smallest even number of bits that covers the range, with cycle-walking
+    (re-encrypting until the result is in range). At most 3/4 of the network's
+    domain lies outside the range, so lookups take expected O(1) time."""
 
-    remaining: List[int] = []
-    for seed in range(total_count):
-        if seed not in seen:
-            remaining.append(seed)
-    random.shuffle(remaining)
-    for seed in remaining:
-        yield seed
+    ROUNDS = 4
 
+    def __init__(self, count: int, key: int) -> None:
+        self.count = count
+        bits = max((count - 1).bit_length(), 2)
+        self._half_bits = (bits + 1) // 2
+        self._mask = (1 << self._half_bits) - 1
+        # blake2b digests are at most 64 bytes; for even larger ranges the
+        # round function covers only the low bits, which keeps it a bijection.
+        self._digest_size = min((self._half_bits + 7) // 8, 64)
+        rng = random.Random(key)
+        self._round_keys = [
+            rng.getrandbits(128).to_bytes(16, "little") for _ in range(self.ROUNDS)
+        ]
 
-def perm_gen_all_seeds(perm: Perm) -> Iterable[int]:
+    def _round(self, value: int, round_key: bytes) -> int:
+        data = value.to_bytes((self._half_bits + 7) // 8, "little")
+        digest = hashlib.blake2b(
+            data, digest_size=self._digest_size, key=round_key
+        ).digest()
+        return int.from_bytes(digest, "little") & self._mask
+
+    def _encrypt(self, value: int) -> int:
+        left = value >> self._half_bits
+        right = value & self._mask
+        for round_key in self._round_keys:
+            left, right = right, left ^ self._round(right, round_key)
+        return (left << self._half_bits) | right
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self.count:
+            raise IndexError("seed index out of range")
+        value = self._encrypt(index)
+        while value >= self.count:
+            value = self._encrypt(value)
+        return value
+
+
+def perm_gen_all_seeds(
+    perm: Perm,
+    key: Optional[int] = None,
+    *,
+    start: int = 0,
+    shard: int = 0,
+    num_shards: int = 1,
+) -> Iterable[int]:
+    """Generate all seeds for a Perm, in random order, using constant memory.
+    The order is fixed by the key, if given.
+
+    The order can be split into num_shards interleaved shards, e.g. one per
+    worker, of which this generates the given one, skipping its first start
+    seeds. Together the shards cover every seed exactly once. If the Perm is
+    randomized, repeat forever, in a new order each time."""
+    rng = random.Random(key)
     while True:
-        for seed in _gen_all_seeds(perm.perm_count):
-            yield seed
+        order = SeedPermutation(perm.perm_count, rng.getrandbits(64))
+        for index in range(shard + start * num_shards, order.count, num_shards):
+            yield order[index]
         if not perm.is_random():
             break
+        start = 0
 
 
 def perm_evaluate_one(perm: Perm) -> Tuple[str, EvalState]:
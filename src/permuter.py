@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 import difflib
 import hashlib
 import itertools
@@ -7,24 +9,51 @@ import re
 import time
 import traceback
 from typing import (
+    Deque,
     Dict,
     Iterator,
     List,
     Mapping,
     Optional,
+    Set,
     Tuple,
     Union,
 )
 
-from .candidate import Candidate, CandidateResult
+from .adaptive import PassBandit, PassOutcome
+from .cache import DigestTable, DiskCache, SharedState
+from .checkpoint import CHECKPOINT_VERSION, Checkpoint
+from .candidate import Candidate, CandidateResult, CandidateSnapshot
 from .compiler import Compiler
 from .error import CandidateConstructionFailure
 from .perm.perm import EvalState
 from .perm.eval import perm_evaluate_one, perm_gen_all_seeds
 from .perm.parse import perm_parse
 from .profiler import Profiler, Timer
-from .scorer import Scorer
-from .helpers import trim_source
+from .scorer import Disassembly, Scorer
+from .search import (
+    DEFAULT_POPULATION_SIZE,
+    AnnealSchedule,
+    Annealer,
+    Population,
+    PopulationEntry,
+    ReplicaState,
+    TEMPERING_SWAP_INTERVAL,
+)
+from .helpers import trim_source, try_remove
+
+
+# Default per-process memory budget for caches of seen sources and hashes.
+DEFAULT_CACHE_MEMORY = 16 * 2**20
+
+# With --search=population, the probability of starting over from a fresh
+# candidate instead of picking a parent from the population. Only matters
+# when PERM macros give more than one starting point.
+POPULATION_RESTART_PROB = 0.1
+
+
+def _hash_digest(asm_hash: str) -> bytes:
+    return bytes.fromhex(asm_hash)
 
 
 @dataclass
@@ -54,14 +83,106 @@ class _CompileFailure(Exception):
     pass
 
 
+@dataclass
+class _ToolOutput:
+    o_file: Optional[str]
+    disassembly: Optional[Disassembly]
+    compile_time: float
+    disassemble_time: float
+
+
+@dataclass
+class _PendingCandidate:
+    """A candidate whose compiler and disassembler may still be running."""
+
+    # The candidate itself. With --pipeline, it may since have been randomized
+    # further, but only once its snapshot is no longer needed.
+    cand: Candidate
+    seed: Tuple[int, int]
+    source: str
+    source_hash: bytes
+    pass_name: Optional[str]
+    parent_score: int
+    profiler: Profiler
+    # Score from the in-memory cache, if the source has been seen before.
+    old_score: Optional[int]
+    # The result, if it was known without compiling.
+    result: Optional[CandidateResult]
+    tools: Optional[_ToolOutput] = None
+    future: "Optional[Future[_ToolOutput]]" = None
+
+
 @dataclass
 class WorkDone:
     perm_index: int
     result: EvalResult
 
 
+@dataclass
+class WorkStats:
+    """Aggregate of the results that a local worker did not send individually,
+    because there was nothing to do with them beyond counting."""
+
+    perm_index: int
+    iterations: int = 0
+    # Time spent evaluating candidates, including noteworthy ones.
+    seconds: float = 0.0
+    # Candidates that failed to compile.
+    errors: int = 0
+    last_score: Optional[int] = None
+    profiler: Optional[Profiler] = None
+    # With --adaptive-weights, how often each pass had each outcome.
+    pass_outcomes: Dict[Tuple[str, PassOutcome], int] = field(default_factory=dict)
+
+    def add(self, result: CandidateResult, penalty_inf: int) -> None:
+        self.iterations += 1
+        if result.score == penalty_inf:
+            self.errors += 1
+        self.last_score = result.score
+        if result.profiler is not None:
+            if self.profiler is None:
+                self.profiler = Profiler()
+            self.profiler.merge(result.profiler)
+        if result.pass_outcome is not None:
+            key = result.pass_outcome
+            self.pass_outcomes[key] = self.pass_outcomes.get(key, 0) + 1
+
+
+@dataclass
+class WorkBatch:
+    """Results from a local worker, in the order of its shard of seeds. Only
+    noteworthy results are included as is; the rest are summed up in stats."""
+
+    shard: int
+    results: List[WorkDone]
+    stats: List[WorkStats]
+
+
+@dataclass
+class WeightUpdate:
+    perm_index: int
+    weights: Dict[str, float]
+
+
+@dataclass
+class PopulationUpdate:
+    perm_index: int
+    entry: PopulationEntry
+
+
+@dataclass
+class ReplicaSwap:
+    perm_index: int
+    snapshot: CandidateSnapshot
+    score: int
+
+
+# Messages from the parent process to workers, about changes to the search
+# state.
+Control = Union[WeightUpdate, PopulationUpdate, ReplicaSwap]
+
 Task = Union[Finished, Tuple[int, int]]
-FeedbackItem = Union[Finished, Message, NeedMoreWork, WorkDone]
+FeedbackItem = Union[Finished, Message, NeedMoreWork, WorkDone, WorkBatch, ReplicaState]
 Feedback = Tuple[FeedbackItem, int, Optional[str]]
 
 
@@ -92,6 +213,14 @@ class Permuter:
         score_threshold: Optional[int],
         debug_mode: bool,
         speed: int,
+        disk_cache: Optional[DiskCache] = None,
+        cache_memory: int = DEFAULT_CACHE_MEMORY,
+        adaptive_weights: bool = False,
+        search: str = "chain",
+        population_size: int = DEFAULT_POPULATION_SIZE,
+        anneal_schedule: Optional[AnnealSchedule] = None,
+        pipeline: int = 1,
+        best_of: int = 1,
     ) -> None:
         self.dir = dir
         self.compiler = compiler
@@ -113,12 +242,17 @@ class Permuter:
         else:
             self.fn_name = fn_name
         self.unique_name = self.fn_name
+        # Share of time to get relative to other permuters, with --schedule.
+        self.priority = 1.0
 
         self._permutations = perm_parse(source)
 
         self._force_seed = force_seed
         self._force_rng_seed = force_rng_seed
         self._cur_seed: Optional[Tuple[int, int]] = None
+        # Determines the order in which seeds are visited, so that a resumed
+        # run can pick up where the previous one left off.
+        self.seed_key = random.randrange(2**63)
 
         self.keep_prob = keep_prob
         self.need_profiler = need_profiler
@@ -132,15 +266,51 @@ class Permuter:
             self.base_score,
             self.base_hash,
             self.base_source,
+            base_snapshot,
         ) = self._create_and_score_base()
         self.best_score = self.base_score
-        self.hashes = {self.base_hash}
+        # Hashes of outputted candidates. Unlike the score cache, this never
+        # forgets, so the same asm is not outputted twice. It only grows with
+        # the number of output directories.
+        self.hashes: Set[bytes] = {_hash_digest(self.base_hash)}
+        # Best scores and hashes known to the parent process, with the index
+        # of this permuter in it; see share_state.
+        self._shared: Optional[Tuple[SharedState, int]] = None
         self._cur_cand: Optional[Candidate] = None
         self._last_score: Optional[int] = None
-        self._score_for_source: Dict[bytes, int] = {}
+        self._score_for_source = DigestTable(cache_memory)
         self.speed = speed
+        self._disk_cache = disk_cache
+        self._adaptive_weights = adaptive_weights
+        self.population: Optional[Population] = None
+        if search == "population" and self.is_random():
+            self.population = Population(population_size)
+            self.population.add(
+                PopulationEntry(self.base_score, self.base_hash, base_snapshot)
+            )
+        # With --pipeline, the number of candidates that may be compiling and
+        # disassembling in background threads.
+        self.pipeline = pipeline
+        # With --best-of, the number of mutations to try in each step.
+        self.best_of = best_of
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Deque[Union[_PendingCandidate, EvalError]] = deque()
+        self.annealer: Optional[Annealer] = None
+        self._replica: Optional[int] = None
+        self._iterations_since_swap = 0
+        if search in ("anneal", "tempering") and self.is_random():
+            self.annealer = Annealer(
+                anneal_schedule or AnnealSchedule(), self.base_score
+            )
+
+    def __getstate__(self) -> dict:
+        # Threads are started lazily by whichever process evaluates candidates.
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_in_flight"] = deque()
+        return state
 
-    def _create_and_score_base(self) -> Tuple[int, str, str]:
+    def _create_and_score_base(self) -> Tuple[int, str, str, CandidateSnapshot]:
         base_source, eval_state = perm_evaluate_one(self._permutations)
         base_cand = Candidate.from_source(
             base_source,
@@ -158,31 +328,100 @@ class Permuter:
             raise CandidateConstructionFailure(f"Unable to compile {self.source_file}")
         base_result = base_cand.score(self.scorer, o_file)
         assert base_result.hash is not None
-        return base_result.score, base_result.hash, base_cand.get_source()
+        return (
+            base_result.score,
+            base_result.hash,
+            base_cand.get_source(),
+            base_cand.snapshot(0),
+        )
 
     def _need_to_send_source(self, result: CandidateResult) -> bool:
         return self._need_all_sources or self.should_output(result)
 
     def _eval_candidate(self, seed: int) -> CandidateResult:
+        pending = self._start_candidate(seed)
+        if pending.result is None:
+            pending.tools = self._run_tools(pending.source)
+        return self._finish_candidate(pending)
+
+    def _start_candidate(self, seed: int) -> _PendingCandidate:
+        """Create the next candidate, up to the point where the compiler needs
+        to be run, unless its score is known already."""
         profiler = Profiler()
         timer = Timer()
 
+        parent_score = self._select_parent(seed, profiler)
+        assert self._cur_cand is not None
+
+        pass_name: Optional[str] = None
+        if self._permutations.is_random():
+            pass_name = self._cur_cand.randomize_ast(profiler)
+
+        profiler.add_stat(Profiler.StatType.perm, timer.tick())
+        return self._prepare_candidate(
+            self._cur_cand, pass_name, parent_score, profiler, timer
+        )
+
+    def _select_parent(self, seed: int, profiler: Profiler) -> int:
+        """Pick the candidate to randomize next, and make it the current one.
+        Returns the score it had."""
         # Determine if we should keep the last candidate.
         # Don't keep 0-score candidates; we'll only create new, worse, zeroes.
         keep = (
             self._permutations.is_random()
+            and self.population is None
+            and self.annealer is None
             and random.uniform(0, 1) < self.keep_prob
             and self._last_score != 0
             and self._last_score != self.scorer.PENALTY_INF
         ) or self._force_rng_seed
 
+        # The score of the candidate we are about to randomize further.
+        parent_score = self.base_score
+        if keep and self._last_score is not None:
+            parent_score = self._last_score
         self._last_score = None
 
         # Create a new candidate if we didn't keep the last one (or if the last one didn't exist)
         # N.B. if we decide to keep the previous candidate, we will skip over the provided seed.
         # This means we're not guaranteed to test all seeds, but it doesn't really matter since
         # we're randomizing anyway.
-        if not self._cur_cand or not keep:
+        if (
+            self.population is not None
+            and random.uniform(0, 1) >= POPULATION_RESTART_PROB
+        ):
+            # Randomize a copy of a member of the population.
+            parent = self.population.select()
+            parent_score = parent.score
+            rng_seed = random.randrange(1, 10**20)
+            self._cur_seed = (parent.snapshot.seed, rng_seed)
+            cand_c = self._permutations.evaluate(parent.snapshot.seed, EvalState())
+            self._cur_cand = Candidate.from_source(
+                cand_c,
+                EvalState(),
+                self.fn_name,
+                self.randomization_weights,
+                rng_seed=rng_seed,
+                snapshot=parent.snapshot,
+                profiler=profiler,
+            )
+        elif self.annealer is not None and self.annealer.current is not None:
+            # Randomize a copy of the current state of the annealing chain.
+            current = self.annealer.current
+            parent_score = self.annealer.current_score
+            rng_seed = random.randrange(1, 10**20)
+            self._cur_seed = (current.seed, rng_seed)
+            cand_c = self._permutations.evaluate(current.seed, EvalState())
+            self._cur_cand = Candidate.from_source(
+                cand_c,
+                EvalState(),
+                self.fn_name,
+                self.randomization_weights,
+                rng_seed=rng_seed,
+                snapshot=current,
+                profiler=profiler,
+            )
+        elif not self._cur_cand or not keep:
             eval_state = EvalState()
             cand_c = self._permutations.evaluate(seed, eval_state)
             rng_seed = self._force_rng_seed or random.randrange(1, 10**20)
@@ -193,51 +432,214 @@ class Permuter:
                 self.fn_name,
                 self.randomization_weights,
                 rng_seed=rng_seed,
+                profiler=profiler,
             )
 
-        if self._permutations.is_random():
-            self._cur_cand.randomize_ast()
-
-        profiler.add_stat(Profiler.StatType.perm, timer.tick())
+        return parent_score
 
-        cand_source = self._cur_cand.get_source()
+    def _prepare_candidate(
+        self,
+        cand: Candidate,
+        pass_name: Optional[str],
+        parent_score: int,
+        profiler: Profiler,
+        timer: Timer,
+    ) -> _PendingCandidate:
+        cand_source = cand.get_source(profiler)
         source_hash = hashlib.sha256(cand_source.encode()).digest()
         profiler.add_stat(Profiler.StatType.stringify, timer.tick())
 
         old_score = self._score_for_source.get(source_hash)
+        profiler.add_count(
+            Profiler.CounterType.source_cache_hit
+            if old_score is not None
+            else Profiler.CounterType.source_cache_miss
+        )
+        disk_entry: Optional[Tuple[int, str]] = None
+        if old_score is None and self._disk_cache is not None:
+            disk_entry = self._disk_cache.get(source_hash)
+            profiler.add_count(
+                Profiler.CounterType.disk_cache_hit
+                if disk_entry is not None
+                else Profiler.CounterType.disk_cache_miss
+            )
+        result: Optional[CandidateResult] = None
         if old_score is not None:
             result = CandidateResult(score=old_score, hash=None, source=cand_source)
+        elif disk_entry is not None:
+            result = CandidateResult(
+                score=disk_entry[0], hash=disk_entry[1], source=cand_source
+            )
+        assert self._cur_seed is not None
+        return _PendingCandidate(
+            cand=cand,
+            seed=self._cur_seed,
+            source=cand_source,
+            source_hash=source_hash,
+            pass_name=pass_name,
+            parent_score=parent_score,
+            profiler=profiler,
+            old_score=old_score,
+            result=result,
+        )
+
+    def _run_tools(self, source: str) -> _ToolOutput:
+        """Compile a candidate and disassemble it. This only runs subprocesses,
+        and may be called off the main thread with --pipeline."""
+        timer = Timer()
+        o_file = self.compiler.compile(source)
+        compile_time = timer.tick()
+        disassembly = None
+        if o_file is not None:
+            try:
+                disassembly = self.scorer.disassemble(o_file)
+            except BaseException:
+                try_remove(o_file)
+                raise
+        return _ToolOutput(o_file, disassembly, compile_time, timer.tick())
+
+    def _finish_candidate(self, pending: _PendingCandidate) -> CandidateResult:
+        """Score a candidate once its tools have run, and update the search
+        state based on it."""
+        profiler = pending.profiler
+        pass_name = pending.pass_name
+        parent_score = pending.parent_score
+        old_score = pending.old_score
+        timer = Timer()
+
+        if pending.result is not None:
+            result = pending.result
         else:
-            o_file = self._cur_cand.compile(self.compiler)
-            if not o_file and self._show_errors:
+            tools = pending.tools
+            assert tools is not None
+            if not tools.o_file and self._show_errors:
                 raise _CompileFailure()
-            profiler.add_stat(Profiler.StatType.compile, timer.tick())
+            profiler.add_stat(Profiler.StatType.compile, tools.compile_time)
+
+            score, score_hash = Scorer.PENALTY_INF, ""
+            if tools.o_file:
+                assert tools.disassembly is not None
+                try:
+                    score, score_hash = self.scorer.score_disassembly(
+                        tools.o_file, tools.disassembly, profiler
+                    )
+                finally:
+                    try_remove(tools.o_file)
+            result = CandidateResult(
+                score=score, hash=score_hash, source=pending.source
+            )
+            profiler.add_stat(
+                Profiler.StatType.score, tools.disassemble_time + timer.tick()
+            )
 
-            result = self._cur_cand.score(self.scorer, o_file)
-            profiler.add_stat(Profiler.StatType.score, timer.tick())
+            # Failures may be transient (a killed compiler, a full disk), and
+            # shouldn't follow the source into later runs.
+            if self._disk_cache is not None and score != Scorer.PENALTY_INF:
+                self._disk_cache.put(pending.source_hash, result.score, score_hash)
 
-            if len(self._score_for_source) < 100000:  # prevent unbounded memory usage
-                self._score_for_source[source_hash] = result.score
+        if old_score is None and self._score_for_source.put(
+            pending.source_hash, result.score
+        ):
+            profiler.add_count(Profiler.CounterType.source_cache_eviction)
 
         if self.need_profiler:
             result.profiler = profiler
 
+        if self._adaptive_weights and pass_name is not None:
+            if old_score is not None:
+                outcome = PassOutcome.duplicate
+            elif result.score == self.scorer.PENALTY_INF:
+                outcome = PassOutcome.compile_error
+            elif result.score <= parent_score:
+                outcome = PassOutcome.better_or_equal
+            else:
+                outcome = PassOutcome.worse
+            result.pass_outcome = (pass_name, outcome)
+
+        if (
+            self.annealer is not None
+            and pass_name is not None
+            and self.annealer.accept(result.score)
+        ):
+            # The candidate is replaced on the next iteration rather than
+            # randomized further, so its function can be used without copying.
+            self.annealer.move_to(
+                pending.cand.snapshot(pending.seed[0], copy_fn=False),
+                result.score,
+            )
+
+        if (
+            self.population is not None
+            and old_score is None
+            and result.hash is not None
+            and result.score != self.scorer.PENALTY_INF
+            and self.population.accepts(result.score)
+        ):
+            result.snapshot = pending.cand.snapshot(pending.seed[0])
+
         self._last_score = result.score
 
         if not self._need_to_send_source(result):
             result.source = None
-            result.hash = None
+            if result.snapshot is None:
+                result.hash = None
 
         return result
 
+    def set_randomization_weights(self, weights: Mapping[str, float]) -> None:
+        """Change the weights used for randomizing further candidates, including
+        the current one."""
+        self.randomization_weights = weights
+        if self._cur_cand is not None:
+            self._cur_cand.randomizer.set_weights(weights)
+
+    def apply_control(self, message: Control) -> None:
+        """Update the search state as instructed by the parent process."""
+        if isinstance(message, WeightUpdate):
+            self.set_randomization_weights(message.weights)
+        elif isinstance(message, PopulationUpdate):
+            assert self.population is not None
+            self.population.add(message.entry)
+        else:
+            assert self.annealer is not None
+            self.annealer.move_to(message.snapshot, message.score)
+
+    def set_replica(self, replica: int, level: float) -> None:
+        """Make this process's annealing chain a --search=tempering replica,
+        running at a constant temperature."""
+        if self.annealer is not None:
+            self._replica = replica
+            self.annealer.level = level
+
+    def replica_state(self, perm_index: int) -> Optional[ReplicaState]:
+        """For --search=tempering replicas, periodically return the current
+        state of the chain, to offer it up for swapping."""
+        if self._replica is None or self.annealer is None:
+            return None
+        self._iterations_since_swap += 1
+        if (
+            self._iterations_since_swap < TEMPERING_SWAP_INTERVAL
+            or self.annealer.current is None
+        ):
+            return None
+        self._iterations_since_swap = 0
+        return ReplicaState(
+            perm_index=perm_index,
+            replica=self._replica,
+            snapshot=self.annealer.current,
+            score=self.annealer.current_score,
+            best_score=self.annealer.best_score,
+        )
+
     def should_output(self, result: CandidateResult) -> bool:
         """Check whether a result should be outputted. This must be more liberal
         in child processes than in parent ones, or else sources will be missing."""
+        best_score = self.known_best_score()
         return (
             result.score <= self.base_score
             and result.hash is not None
             and result.source is not None
-            and not (result.score > self.best_score and self._best_only)
+            and not (result.score > best_score and self._best_only)
             and (
                 result.score < self.base_score
                 or (result.score == self.base_score and not self._better_only)
@@ -245,7 +647,34 @@ class Permuter:
             and (
                 self._score_threshold is None or (result.score < self._score_threshold)
             )
-            and result.hash not in self.hashes
+            and not self._seen_hash(_hash_digest(result.hash))
+        )
+
+    def known_best_score(self) -> int:
+        """The best score found so far, by this process or, if shared with
+        it, by the parent."""
+        if self._shared is not None:
+            shared, perm_index = self._shared
+            return min(self.best_score, shared.best_score(perm_index))
+        return self.best_score
+
+    def _seen_hash(self, digest: bytes) -> bool:
+        if digest in self.hashes:
+            return True
+        if self._shared is not None:
+            shared, perm_index = self._shared
+            return shared.seen(perm_index, digest)
+        return False
+
+    def is_noteworthy(self, result: EvalResult) -> bool:
+        """Check whether a result needs to be sent from a child process to the
+        parent as is, rather than just being counted. That is the case if it is
+        to be outputted, or might be used by the search."""
+        return (
+            not isinstance(result, CandidateResult)
+            or result.score == 0
+            or result.source is not None
+            or result.snapshot is not None
         )
 
     def record_result(self, result: CandidateResult) -> None:
@@ -254,16 +683,86 @@ class Permuter:
         0, since we are interested in all score 0's, not just the first."""
         self.best_score = min(self.best_score, result.score)
         if result.score != 0 and result.hash is not None:
-            self.hashes.add(result.hash)
-
-    def seed_iterator(self) -> Iterator[int]:
-        """Create an iterator over all seeds for this permuter. The iterator
-        will be infinite if we are randomizing."""
+            self.hashes.add(_hash_digest(result.hash))
+
+    def share_state(self, shared: SharedState, perm_index: int) -> None:
+        """Start making results known to local workers through shared memory.
+        Called by the parent process before starting the workers, which get
+        the same view through pickling. Since workers only see what the parent
+        has recorded, they stay at least as liberal as it in should_output."""
+        self._shared = (shared, perm_index)
+        shared.set_best_score(perm_index, self.best_score)
+        shared.add_seen(perm_index, _hash_digest(self.base_hash))
+
+    def publish_result(self, result: CandidateResult) -> None:
+        """Pass on a result recorded by the parent process to the workers."""
+        if self._shared is None:
+            return
+        shared, perm_index = self._shared
+        shared.set_best_score(perm_index, self.best_score)
+        if result.score != 0 and result.hash is not None:
+            shared.add_seen(perm_index, _hash_digest(result.hash))
+
+    def is_random(self) -> bool:
+        """Check whether candidates are produced by the randomizer, rather than
+        just by expanding PERM macros."""
+        return self._permutations.is_random()
+
+    def seed_iterator(
+        self, start: int = 0, *, shard: int = 0, num_shards: int = 1
+    ) -> Iterator[int]:
+        """Create an iterator over one shard of the seeds for this permuter,
+        skipping the first start ones. The iterator will be infinite if we are
+        randomizing."""
         if self._force_seed is None:
-            return iter(perm_gen_all_seeds(self._permutations))
+            return iter(
+                perm_gen_all_seeds(
+                    self._permutations,
+                    self.seed_key,
+                    start=start,
+                    shard=shard,
+                    num_shards=num_shards,
+                )
+            )
         if self._permutations.is_random():
             return itertools.repeat(self._force_seed)
-        return iter([self._force_seed])
+        return iter([self._force_seed] if shard == 0 else [])
+
+    def checkpoint(
+        self,
+        namespace: bytes,
+        *,
+        seed_position: int,
+        unanswered_seeds: List[int],
+        population: Optional[Population],
+        bandit: Optional[PassBandit],
+    ) -> Checkpoint:
+        """Capture the state of this permuter, together with search state kept
+        by the parent process. Score caches of worker processes and annealing
+        chains are not included; see main.resume_caveats."""
+        return Checkpoint(
+            version=CHECKPOINT_VERSION,
+            namespace=namespace,
+            best_score=self.best_score,
+            hashes=self.hashes,
+            score_for_source=self._score_for_source,
+            seed_key=self.seed_key,
+            seed_position=seed_position,
+            unanswered_seeds=unanswered_seeds,
+            population=population,
+            bandit=bandit,
+        )
+
+    def restore(self, checkpoint: Checkpoint) -> None:
+        """Continue from a checkpoint. Must be called before worker processes
+        are started."""
+        self.best_score = min(self.best_score, checkpoint.best_score)
+        self.hashes = checkpoint.hashes
+        self._score_for_source = checkpoint.score_for_source
+        self.seed_key = checkpoint.seed_key
+        if self.population is not None and checkpoint.population is not None:
+            for entry in checkpoint.population.entries:
+                self.population.add(entry)
 
     def try_eval_candidate(self, seed: int) -> EvalResult:
         """Evaluate a seed for the permuter."""
@@ -274,6 +773,150 @@ class Permuter:
         except Exception:
             return EvalError(exc_str=traceback.format_exc(), seed=self._cur_seed)
 
+    def submit_candidate(self, seed: int) -> List[EvalResult]:
+        """Like try_eval_candidate, but with --pipeline: start evaluating a seed,
+        leaving the compiler and disassembler to run in a background thread
+        while later candidates are created. Returns the results of earlier
+        candidates that have finished since, in order. The search state is
+        updated as results come in, so new candidates are based on results
+        that lag a few iterations behind."""
+        item: Union[_PendingCandidate, EvalError]
+        try:
+            item = self._start_candidate(seed)
+            if item.result is None:
+                item.future = self._get_executor().submit(self._run_tools, item.source)
+        except Exception:
+            item = EvalError(exc_str=traceback.format_exc(), seed=self._cur_seed)
+        self._in_flight.append(item)
+
+        ret: List[EvalResult] = []
+        while self._in_flight and (
+            len(self._in_flight) > self.pipeline or self._is_done(self._in_flight[0])
+        ):
+            ret.append(self._collect_candidate(self._in_flight.popleft()))
+        return ret
+
+    def try_eval_best_of(self, seed: int) -> List[EvalResult]:
+        """Like try_eval_candidate, but with --best-of K: randomize K copies of
+        the current candidate, evaluate those with distinct sources in
+        parallel, and continue from the best one, unless all of them are worse.
+        Returns the results of all the distinct copies."""
+        try:
+            return list(self._eval_best_of(seed))
+        except _CompileFailure:
+            return [EvalError(exc_str=None, seed=self._cur_seed)]
+        except Exception:
+            return [EvalError(exc_str=traceback.format_exc(), seed=self._cur_seed)]
+
+    def _eval_best_of(self, seed: int) -> List[CandidateResult]:
+        if (
+            not self._permutations.is_random()
+            or self.population is not None
+            or self.annealer is not None
+        ):
+            return [self._eval_candidate(seed)]
+        timer = Timer()
+        # The work of selecting the parent counts towards the first child.
+        profiler = Profiler()
+        parent_score = self._select_parent(seed, profiler)
+        parent = self._cur_cand
+        assert parent is not None
+        select_time = timer.tick()
+
+        pendings: List[_PendingCandidate] = []
+        seen: Set[bytes] = set()
+        for i in range(self.best_of):
+            if i:
+                profiler = Profiler()
+            child = parent.clone(
+                self.randomization_weights, random.randrange(1, 10**20), profiler
+            )
+            pass_name = child.randomize_ast(profiler)
+            profiler.add_stat(Profiler.StatType.perm, select_time + timer.tick())
+            select_time = 0.0
+            pending = self._prepare_candidate(
+                child, pass_name, parent_score, profiler, timer
+            )
+            if pending.source_hash in seen:
+                continue
+            seen.add(pending.source_hash)
+            if pending.result is None:
+                pending.future = self._get_executor().submit(
+                    self._run_tools, pending.source
+                )
+            pendings.append(pending)
+
+        results: List[CandidateResult] = []
+        best: Optional[Tuple[int, Candidate]] = None
+        for i, pending in enumerate(pendings):
+            try:
+                if pending.future is not None:
+                    pending.tools = pending.future.result()
+                result = self._finish_candidate(pending)
+            except BaseException:
+                # E.g. _CompileFailure with show_errors. Don't leave the other
+                # copies' object files behind.
+                for other in pendings[i + 1 :]:
+                    self._discard_candidate(other)
+                raise
+            results.append(result)
+            if best is None or result.score < best[0]:
+                best = (result.score, pending.cand)
+
+        # Steepest descent: move to the best copy, or stay put.
+        if best is not None and best[0] <= parent_score:
+            self._cur_cand = best[1]
+            self._last_score = best[0]
+        else:
+            self._last_score = parent_score
+        return results
+
+    def _discard_candidate(self, pending: _PendingCandidate) -> None:
+        """Clean up after a candidate whose tools may still be running, without
+        scoring it."""
+        future = pending.future
+        if future is None or future.cancel():
+            return
+        try:
+            tools = future.result()
+        except Exception:
+            return
+        if tools.o_file:
+            try_remove(tools.o_file)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(self.pipeline, self.best_of)
+            )
+        return self._executor
+
+    def drain_candidates(self) -> List[EvalResult]:
+        """Wait for all candidates started by submit_candidate to finish, and
+        return their results."""
+        ret: List[EvalResult] = []
+        while self._in_flight:
+            ret.append(self._collect_candidate(self._in_flight.popleft()))
+        return ret
+
+    @staticmethod
+    def _is_done(item: Union[_PendingCandidate, EvalError]) -> bool:
+        return isinstance(item, EvalError) or item.future is None or item.future.done()
+
+    def _collect_candidate(
+        self, item: Union[_PendingCandidate, EvalError]
+    ) -> EvalResult:
+        if isinstance(item, EvalError):
+            return item
+        try:
+            if item.future is not None:
+                item.tools = item.future.result()
+            return self._finish_candidate(item)
+        except _CompileFailure:
+            return EvalError(exc_str=None, seed=item.seed)
+        except Exception:
+            return EvalError(exc_str=traceback.format_exc(), seed=item.seed)
+
     def diff(self, other_source: str) -> str:
         """Compute a unified white-space-ignoring diff from the (pretty-printed)
         base source against another source generated from this permuter."""
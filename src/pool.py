@@ -0,0 +1,169 @@
+"""A pool of worker processes that is kept around across runs, and that
+permuters can be added to and removed from on the fly. Structured like the
+permuter@home evaluator: permuters are sent to every worker on a queue of its
+own, and seeds to evaluate go on a queue shared between all of them."""
+from dataclasses import dataclass
+import multiprocessing
+from multiprocessing import Process, Queue
+import queue
+import time
+from typing import Counter, Dict, List, Optional, Set, Tuple, Union
+
+from .candidate import CandidateResult
+from .helpers import static_assert_unreachable
+from .permuter import EvalResult, Permuter
+
+# How many seeds to keep queued up per worker, so that workers don't go idle
+# while waiting for the next one.
+POOL_QUEUE_DEPTH = 2
+
+
+@dataclass
+class _AddPermuter:
+    perm_id: int
+    permuter: Permuter
+
+
+@dataclass
+class _RemovePermuter:
+    perm_id: int
+
+
+@dataclass
+class _Work:
+    perm_id: int
+    seed: int
+
+
+@dataclass
+class PoolResult:
+    perm_id: int
+    seed: int
+    seconds: float
+    result: EvalResult
+
+
+_LocalWork = Tuple[Union[_AddPermuter, _RemovePermuter], int]
+_GlobalWork = Optional[Tuple[_Work, int]]
+
+
+def _pool_worker(
+    work_queue: "Queue[_GlobalWork]",
+    local_queue: "Queue[_LocalWork]",
+    result_queue: "Queue[PoolResult]",
+) -> None:
+    try:
+        permuters: Dict[int, Permuter] = {}
+        timestamp = 0
+        while True:
+            item = work_queue.get()
+            if item is None:
+                break
+            work, required_timestamp = item
+            # Catch up on permuters being added and removed, up to the point
+            # where the work was queued.
+            while True:
+                try:
+                    block = timestamp < required_timestamp
+                    task, timestamp = local_queue.get(block=block)
+                except queue.Empty:
+                    break
+                if isinstance(task, _AddPermuter):
+                    permuters[task.perm_id] = task.permuter
+                elif isinstance(task, _RemovePermuter):
+                    del permuters[task.perm_id]
+                else:
+                    static_assert_unreachable(task)
+
+            start = time.time()
+            permuter = permuters[work.perm_id]
+            result = permuter.try_eval_candidate(work.seed)
+            if isinstance(result, CandidateResult) and permuter.should_output(result):
+                permuter.record_result(result)
+            result_queue.put(
+                PoolResult(work.perm_id, work.seed, time.time() - start, result)
+            )
+    except KeyboardInterrupt:
+        pass
+    result_queue.cancel_join_thread()
+
+
+class WorkerPool:
+    """Worker processes that evaluate seeds for any number of permuters.
+    Not thread-safe; all calls should come from the same thread."""
+
+    def __init__(self, num_workers: int) -> None:
+        self.num_workers = num_workers
+        self._work_queue: "Queue[_GlobalWork]" = Queue()
+        self._result_queue: "Queue[PoolResult]" = Queue()
+        self._local_queues: "List[Queue[_LocalWork]]" = []
+        self._processes: List[multiprocessing.Process] = []
+        self._timestamp = 0
+        self._outstanding: Counter[int] = Counter()
+        self._should_remove: Set[int] = set()
+        self._next_id = 0
+        for _ in range(num_workers):
+            local_queue: "Queue[_LocalWork]" = Queue()
+            p = Process(
+                target=_pool_worker,
+                args=(self._work_queue, local_queue, self._result_queue),
+                daemon=True,
+            )
+            p.start()
+            self._local_queues.append(local_queue)
+            self._processes.append(p)
+
+    def _broadcast(self, task: Union[_AddPermuter, _RemovePermuter]) -> None:
+        self._timestamp += 1
+        for q in self._local_queues:
+            q.put((task, self._timestamp))
+
+    def add_permuter(self, permuter: Permuter) -> int:
+        """Send a permuter to all workers, returning an id for it."""
+        perm_id = self._next_id
+        self._next_id += 1
+        self._broadcast(_AddPermuter(perm_id, permuter))
+        return perm_id
+
+    def remove_permuter(self, perm_id: int) -> None:
+        """Remove a permuter from the workers, once the seeds queued up for it
+        have been evaluated. Their results are still returned."""
+        self._should_remove.add(perm_id)
+        self._try_remove(perm_id)
+
+    def _try_remove(self, perm_id: int) -> None:
+        if perm_id in self._should_remove and not self._outstanding[perm_id]:
+            del self._outstanding[perm_id]
+            self._should_remove.remove(perm_id)
+            self._broadcast(_RemovePermuter(perm_id))
+
+    def submit(self, perm_id: int, seed: int) -> None:
+        assert perm_id not in self._should_remove
+        self._outstanding[perm_id] += 1
+        self._work_queue.put((_Work(perm_id, seed), self._timestamp))
+
+    def outstanding(self, perm_id: Optional[int] = None) -> int:
+        """Return the number of seeds queued up, for a single permuter or in
+        total."""
+        if perm_id is None:
+            return sum(self._outstanding.values())
+        return self._outstanding[perm_id]
+
+    def has_room(self) -> bool:
+        return self.outstanding() < POOL_QUEUE_DEPTH * self.num_workers
+
+    def get_result(self, timeout: Optional[float] = None) -> Optional[PoolResult]:
+        """Wait for the result of a seed, or return None after the timeout."""
+        try:
+            result = self._result_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self._outstanding[result.perm_id] -= 1
+        self._try_remove(result.perm_id)
+        return result
+
+    def close(self) -> None:
+        for _ in self._processes:
+            self._work_queue.put(None)
+        for p in self._processes:
+            p.join()
@@ -1,28 +1,205 @@
 from enum import Enum
+import math
 import time
+from typing import Dict, List, Mapping
+
+
+class Histogram:
+    """Distribution of durations, in buckets that grow exponentially from
+    MIN_TIME, so that percentiles are accurate to within a factor of
+    2**(1/BUCKETS_PER_DOUBLING). Only non-empty buckets are stored, and
+    histograms merge by adding up counts."""
+
+    MIN_TIME = 1e-6
+    BUCKETS_PER_DOUBLING = 4
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+
+    @classmethod
+    def bucket(cls, time_taken: float) -> int:
+        if time_taken <= cls.MIN_TIME:
+            return 0
+        return int(math.log2(time_taken / cls.MIN_TIME) * cls.BUCKETS_PER_DOUBLING)
+
+    @classmethod
+    def bucket_time(cls, bucket: int) -> float:
+        """A representative duration for a bucket: its geometric midpoint."""
+        return cls.MIN_TIME * 2 ** ((bucket + 0.5) / cls.BUCKETS_PER_DOUBLING)
+
+    def add(self, time_taken: float, count: int = 1) -> None:
+        b = self.bucket(time_taken)
+        self.counts[b] = self.counts.get(b, 0) + count
+        self.total += count
+
+    def merge(self, other: "Histogram") -> None:
+        for b, count in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + count
+        self.total += other.total
+
+    def percentile(self, p: float) -> float:
+        """Return the duration below which p percent of samples fall."""
+        if not self.total:
+            return 0.0
+        rank = p / 100 * self.total
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= rank:
+                return self.bucket_time(b)
+        return self.bucket_time(max(self.counts))
 
 
 class Profiler:
     class StatType(Enum):
+        # The phases of evaluating a candidate, which together make up the
+        # time spent on it.
         perm = 1
         stringify = 2
         compile = 3
         score = 4
+        # Finer-grained parts of the phases above: copying the AST and
+        # running a randomization pass (perm), generating code and expanding
+        # pragmas (stringify), and hashing the object file, disassembling it
+        # and diffing it against the target (score).
+        deepcopy = 5
+        randomize = 6
+        to_c = 7
+        process_pragmas = 8
+        hash = 9
+        objdump = 10
+        diff = 11
+
+    PHASES = [StatType.perm, StatType.stringify, StatType.compile, StatType.score]
+
+    # Percentiles shown by get_latency_str and to_json.
+    PERCENTILES = [50, 95, 99]
+
+    class CounterType(Enum):
+        # Scores answered from the raw .text hash, without disassembling.
+        score_exact = 1
+        score_cache_hit = 2
+        score_cache_miss = 3
+        disk_cache_hit = 4
+        disk_cache_miss = 5
+        source_cache_hit = 6
+        source_cache_miss = 7
+        source_cache_eviction = 8
 
     def __init__(self) -> None:
         self.time_stats = {x: 0.0 for x in Profiler.StatType}
+        self.time_counts = {x: 0 for x in Profiler.StatType}
+        self.counters = {x: 0 for x in Profiler.CounterType}
+        self.histograms: Dict[Profiler.StatType, Histogram] = {}
+        # Time spent in each randomization pass, and number of attempts.
+        self.pass_stats: Dict[str, float] = {}
+        self.pass_counts: Dict[str, int] = {}
 
-    def add_stat(self, stat: StatType, time_taken: float) -> None:
+    def add_stat(self, stat: StatType, time_taken: float, count: int = 1) -> None:
+        """Record time spent, on count occurrences of stat. For the
+        histogram, the occurrences are assumed to have taken equally long."""
         self.time_stats[stat] += time_taken
+        self.time_counts[stat] += count
+        if count:
+            self._histogram(stat).add(time_taken / count, count)
+
+    def _histogram(self, stat: StatType) -> Histogram:
+        if stat not in self.histograms:
+            self.histograms[stat] = Histogram()
+        return self.histograms[stat]
+
+    def add_count(self, counter: CounterType, count: int = 1) -> None:
+        self.counters[counter] += count
+
+    def add_pass_stat(self, name: str, time_taken: float, count: int = 1) -> None:
+        self.pass_stats[name] = self.pass_stats.get(name, 0.0) + time_taken
+        self.pass_counts[name] = self.pass_counts.get(name, 0) + count
+
+    def merge(self, other: "Profiler") -> None:
+        for stat in other.time_stats:
+            self.time_stats[stat] += other.time_stats[stat]
+            self.time_counts[stat] += other.time_counts[stat]
+        for stat, histogram in other.histograms.items():
+            self._histogram(stat).merge(histogram)
+        for counter in other.counters:
+            self.counters[counter] += other.counters[counter]
+        for name in other.pass_stats:
+            self.add_pass_stat(name, other.pass_stats[name], other.pass_counts[name])
 
     def get_str_stats(self) -> str:
-        total_time = sum(self.time_stats[e] for e in self.time_stats)
+        total_time = sum(self.time_stats[e] for e in Profiler.PHASES)
         timings = ", ".join(
             f"{round(100 * self.time_stats[e] / total_time)}% {e.name}"
-            for e in self.time_stats
+            for e in Profiler.PHASES
         )
+        compiles = self.histograms.get(Profiler.StatType.compile)
+        if compiles is not None:
+            p50 = 1000 * compiles.percentile(50)
+            p95 = 1000 * compiles.percentile(95)
+            timings += f" (compile p50 {p50:.1f} ms, p95 {p95:.1f} ms)"
+
+        c = self.counters
+        C = Profiler.CounterType
+        caches = [
+            ("source", c[C.source_cache_hit], c[C.source_cache_miss]),
+            ("disk", c[C.disk_cache_hit], c[C.disk_cache_miss]),
+            ("score", c[C.score_cache_hit] + c[C.score_exact], c[C.score_cache_miss]),
+        ]
+        for name, hits, misses in caches:
+            if hits + misses:
+                timings += f", {round(100 * hits / (hits + misses))}% {name} cache hits"
+            if name == "source" and c[C.source_cache_eviction]:
+                timings += f" ({c[C.source_cache_eviction]} evictions)"
         return timings
 
+    def get_latency_str(self) -> str:
+        """Return a table of latency percentiles per stat."""
+        header = " ".join(f"{'p' + str(p):>9}" for p in Profiler.PERCENTILES)
+        lines = [f"Latencies (ms): {' ' * 17}{'count':>9} {'mean':>9} {header}"]
+        for stat in Profiler.StatType:
+            histogram = self.histograms.get(stat)
+            if histogram is None:
+                continue
+            mean = 1000 * self.time_stats[stat] / self.time_counts[stat]
+            percentiles = " ".join(
+                f"{1000 * histogram.percentile(p):>9.3f}" for p in Profiler.PERCENTILES
+            )
+            lines.append(
+                f"  {stat.name.ljust(30)} {self.time_counts[stat]:>9} "
+                f"{mean:>9.3f} {percentiles}"
+            )
+        return "\n".join(lines)
+
+    def to_json(self) -> Dict[str, object]:
+        """Summarize the profile in a form that can be written out as JSON,
+        with times in seconds."""
+        stats: Dict[str, object] = {}
+        for stat, histogram in self.histograms.items():
+            entry: Dict[str, object] = {
+                "count": self.time_counts[stat],
+                "total": self.time_stats[stat],
+            }
+            for p in Profiler.PERCENTILES:
+                entry[f"p{p}"] = histogram.percentile(p)
+            stats[stat.name] = entry
+        return {
+            "stats": stats,
+            "counters": {c.name: n for c, n in self.counters.items() if n},
+        }
+
+    def get_pass_stats_str(self) -> str:
+        """Return a table of time spent per randomization pass, slowest first."""
+        lines = ["Randomization pass timings:"]
+        for name in sorted(self.pass_stats, key=lambda n: -self.pass_stats[n]):
+            total = self.pass_stats[name]
+            count = self.pass_counts[name]
+            lines.append(
+                f"  {name.ljust(32)} {count:>8} calls {1000 * total:>10.1f} ms "
+                f"{1000 * total / count:>8.3f} ms/call"
+            )
+        return "\n".join(lines)
+
 
 class Timer:
     def __init__(self) -> None:
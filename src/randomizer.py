@@ -36,6 +36,7 @@ from .ast_types import (
     set_decl_name,
     pointer_decay,
 )
+from .profiler import Profiler, Timer
 
 # Set to true to perform expression type detection eagerly. This can help when
 # debugging crashes in the ast_types code.
@@ -2454,19 +2455,30 @@ class Randomizer:
                 )
                 sys.exit(1)
 
+        self.set_weights(randomization_weights)
+
+    def set_weights(self, randomization_weights: Mapping[str, float]) -> None:
         self.methods = [
             (method, randomization_weights[method.__name__])
             for method in RANDOMIZATION_PASSES
         ]
 
-    def randomize(self, ast: ca.FileAST, fn_name: str) -> None:
+    def randomize(
+        self, ast: ca.FileAST, fn_name: str, profiler: Optional[Profiler] = None
+    ) -> str:
+        """Apply a random randomization pass to the given function, returning
+        the name of the pass."""
         fn = ast_util.extract_fn(ast, fn_name)[0]
         indices = ast_util.compute_node_indices(fn)
         region = get_randomization_region(fn, indices, self.random)
+        timer = Timer()
         while True:
             method = random_weighted(self.random, self.methods)
             try:
                 method(fn, ast, indices, region, self.random)
-                break
+                return method.__name__
             except RandomizationFailure:
                 pass
+            finally:
+                if profiler is not None:
+                    profiler.add_pass_stat(method.__name__, timer.tick())
@@ -0,0 +1,72 @@
+"""Splitting a worker's time between the permuters of a run, when several
+directories are passed."""
+from typing import List, Sequence
+
+# How quickly improvements are forgotten by the "improvement" policy: the
+# weight of an improvement halves after this many seconds of evaluation.
+IMPROVEMENT_HALF_LIFE = 300.0
+
+# Weight of a permuter that hasn't improved recently, relative to one
+# improvement, for the "improvement" policy. Keeps stalled permuters from
+# being starved completely.
+IMPROVEMENT_PRIOR = 1.0
+
+# Policies for --schedule. "round-robin" gives each permuter the same number
+# of iterations, and doesn't need a SeedScheduler.
+SCHEDULE_POLICIES = ["round-robin", "time", "improvement"]
+
+
+class SeedScheduler:
+    """Decides which permuter to evaluate a seed for next, based on measured
+    time per iteration. Each permuter gets a share of the time proportional to
+    its weight: its priority, times, with the "improvement" policy, how much
+    it has improved recently. This is done by stride scheduling: time spent is
+    scaled down by weight, and the permuter with the least scaled time goes
+    next."""
+
+    def __init__(self, policy: str, priorities: Sequence[float]) -> None:
+        assert policy in ("time", "improvement")
+        self.policy = policy
+        self.priorities = list(priorities)
+        self._virtual_time = [0.0] * len(priorities)
+        self._recent = [0.0] * len(priorities)
+
+    def weight(self, index: int) -> float:
+        weight = self.priorities[index]
+        if self.policy == "improvement":
+            weight *= IMPROVEMENT_PRIOR + self._recent[index]
+        return weight
+
+    def add(self, priority: float, active: List[int]) -> int:
+        """Add a permuter, returning its index. It starts out level with the
+        given active permuters, so that it neither starves them nor gets
+        starved."""
+        self.priorities.append(priority)
+        self._virtual_time.append(self._floor(active))
+        self._recent.append(0.0)
+        return len(self.priorities) - 1
+
+    def rejoin(self, index: int, active: List[int]) -> None:
+        """Bring a permuter that has been left out for a while level with the
+        active ones, so that it doesn't get to make up for lost time."""
+        self._virtual_time[index] = max(self._virtual_time[index], self._floor(active))
+
+    def _floor(self, active: List[int]) -> float:
+        if not active:
+            return max(self._virtual_time, default=0.0)
+        return min(self._virtual_time[i] for i in active)
+
+    def pick(self, active: List[int]) -> int:
+        """Pick one of the given permuter indices."""
+        return min(active, key=lambda i: self._virtual_time[i])
+
+    def record(self, index: int, seconds: float, improved: bool) -> None:
+        """Record how long an iteration took, and whether it found a better
+        score than before."""
+        self._virtual_time[index] += seconds / max(self.weight(index), 1e-9)
+        if self.policy == "improvement":
+            decay = 0.5 ** (seconds / IMPROVEMENT_HALF_LIFE)
+            for i in range(len(self._recent)):
+                self._recent[i] *= decay
+            if improved:
+                self._recent[index] += 1.0
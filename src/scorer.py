@@ -1,10 +1,28 @@
+from dataclasses import dataclass
 import difflib
 import hashlib
 import re
+import struct
 from typing import Dict, List, Optional, Sequence, Tuple
 from collections import Counter
 
-from .objdump import ArchSettings, Line, objdump, get_arch
+from .cache import LRUCache
+from .disasm import builtin_objdump
+from .elf import ElfError, read_elf
+from .objdump import ArchSettings, Line, objdump, get_arch, simplify_objdump
+from .profiler import Profiler, Timer
+
+
+@dataclass
+class Disassembly:
+    """Result of Scorer.disassemble: the hash of the raw .text and its
+    relocations, and the disassembly, if it was needed."""
+
+    raw_hash: Optional[bytes]
+    lines: Optional[Tuple[str, List[Line]]]
+    # Time taken by each step, if it ran, for the profiler.
+    hash_time: Optional[float] = None
+    objdump_time: Optional[float] = None
 
 
 class Scorer:
@@ -16,6 +34,9 @@ class Scorer:
     PENALTY_INSERTION = 100
     PENALTY_DELETION = 100
 
+    # Number of raw object hashes to remember scores for.
+    RAW_CACHE_SIZE = 20000
+
     def __init__(
         self,
         target_o: str,
@@ -23,28 +44,126 @@ class Scorer:
         stack_differences: bool,
         algorithm: str,
         debug_mode: bool,
+        builtin_disasm: bool = False,
     ):
         self.target_o = target_o
         self.arch = get_arch(target_o)
         self.stack_differences = stack_differences
         self.algorithm = algorithm
         self.debug_mode = debug_mode
-        _, self.target_seq = self._objdump(target_o)
+        self.builtin_disasm = builtin_disasm
+        target_output, self.target_seq = self._objdump(target_o)
+        self.target_hash = hashlib.sha256(target_output.encode()).hexdigest()
+        self.target_raw_hash = self._raw_hash(target_o)
+        self._raw_cache: LRUCache[bytes, Tuple[int, str]] = LRUCache(
+            self.RAW_CACHE_SIZE
+        )
         self.difflib_differ: difflib.SequenceMatcher[str] = difflib.SequenceMatcher(
             autojunk=False
         )
         self.difflib_differ.set_seq2([line.mnemonic for line in self.target_seq])
 
     def _objdump(self, o_file: str) -> Tuple[str, List[Line]]:
-        lines = objdump(o_file, self.arch, stack_differences=self.stack_differences)
+        raw_lines = None
+        if self.builtin_disasm:
+            # Returns None for architectures the built-in disassembler doesn't
+            # handle, in which case we fall back to objdump.
+            raw_lines = builtin_objdump(o_file, self.arch.name)
+        if raw_lines is not None:
+            lines = simplify_objdump(
+                raw_lines, self.arch, stack_differences=self.stack_differences
+            )
+        else:
+            lines = objdump(o_file, self.arch, stack_differences=self.stack_differences)
         return "\n".join([line.row for line in lines]), lines
 
-    def score(self, cand_o: Optional[str]) -> Tuple[int, str]:
+    def _raw_hash(self, o_file: str) -> Optional[bytes]:
+        """Hash the executable sections of an object file together with their
+        relocations. Objects with the same raw hash disassemble identically,
+        so this lets us skip objdump for repeats."""
+        try:
+            elf = read_elf(o_file)
+        except (ElfError, struct.error, IndexError):
+            return None
+        h = hashlib.sha256()
+        for section in elf.text_sections():
+            h.update(f"{section.name}\0{len(section.data)}\0".encode())
+            h.update(section.data)
+            for r in section.relocations:
+                h.update(f"{r.offset}:{r.type}:{r.sym_name}:{r.addend}\0".encode())
+        return h.digest()
+
+    def score(
+        self, cand_o: Optional[str], profiler: Optional[Profiler] = None
+    ) -> Tuple[int, str]:
         if not cand_o:
             return Scorer.PENALTY_INF, ""
-
-        objdump_output, cand_seq = self._objdump(cand_o)
-
+        return self.score_disassembly(cand_o, self.disassemble(cand_o), profiler)
+
+    def disassemble(self, cand_o: str) -> "Disassembly":
+        """Do the part of scoring that runs external tools, and doesn't touch
+        any state. This may be called off the main thread, while the rest is
+        done by score_disassembly. Disassembly is skipped if the object file
+        turns out to be a known one."""
+        # Debug mode wants to see the diff, so don't take shortcuts there.
+        if self.debug_mode:
+            timer = Timer()
+            return Disassembly(None, self._objdump(cand_o), objdump_time=timer.tick())
+        timer = Timer()
+        raw_hash = self._raw_hash(cand_o)
+        hash_time = timer.tick()
+        if raw_hash is not None and (
+            raw_hash == self.target_raw_hash or raw_hash in self._raw_cache
+        ):
+            return Disassembly(raw_hash, None, hash_time)
+        lines = self._objdump(cand_o)
+        return Disassembly(raw_hash, lines, hash_time, timer.tick())
+
+    def score_disassembly(
+        self,
+        cand_o: str,
+        disassembly: "Disassembly",
+        profiler: Optional[Profiler] = None,
+    ) -> Tuple[int, str]:
+        if profiler is not None:
+            if disassembly.hash_time is not None:
+                profiler.add_stat(Profiler.StatType.hash, disassembly.hash_time)
+            if disassembly.objdump_time is not None:
+                profiler.add_stat(Profiler.StatType.objdump, disassembly.objdump_time)
+        raw_hash = disassembly.raw_hash
+        if raw_hash is not None:
+            if raw_hash == self.target_raw_hash:
+                if profiler is not None:
+                    profiler.add_count(Profiler.CounterType.score_exact)
+                return 0, self.target_hash
+            cached = self._raw_cache.get(raw_hash)
+            if profiler is not None:
+                counter = (
+                    Profiler.CounterType.score_cache_hit
+                    if cached is not None
+                    else Profiler.CounterType.score_cache_miss
+                )
+                profiler.add_count(counter)
+            if cached is not None:
+                return cached
+
+        # The cache entry may have been evicted since disassemble checked it.
+        timer = Timer()
+        lines = disassembly.lines
+        if lines is None:
+            lines = self._objdump(cand_o)
+            if profiler is not None:
+                profiler.add_stat(Profiler.StatType.objdump, timer.tick())
+        ret = self._score_lines(*lines)
+        if profiler is not None:
+            profiler.add_stat(Profiler.StatType.diff, timer.tick())
+        if raw_hash is not None:
+            self._raw_cache.put(raw_hash, ret)
+        return ret
+
+    def _score_lines(
+        self, objdump_output: str, cand_seq: List[Line]
+    ) -> Tuple[int, str]:
         num_stack_penalties = 0
         num_regalloc_penalties = 0
         num_reordering_penalties = 0
@@ -0,0 +1,218 @@
+"""Search strategies other than the default chain of randomizations (where each
+worker keeps mutating its last candidate with probability keep_prob)."""
+from dataclasses import dataclass
+import math
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .candidate import CandidateSnapshot
+
+# Default number of candidates kept in a --search=population population.
+DEFAULT_POPULATION_SIZE = 16
+
+# Number of population members competing to become the parent of the next
+# candidate. Higher values focus the search more on the best candidates.
+TOURNAMENT_SIZE = 3
+
+# Default --search=anneal starting temperature, relative to the base score.
+DEFAULT_ANNEAL_TEMP_FRACTION = 0.05
+
+# Default length in seconds of an annealing cycle, after which the temperature
+# is raised back to the starting temperature.
+DEFAULT_ANNEAL_TIME = 600.0
+
+# Ratio between the temperatures at the end and the start of a cycle. Also the
+# ratio between the coldest and hottest replica for --search=tempering.
+ANNEAL_END_TEMP_RATIO = 0.001
+
+# Number of iterations between each --search=tempering worker offering up its
+# current candidate for swapping with neighboring temperatures.
+TEMPERING_SWAP_INTERVAL = 20
+
+
+@dataclass
+class PopulationEntry:
+    score: int
+    hash: str
+    snapshot: CandidateSnapshot
+
+
+class Population:
+    """A fixed-size set of the best-scoring candidates seen so far, with
+    distinct assembly.
+
+    The parent process keeps the authoritative copy, and every worker keeps a
+    replica that it picks parents from. Since insertion is deterministic,
+    replicas stay in sync by having the same entries added in the same order."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.entries: List[PopulationEntry] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def copy(self) -> "Population":
+        ret = Population(self.size)
+        ret.entries = self.entries[:]
+        return ret
+
+    def _worst_index(self) -> int:
+        # The oldest of the worst entries, so that candidates with equal
+        # scores but different assembly keep cycling through.
+        worst = max(entry.score for entry in self.entries)
+        return next(i for i, e in enumerate(self.entries) if e.score == worst)
+
+    def accepts(self, score: int) -> bool:
+        """Check whether a new candidate with the given score would be added."""
+        if len(self.entries) < self.size:
+            return True
+        return score <= self.entries[self._worst_index()].score
+
+    def add(self, entry: PopulationEntry) -> bool:
+        """Try to add a candidate, evicting the worst one if full. Returns
+        False if it isn't good enough, or its assembly is already present."""
+        if any(e.hash == entry.hash for e in self.entries):
+            return False
+        if len(self.entries) < self.size:
+            self.entries.append(entry)
+            return True
+        index = self._worst_index()
+        if entry.score > self.entries[index].score:
+            return False
+        del self.entries[index]
+        self.entries.append(entry)
+        return True
+
+    def select(self) -> PopulationEntry:
+        """Pick a parent for the next candidate by tournament selection."""
+        contestants = random.sample(
+            self.entries, min(TOURNAMENT_SIZE, len(self.entries))
+        )
+        return min(contestants, key=lambda entry: entry.score)
+
+
+@dataclass
+class AnnealSchedule:
+    # None means a fraction of the base score.
+    start_temp: Optional[float] = None
+    # Length of a cooling cycle, in seconds or iterations.
+    period: float = DEFAULT_ANNEAL_TIME
+    by_iterations: bool = False
+
+
+class Annealer:
+    """Simulated annealing state for a single worker: the current candidate,
+    and a temperature that decreases geometrically over each cycle, following
+    either wall-clock time or iteration count. New candidates are accepted
+    always if they are no worse, and otherwise with probability
+    exp(-delta / temperature)."""
+
+    def __init__(self, schedule: AnnealSchedule, base_score: int) -> None:
+        self.schedule = schedule
+        self.start_temp = max(base_score * DEFAULT_ANNEAL_TEMP_FRACTION, 1.0)
+        if schedule.start_temp is not None:
+            self.start_temp = schedule.start_temp
+        self.current: Optional[CandidateSnapshot] = None
+        self.current_score = base_score
+        self.best_score = base_score
+        # For --search=tempering, a constant temperature relative to the start
+        # temperature.
+        self.level: Optional[float] = None
+        self._start_time: Optional[float] = None
+        self._iterations = 0
+
+    def temperature(self) -> float:
+        if self.level is not None:
+            return self.start_temp * self.level
+        if self.schedule.by_iterations:
+            elapsed = float(self._iterations)
+        else:
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+            elapsed = time.monotonic() - self._start_time
+        progress = (elapsed / self.schedule.period) % 1.0
+        return self.start_temp * math.pow(ANNEAL_END_TEMP_RATIO, progress)
+
+    def accept(self, score: int) -> bool:
+        """Decide whether to move on to a candidate with the given score."""
+        self._iterations += 1
+        delta = score - self.current_score
+        if delta <= 0:
+            return True
+        return random.random() < math.exp(-delta / self.temperature())
+
+    def move_to(self, snapshot: CandidateSnapshot, score: int) -> None:
+        self.current = snapshot
+        self.current_score = score
+        self.best_score = min(self.best_score, score)
+
+
+def replica_level(replica: int, num_replicas: int) -> float:
+    """Temperature of a --search=tempering replica relative to the start
+    temperature, from 1 for replica 0 down to ANNEAL_END_TEMP_RATIO."""
+    if num_replicas <= 1:
+        return 1.0
+    return math.pow(ANNEAL_END_TEMP_RATIO, replica / (num_replicas - 1))
+
+
+@dataclass
+class ReplicaState:
+    """The current candidate of a --search=tempering worker, sent to the parent
+    process to be considered for swapping with a neighboring temperature."""
+
+    perm_index: int
+    replica: int
+    snapshot: CandidateSnapshot
+    score: int
+    best_score: int
+
+
+class ReplicaExchange:
+    """Parent-side bookkeeping for --search=tempering, for a single permuter.
+
+    Workers offer up their states asynchronously. When two neighboring
+    replicas both have a state waiting, they are swapped with the usual
+    Metropolis probability min(1, exp((E_i - E_j) * (1/T_i - 1/T_j))). Either
+    way both states are consumed, so each state takes part in at most one
+    swap attempt."""
+
+    def __init__(self, temperatures: List[float]) -> None:
+        self.temperatures = temperatures
+        self.best_scores: List[Optional[int]] = [None] * len(temperatures)
+        self.attempts = [0] * max(len(temperatures) - 1, 0)
+        self.swaps = [0] * max(len(temperatures) - 1, 0)
+        self._waiting: Dict[int, ReplicaState] = {}
+
+    def add_state(self, state: ReplicaState) -> List[Tuple[int, ReplicaState]]:
+        """Record a state from a worker. Returns a list of (replica, new state)
+        pairs telling which workers should switch to which states."""
+        r = state.replica
+        best = self.best_scores[r]
+        if best is None or state.best_score < best:
+            self.best_scores[r] = state.best_score
+        self._waiting[r] = state
+        neighbors = [n for n in (r - 1, r + 1) if n in self._waiting]
+        if not neighbors:
+            return []
+        n = random.choice(neighbors)
+        other = self._waiting.pop(n)
+        del self._waiting[r]
+        pair = min(r, n)
+        self.attempts[pair] += 1
+        exponent = (state.score - other.score) * (
+            1 / self.temperatures[r] - 1 / self.temperatures[n]
+        )
+        if exponent < 0 and random.random() >= math.exp(exponent):
+            return []
+        self.swaps[pair] += 1
+        return [(r, other), (n, state)]
+
+    def get_str_stats(self) -> str:
+        best = "/".join("-" if b is None else str(b) for b in self.best_scores)
+        rates = "/".join(
+            f"{100 * s / a:.0f}%" if a else "-"
+            for s, a in zip(self.swaps, self.attempts)
+        )
+        return f"replica best {best}, swaps {rates}"
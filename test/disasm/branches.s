@@ -0,0 +1,37 @@
+# Branches forwards and backwards, likely branches and FPU branches.
+	.set noreorder
+	.text
+	.globl branches
+branches:
+	move	$v0, $zero
+	beqz	$a0, .Lend
+	nop
+.Lloop:
+	addiu	$v0, $v0, 1
+	bne	$v0, $a1, .Lloop
+	nop
+	bltz	$a0, .Lneg
+	nop
+	bgez	$a1, .Lend
+	nop
+	blez	$a2, .Lloop
+	nop
+	bgtz	$a3, .Lend
+	nop
+	beql	$a0, $a1, .Lloop
+	addiu	$v0, $v0, 2
+	bnezl	$a0, .Lend
+	addiu	$v0, $v0, 3
+	c.lt.s	$f12, $f14
+	bc1t	.Lend
+	nop
+	bc1f	.Lneg
+	nop
+	b	.Lend
+	nop
+.Lneg:
+	j	.Lloop
+	nop
+.Lend:
+	jr	$ra
+	nop
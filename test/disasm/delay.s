@@ -0,0 +1,24 @@
+# Delay slots filled with real instructions, and indirect jumps.
+	.set noreorder
+	.text
+	.globl delay
+delay:
+	addiu	$sp, $sp, -32
+	sw	$ra, 28($sp)
+	sw	$s0, 24($sp)
+	jalr	$a0
+	move	$s0, $a1
+	beq	$v0, $s0, 1f
+	sll	$v0, $v0, 2
+	addu	$v0, $v0, $s0
+1:	jal	callee
+	sw	$v0, 16($sp)
+	div	$zero, $v0, $s0
+	bnez	$s0, 2f
+	nop
+	break	7
+2:	mflo	$v0
+	lw	$s0, 24($sp)
+	lw	$ra, 28($sp)
+	jr	$ra
+	addiu	$sp, $sp, 32
@@ -0,0 +1,16 @@
+#!/bin/bash
+# Reassemble the fixtures and store what the objdump scoring path makes of
+# them, one Line per row, for test_disasm.py. Needs llvm-mc and MIPS binutils.
+# Check that the new output is right before committing it.
+set -e
+cd "$(dirname "$0")"
+for s in *.s; do
+    name="${s%.s}"
+    llvm-mc -triple=mips-linux-gnu -mcpu=mips3 -mattr=+noabicalls -filetype=obj "$s" -o "$name.o"
+    (cd ../.. && python3 -c '
+import sys
+from src.objdump import MIPS_SETTINGS, objdump
+for line in objdump(sys.argv[1], MIPS_SETTINGS, stack_differences=True):
+    print(line)
+' "test/disasm/$name.o") > "$name.lines"
+done
@@ -0,0 +1,36 @@
+# Relocations: %hi/%lo pairs, calls, and references with addends.
+	.set noreorder
+	.set noat
+	.text
+	.globl relocs
+relocs:
+	addiu	$sp, $sp, -24
+	sw	$ra, 20($sp)
+	lui	$a0, %hi(data)
+	addiu	$a0, $a0, %lo(data)
+	lui	$t0, %hi(data + 8)
+	lw	$t1, %lo(data + 8)($t0)
+	lui	$at, %hi(fval)
+	lwc1	$f0, %lo(fval)($at)
+	jal	external
+	move	$a1, $t1
+	lw	$ra, 20($sp)
+	jr	$ra
+	addiu	$sp, $sp, 24
+
+local:
+	li	$v0, 0x8000
+	li	$v1, -5
+	jr	$ra
+	negu	$v0, $v0
+
+	.section .text.other, "ax", @progbits
+	.globl other
+other:
+	lui	$v0, %hi(relocs)
+	jr	$ra
+	addiu	$v0, $v0, %lo(relocs)
+
+	.data
+data:
+	.word	1, 2, 3, 4
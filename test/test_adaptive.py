@@ -0,0 +1,44 @@
+import unittest
+
+from src.adaptive import PassBandit, PassOutcome
+
+
+class TestPassBandit(unittest.TestCase):
+    def make(self) -> PassBandit:
+        return PassBandit(
+            {"good": 10.0, "bad": 10.0, "off": 0.0}, floor=0.2, update_interval=10
+        )
+
+    def test_untrained(self) -> None:
+        weights = self.make().weights()
+        self.assertAlmostEqual(weights["good"], 10.0)
+        self.assertAlmostEqual(weights["bad"], 10.0)
+        self.assertEqual(weights["off"], 0.0)
+
+    def test_learns(self) -> None:
+        bandit = self.make()
+        updates = 0
+        for _ in range(500):
+            updates += bandit.record("good", PassOutcome.better_or_equal)
+            updates += bandit.record("bad", PassOutcome.compile_error)
+        self.assertEqual(updates, 100)
+        weights = bandit.weights()
+        self.assertAlmostEqual(sum(weights.values()), 20.0)
+        self.assertGreater(weights["good"], 15.0)
+        # The floor keeps unsuccessful passes alive.
+        self.assertGreaterEqual(weights["bad"], 0.2 * 10.0)
+        self.assertEqual(weights["off"], 0.0)
+
+    def test_unknown_pass(self) -> None:
+        bandit = self.make()
+        self.assertFalse(bandit.record("missing", PassOutcome.worse))
+
+    def test_weight_overrides_toml(self) -> None:
+        toml_str = self.make().weight_overrides_toml()
+        self.assertEqual(
+            toml_str, "[weight_overrides]\nbad = 10.00\ngood = 10.00\noff = 0.00\n"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import time
+from typing import Any, Iterator
+import unittest
+
+from src.api import Event, Function, PermuterPool, StatsTick
+
+
+class TestApi(unittest.TestCase):
+    def test_apermute_cancel(self) -> None:
+        # Cancelling the async iterator while a result is being waited for
+        # closes the underlying generator once it is done waiting.
+        closed = threading.Event()
+
+        def permute(function: Function, **kwargs: Any) -> Iterator[Event]:
+            try:
+                while True:
+                    time.sleep(0.2)
+                    yield StatsTick(0, 0, 0.0, 1, 1)
+            finally:
+                closed.set()
+
+        pool = PermuterPool(1)
+        setattr(pool, "permute", permute)
+
+        async def consume() -> None:
+            async for _ in pool.apermute(Function("", b"", "true")):
+                pass
+
+        async def cancel() -> None:
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel())
+        self.assertTrue(closed.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
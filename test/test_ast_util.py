@@ -0,0 +1,94 @@
+import copy
+from typing import Any, Dict, List
+import unittest
+
+from pycparser import c_ast as ca
+
+from src.ast_util import _get_node_slots, clone_ast, parse_c, to_c
+
+SOURCE = """
+typedef unsigned int u32;
+typedef struct Vec {
+    float x, y, z;
+    struct Vec *next;
+} Vec;
+union Bits { u32 word; char bytes[4]; };
+enum Kind { KIND_A, KIND_B = 4 };
+extern Vec gVecs[8];
+#pragma GLOBAL_ASM("asm/nonmatchings/func_80001234.s")
+int test(Vec *v, enum Kind kind) {
+    u32 a = 0, *b = &a;
+    #pragma _permuter sameline start
+    v->x = 1.0f;
+    v->y = 2.0f;
+    #pragma _permuter sameline end
+    switch (kind) {
+    case KIND_A:
+        a += (u32) v->next->z;
+    case KIND_B:
+        *b = gVecs[a & 7].y > 0 ? 1 : 2;
+        break;
+    default:
+        return -1;
+    }
+    return a;
+}
+"""
+
+
+def _objects(node: ca.Node) -> List[Any]:
+    """All nodes and lists in an AST, in traversal order, with repeats where
+    they are shared."""
+    ret: List[Any] = []
+    seen: Dict[int, bool] = {}
+
+    def visit(value: Any) -> None:
+        if not isinstance(value, (ca.Node, list)):
+            return
+        ret.append(value)
+        if id(value) in seen:
+            return
+        seen[id(value)] = True
+        if isinstance(value, list):
+            for item in value:
+                visit(item)
+        else:
+            for slot in _get_node_slots(type(value)):
+                visit(getattr(value, slot))
+
+    visit(node)
+    return ret
+
+
+class TestCloneAst(unittest.TestCase):
+    def test_matches_deepcopy(self) -> None:
+        ast = parse_c(SOURCE)
+        cloned = clone_ast(ast)
+        assert isinstance(cloned, ca.FileAST)
+        deep = copy.deepcopy(ast)
+        self.assertEqual(to_c(cloned), to_c(deep))
+        self.assertEqual(to_c(cloned), to_c(ast))
+
+        # Nothing mutable is shared with the original...
+        orig_objects = _objects(ast)
+        cloned_objects = _objects(cloned)
+        orig_ids = {id(o) for o in orig_objects}
+        self.assertFalse(any(id(o) in orig_ids for o in cloned_objects))
+
+        # ...while sharing within the tree is preserved, as with deepcopy.
+        def sharing(objects: List[Any]) -> List[int]:
+            first: Dict[int, int] = {}
+            return [first.setdefault(id(o), i) for i, o in enumerate(objects)]
+
+        deep_objects = _objects(deep)
+        self.assertEqual(
+            [type(o) for o in cloned_objects], [type(o) for o in deep_objects]
+        )
+        self.assertEqual(sharing(cloned_objects), sharing(deep_objects))
+
+        # Mutating the clone leaves the original alone.
+        before = to_c(ast)
+        fn = cloned.ext[-1]
+        assert isinstance(fn, ca.FuncDef)
+        fn.body.block_items = []
+        self.assertEqual(to_c(ast), before)
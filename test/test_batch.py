@@ -0,0 +1,29 @@
+import os
+import tempfile
+import unittest
+
+from src.batch import INPUT_FILES, find_directories
+
+
+class TestBatch(unittest.TestCase):
+    def test_find_directories(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            for d in ["a", "b/c", "b/c/output-5-1", "b/d", "e"]:
+                os.makedirs(os.path.join(root, d))
+                if d != "b/d":
+                    for f in INPUT_FILES:
+                        open(os.path.join(root, d, f), "w").close()
+            os.remove(os.path.join(root, "e", "target.o"))
+
+            found = [os.path.relpath(d, root) for d in find_directories([root])]
+            self.assertEqual(found, ["a", os.path.join("b", "c")])
+
+            found = [
+                os.path.relpath(d, root)
+                for d in find_directories([os.path.join(root, "b*")])
+            ]
+            self.assertEqual(found, [os.path.join("b", "c")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from src.cache import DigestTable, DiskCache, LRUCache, SharedState
+
+
+def digest(i: int) -> bytes:
+    return hashlib.sha256(str(i).encode()).digest()
+
+
+def read_shared(shared: SharedState, out: "multiprocessing.Queue[object]") -> None:
+    out.put((shared.best_score(1), shared.seen(1, digest(1))))
+    shared.close()
+
+
+class TestCaches(unittest.TestCase):
+    def test_lru(self) -> None:
+        cache: LRUCache[int, int] = LRUCache(2)
+        cache.put(1, 1)
+        cache.put(2, 2)
+        self.assertEqual(cache.get(1), 1)
+        cache.put(3, 3)
+        self.assertEqual(cache.get(2), None)
+        self.assertEqual(cache.get(1), 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_digest_table(self) -> None:
+        table = DigestTable(DigestTable.BYTES_PER_ENTRY * DigestTable.WAYS * 4)
+        self.assertEqual(table.capacity, 32)
+        evictions = sum(table.put(digest(i), i) for i in range(100))
+        self.assertEqual(evictions, 100 - table.capacity)
+        present = [i for i in range(100) if table.get(digest(i)) == i]
+        self.assertEqual(len(present), table.capacity)
+        self.assertNotIn(digest(1000), table)
+        self.assertNotIn("not a digest", table)
+
+    def test_digest_table_second_chance(self) -> None:
+        table = DigestTable(DigestTable.BYTES_PER_ENTRY * DigestTable.WAYS)
+        for i in range(8):
+            table.put(digest(i), i)
+        # Inserting clears all reference bits and evicts entry 0; afterwards,
+        # entries that are looked up again survive the next eviction.
+        table.put(digest(8), 8)
+        self.assertIsNone(table.get(digest(0)))
+        self.assertEqual(table.get(digest(1)), 1)
+        table.put(digest(9), 9)
+        self.assertEqual(table.get(digest(1)), 1)
+        self.assertIsNone(table.get(digest(2)))
+
+    def test_digest_table_pickle(self) -> None:
+        table = DigestTable(1 << 16)
+        table.put(digest(1), 5)
+        copy = pickle.loads(pickle.dumps(table))
+        self.assertEqual(copy.get(digest(1)), 5)
+        self.assertEqual(copy.capacity, table.capacity)
+
+    def test_disk_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            path = os.path.join(cache_dir, "cache.sqlite3")
+            cache = DiskCache(path, namespace=b"a", max_bytes=1 << 20)
+            cache.put(digest(1), 42, "hash")
+            # A second lookup, through a separate connection as another
+            # worker or a later run would have, finds what was stored.
+            other = pickle.loads(pickle.dumps(cache))
+            self.assertEqual(other.get(digest(1)), (42, "hash"))
+            self.assertIsNone(other.get(digest(2)))
+            different = DiskCache(path, namespace=b"b", max_bytes=1 << 20)
+            self.assertIsNone(different.get(digest(1)))
+
+            # Hits only write to the database for stale entries.
+            conn = sqlite3.connect(path, isolation_level=None)
+            conn.execute("UPDATE scores SET last_used = 1000")
+            other.TOUCH_INTERVAL = float("inf")
+            other.get(digest(1))
+            self.assertEqual(
+                conn.execute("SELECT last_used FROM scores").fetchone()[0], 1000
+            )
+            del other.TOUCH_INTERVAL
+            other.get(digest(1))
+            self.assertGreater(
+                conn.execute("SELECT last_used FROM scores").fetchone()[0], 1000
+            )
+
+            # While another process holds the write lock, reads still work,
+            # and writes give up quickly.
+            conn.execute("UPDATE scores SET last_used = 1000")
+            conn.execute("BEGIN EXCLUSIVE")
+            start = time.monotonic()
+            self.assertEqual(other.get(digest(1)), (42, "hash"))
+            other.put(digest(3), 3, "hash3")
+            self.assertLess(time.monotonic() - start, 5)
+            conn.execute("ROLLBACK")
+            self.assertIsNone(other.get(digest(3)))
+            conn.close()
+
+    def test_shared_state(self) -> None:
+        shared = SharedState(2, 1 << 12)
+        try:
+            self.assertEqual(shared.best_score(0), SharedState.NO_SCORE)
+            shared.set_best_score(1, 300)
+            shared.add_seen(1, digest(1))
+            self.assertTrue(shared.seen(1, digest(1)))
+            self.assertFalse(shared.seen(0, digest(1)))
+            self.assertFalse(shared.seen(1, digest(2)))
+
+            # Workers attach to the same memory. With spawn, they do so by
+            # unpickling it, which forked workers skip.
+            ctx = multiprocessing.get_context("spawn")
+            out: "multiprocessing.Queue[object]" = ctx.Queue()
+            p = ctx.Process(target=read_shared, args=(shared, out))
+            p.start()
+            self.assertEqual(out.get(), (300, True))
+            p.join()
+        finally:
+            shared.close()
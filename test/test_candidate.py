@@ -0,0 +1,103 @@
+from base64 import b64encode
+import unittest
+
+from src.ast_util import to_c
+from src.candidate import Candidate
+from src.helpers import get_default_randomization_weights
+from src.perm.perm import EvalState
+
+SOURCE = """
+int foo(int);
+int test(int a, int b) {
+    int x = foo(a + b);
+    return x * 3 + a;
+}
+"""
+
+# Pragmas in and around the target function, including blocks that span
+# several top-level nodes.
+PRAGMA_SOURCE = f"""
+#pragma _permuter latedefine start
+#pragma _permuter define SCALE 3
+#pragma _permuter latedefine end
+#pragma _permuter sameline start
+int foo(int);
+int gArr[4];
+#pragma _permuter sameline end
+int gFixed = FIXEDADDR(0x1234);
+#pragma _permuter b64literal {b64encode(b"/* literal */").decode()}
+int test(int a, int b) {{
+    int x = foo(a + b);
+#pragma _permuter sameline start
+    gArr[a] = x;
+    gArr[b] = x * 2;
+#pragma _permuter sameline end
+    return x * 3 + a;
+}}
+int after(void) {{ return gFixed; }}
+"""
+
+
+class TestCandidate(unittest.TestCase):
+    def test_snapshot_roundtrip(self) -> None:
+        # Inlining adds a new function outside of the target one, which must
+        # survive the snapshot.
+        weights = {name: 0.0 for name in get_default_randomization_weights("base")}
+        weights["perm_inline"] = 1.0
+        weights["perm_temp_for_expr"] = 1.0
+        saw_inline = False
+        for seed in range(1, 20):
+            cand = Candidate.from_source(
+                SOURCE, EvalState(), "test", weights, rng_seed=seed
+            )
+            for _ in range(3):
+                cand.randomize_ast()
+            source = cand.get_source()
+            saw_inline = saw_inline or "inline_fn" in source
+            copy = Candidate.from_source(
+                SOURCE,
+                EvalState(),
+                "test",
+                weights,
+                rng_seed=seed,
+                snapshot=cand.snapshot(0),
+            )
+            self.assertEqual(copy.get_source(), source)
+            # Randomizing the copy must not affect the original.
+            before = to_c(cand.ast)
+            copy.randomize_ast()
+            self.assertEqual(to_c(cand.ast), before)
+        self.assertTrue(saw_inline)
+
+    def test_clone(self) -> None:
+        weights = get_default_randomization_weights("base")
+        cand = Candidate.from_source(SOURCE, EvalState(), "test", weights, rng_seed=1)
+        cand.randomize_ast()
+        source = cand.get_source()
+        for seed in range(1, 10):
+            clone = cand.clone(weights, seed)
+            self.assertEqual(clone.get_source(), source)
+            # The copies are randomized independently of the original.
+            clone.randomize_ast()
+            clone.randomize_ast()
+            self.assertEqual(cand.get_source(), source)
+            self.assertEqual(to_c(cand.ast), source)
+
+    def test_source_chunks(self) -> None:
+        # Splicing together generated code for each top-level node gives the
+        # same source as generating it all at once.
+        weights = get_default_randomization_weights("base")
+        for seed in range(1, 20):
+            cand = Candidate.from_source(
+                PRAGMA_SOURCE, EvalState(), "test", weights, rng_seed=seed
+            )
+            self.assertEqual(cand.get_source(), to_c(cand.ast))
+            for _ in range(4):
+                cand.randomize_ast()
+                self.assertEqual(cand.get_source(), to_c(cand.ast))
+        self.assertIn("#define SCALE 3", cand.get_source())
+        self.assertIn("gFixed : (0x1234)", cand.get_source())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from src.cache import DigestTable
+from src.checkpoint import (
+    CHECKPOINT_VERSION,
+    Checkpoint,
+    SeedProgress,
+    load_checkpoint,
+    save_checkpoint,
+)
+from src.error import CheckpointMismatch
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_seed_progress(self) -> None:
+        progress = SeedProgress(10, 3)
+        self.assertEqual([progress.shard_start(i) for i in range(3)], [4, 3, 3])
+        self.assertEqual(progress.position(), 10)
+        progress.finish(0, 2)
+        progress.finish(2)
+        self.assertEqual(progress.position(), 10)
+        progress.finish(1)
+        self.assertEqual(progress.position(), 13)
+        resumed = SeedProgress(progress.position(), 2)
+        self.assertEqual([resumed.shard_start(i) for i in range(2)], [7, 6])
+
+    def test_unanswered(self) -> None:
+        # Seeds handed out to permuter@home are kept until as many results
+        # have come back, since results don't say which seed they are for.
+        progress = SeedProgress(0, 2)
+        progress.hand_out(1, 1)
+        progress.hand_out(1, 3)
+        self.assertEqual(progress.position(), 0)
+        progress.finish(0, 2)
+        self.assertEqual(progress.position(), 4)
+        progress.answer()
+        self.assertEqual(progress.unanswered(), [1, 3])
+        progress.answer()
+        self.assertEqual(progress.unanswered(), [])
+
+        # On resume, they are handed out again first, and are still kept
+        # until answered.
+        resumed = SeedProgress(4, 2, [1, 3])
+        self.assertEqual(resumed.unanswered(), [1, 3])
+        seed = resumed.take_replay()
+        assert seed is not None
+        resumed.hand_out(1, seed, replayed=True)
+        self.assertEqual(sorted(resumed.unanswered()), [1, 3])
+        self.assertEqual(resumed.position(), 4)
+        resumed.answer()
+        self.assertEqual(resumed.unanswered(), [1 if seed == 3 else 3])
+
+    def test_roundtrip(self) -> None:
+        hashes = {b"\x01" * 32}
+        checkpoint = Checkpoint(
+            version=CHECKPOINT_VERSION,
+            namespace=b"ns",
+            best_score=123,
+            hashes=hashes,
+            score_for_source=DigestTable(1 << 12),
+            seed_key=42,
+            seed_position=7,
+            unanswered_seeds=[3, 5],
+            population=None,
+            bandit=None,
+        )
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "checkpoint.pkl")
+            self.assertIsNone(load_checkpoint(path, b"ns"))
+            save_checkpoint(path, checkpoint)
+            save_checkpoint(path, checkpoint)
+            self.assertEqual(os.listdir(d), ["checkpoint.pkl"])
+            loaded = load_checkpoint(path, b"ns")
+            assert loaded is not None
+            self.assertEqual(loaded.best_score, 123)
+            self.assertEqual(loaded.seed_position, 7)
+            self.assertEqual(loaded.unanswered_seeds, [3, 5])
+            self.assertIn(b"\x01" * 32, loaded.hashes)
+            with self.assertRaises(CheckpointMismatch):
+                load_checkpoint(path, b"other")
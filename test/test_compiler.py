@@ -0,0 +1,28 @@
+import contextlib
+import io
+import shutil
+import time
+import unittest
+
+from src.compiler import Compiler
+
+
+class TestCompileServer(unittest.TestCase):
+    def test_timeout(self) -> None:
+        # A server that never answers is killed, and compile.sh (here a
+        # failing stand-in) is used instead.
+        false = shutil.which("false")
+        assert false is not None
+        compiler = Compiler(
+            false,
+            show_errors=False,
+            debug_mode=False,
+            server_cmd="sleep 30",
+            server_timeout=0.2,
+        )
+        start = time.monotonic()
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertIsNone(compiler.compile("int x;"))
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertTrue(compiler._server_failed)
+        self.assertIsNone(compiler._server)
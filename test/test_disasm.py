@@ -0,0 +1,94 @@
+import os
+import shutil
+from typing import List
+import unittest
+
+from src.disasm import builtin_objdump, disassemble_mips_word
+from src.objdump import MIPS_SETTINGS, Line, objdump, simplify_objdump
+
+# Object files assembled from the .s files next to them, with what objdump()
+# makes of each. See regen.sh.
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "disasm")
+FIXTURES = ["relocs", "branches", "delay"]
+
+
+def format_lines(lines: List[Line]) -> str:
+    """The format of the .lines files, as regen.sh writes them."""
+    return "".join(f"{line}\n" for line in lines)
+
+
+class TestMipsDisasm(unittest.TestCase):
+    def check(self, word: int, expected: str, pc: int = 0) -> None:
+        self.assertEqual(disassemble_mips_word(word, pc), expected)
+
+    def test_aliases(self) -> None:
+        self.check(0x00000000, "nop")
+        self.check(0x2408FFFB, "li\tt0,-5")
+        self.check(0x34098000, "li\tt1,0x8000")
+        self.check(0x00402825, "move\ta1,v0")
+        self.check(0x10000003, "b\t10")
+        self.check(0x10400003, "beqz\tv0,10")
+        self.check(0x00021023, "negu\tv0,v0")
+        self.check(0x0320F809, "jalr\tt9")
+
+    def test_operands(self) -> None:
+        self.check(0x27BDFFE8, "addiu\tsp,sp,-24")
+        self.check(0xAFBF0014, "sw\tra,20(sp)")
+        self.check(0x3C048000, "lui\ta0,0x8000")
+        self.check(0x00041080, "sll\tv0,a0,0x2")
+        self.check(0x14450001, "bne\tv0,a1,28", pc=0x20)
+        self.check(0x0C000010, "jal\t40")
+        self.check(0xC4840008, "lwc1\t$f4,8(a0)")
+        self.check(0x46041000, "add.s\t$f0,$f2,$f4")
+        self.check(0x460E603C, "c.lt.s\t$f12,$f14")
+        self.check(0x444EF800, "cfc1\tt6,$31")
+        self.check(0x0085001A, "div\tzero,a0,a1")
+        self.check(0x00A001F4, "teq\ta1,zero,0x7")
+        self.check(0x0007000D, "break\t0x7")
+        self.check(0x03E00008, "jr\tra")
+
+    def test_unknown(self) -> None:
+        # MIPS IV movn isn't part of mips:4300.
+        self.check(0x0085100B, "0x85100b")
+
+
+class TestBuiltinObjdump(unittest.TestCase):
+    """Compare builtin_objdump with objdump after simplify_objdump, which is
+    all the scorer sees of either."""
+
+    def builtin(self, name: str) -> str:
+        lines = builtin_objdump(os.path.join(FIXTURE_DIR, name + ".o"), "mips")
+        assert lines is not None
+        return format_lines(
+            simplify_objdump(lines, MIPS_SETTINGS, stack_differences=True)
+        )
+
+    def test_golden(self) -> None:
+        for name in FIXTURES:
+            with self.subTest(name=name):
+                with open(os.path.join(FIXTURE_DIR, name + ".lines")) as f:
+                    self.assertEqual(self.builtin(name), f.read())
+
+    @unittest.skipUnless(
+        any(shutil.which(e) for e in MIPS_SETTINGS.executable), "needs MIPS objdump"
+    )
+    def test_objdump(self) -> None:
+        # Also catches golden files that have gone stale.
+        for name in FIXTURES:
+            with self.subTest(name=name):
+                expected = format_lines(
+                    objdump(
+                        os.path.join(FIXTURE_DIR, name + ".o"),
+                        MIPS_SETTINGS,
+                        stack_differences=True,
+                    )
+                )
+                with open(os.path.join(FIXTURE_DIR, name + ".lines")) as f:
+                    self.assertEqual(f.read(), expected)
+                self.assertEqual(self.builtin(name), expected)
+
+    def test_unsupported(self) -> None:
+        # PPC and ARM aren't handled yet, and fall back to objdump.
+        path = os.path.join(FIXTURE_DIR, "relocs.o")
+        self.assertIsNone(builtin_objdump(path, "ppc"))
+        self.assertIsNone(builtin_objdump(path, "arm32"))
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from src.governor import (
+    MIN_CAPACITY,
+    THROTTLE_INTERVAL,
+    Governor,
+    ThrottleTarget,
+    cgroup_cpu_limit,
+    parse_throttle,
+    set_capacity,
+)
+
+
+class TestGovernor(unittest.TestCase):
+    def test_parse(self) -> None:
+        self.assertEqual(parse_throttle("cpu=50"), ThrottleTarget("cpu", 50.0))
+        self.assertEqual(parse_throttle("load=3.5"), ThrottleTarget("load", 3.5))
+        self.assertEqual(parse_throttle("cgroup"), ThrottleTarget("cgroup", 100.0))
+        self.assertEqual(parse_throttle("cgroup=80%"), ThrottleTarget("cgroup", 80.0))
+        for bad in ["cpu", "cpu=150", "load=0", "load=x", "gpu=50"]:
+            with self.assertRaises(ValueError):
+                parse_throttle(bad)
+
+    def test_set_capacity(self) -> None:
+        duties = [0.0] * 4
+        set_capacity(duties, 2.5)
+        self.assertEqual(duties, [1.0, 1.0, 0.5, 0.0])
+
+    def test_cpu(self) -> None:
+        duties = [0.0] * 8
+        governor = Governor(ThrottleTarget("cpu", 25.0), duties, cpu_count=8)
+        self.assertEqual(duties, [1.0, 1.0] + [0.0] * 6)
+        governor.update(now=0.0)
+        governor.record(2 * THROTTLE_INTERVAL)
+        self.assertFalse(governor.update(now=THROTTLE_INTERVAL))
+        self.assertEqual(governor.throughput, 2.0)
+
+    def test_load(self) -> None:
+        # A machine with some load from elsewhere, plus one core per running
+        # worker.
+        duties = [0.0] * 8
+        governor = Governor(ThrottleTarget("load", 5.0), duties, cpu_count=8)
+        self.assertEqual(governor.capacity, 8.0)
+        now = 0.0
+        governor.update(now=now)
+        for _ in range(100):
+            now += THROTTLE_INTERVAL
+            governor.update(now=now, load=2.0 + sum(duties))
+        self.assertAlmostEqual(sum(duties), 3.0, places=2)
+
+        # If the outside load goes over the target, we back off as far as we
+        # can, but don't stop.
+        for _ in range(100):
+            now += THROTTLE_INTERVAL
+            governor.update(now=now, load=10.0 + sum(duties))
+        self.assertEqual(governor.capacity, MIN_CAPACITY)
+        self.assertGreater(duties[0], 0.0)
+
+    def test_cgroup_limit(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            self.assertIsNone(cgroup_cpu_limit(root))
+            with open(os.path.join(root, "cpu.max"), "w") as f:
+                f.write("250000 100000\n")
+            self.assertEqual(cgroup_cpu_limit(root), 2.5)
+            with open(os.path.join(root, "cpu.max"), "w") as f:
+                f.write("max 100000\n")
+            self.assertIsNone(cgroup_cpu_limit(root))
+
+
+if __name__ == "__main__":
+    unittest.main()
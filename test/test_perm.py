@@ -1,17 +1,51 @@
+import asyncio
+import json
 import os
 from pathlib import Path
 import re
 import shutil
+import sqlite3
 import tempfile
-from typing import Any, Optional
+import threading
+from typing import Any, Dict, List, Optional
 import unittest
 
+from src.batch import run_batch
+from src.checkpoint import CHECKPOINT_FILE
 from src.compiler import Compiler
+from src.daemon import Daemon
 from src.preprocess import preprocess
-from src import main
+from src import api, main
 
 
 class TestPermMacros(unittest.TestCase):
+    def write_dir(
+        self,
+        target_dir: str,
+        base: str,
+        target: str,
+        *,
+        fn_name: Optional[str] = None,
+        settings: str = "",
+    ) -> None:
+        compiler = Compiler("test/compile.sh", show_errors=True, debug_mode=False)
+        with open(os.path.join(target_dir, "base.c"), "w") as f:
+            f.write(base)
+
+        target_o = compiler.compile(target, show_errors=True)
+        assert target_o is not None
+        shutil.move(target_o, os.path.join(target_dir, "target.o"))
+
+        shutil.copy2("test/compile.sh", os.path.join(target_dir, "compile.sh"))
+
+        if fn_name:
+            with open(os.path.join(target_dir, "function.txt"), "w") as f:
+                f.write(fn_name)
+
+        if settings:
+            with open(os.path.join(target_dir, "settings.toml"), "w") as f:
+                f.write(settings)
+
     def go(
         self,
         intro: str,
@@ -20,30 +54,25 @@ class TestPermMacros(unittest.TestCase):
         target: str,
         *,
         fn_name: Optional[str] = None,
-        **kwargs: Any
+        settings: str = "",
+        runs: int = 1,
+        expected_outputs: Optional[int] = None,
+        **kwargs: Any,
     ) -> int:
         base = intro + "\n" + base + "\n" + outro
         target = intro + "\n" + target + "\n" + outro
-        compiler = Compiler("test/compile.sh", show_errors=True, debug_mode=False)
 
         # For debugging, to avoid the auto-deleted directory:
         # target_dir = tempfile.mkdtemp()
         with tempfile.TemporaryDirectory() as target_dir:
-            with open(os.path.join(target_dir, "base.c"), "w") as f:
-                f.write(base)
-
-            target_o = compiler.compile(target, show_errors=True)
-            assert target_o is not None
-            shutil.move(target_o, os.path.join(target_dir, "target.o"))
-
-            shutil.copy2("test/compile.sh", os.path.join(target_dir, "compile.sh"))
-
-            if fn_name:
-                with open(os.path.join(target_dir, "function.txt"), "w") as f:
-                    f.write(fn_name)
-
+            self.write_dir(target_dir, base, target, fn_name=fn_name, settings=settings)
             opts = main.Options(directories=[target_dir], stop_on_zero=True, **kwargs)
-            return main.run(opts)[0]
+            for _ in range(runs):
+                score = main.run(opts)[0]
+            if expected_outputs is not None:
+                outputs = [f for f in os.listdir(target_dir) if f.startswith("output-")]
+                self.assertEqual(len(outputs), expected_outputs)
+            return score
 
     def test_general(self) -> None:
         score = self.go(
@@ -242,6 +271,237 @@ class TestPermMacros(unittest.TestCase):
         )
         self.assertEqual(score, 0)
 
+    def test_randomizer_pipelined(self) -> None:
+        for threads in [1, 2]:
+            score = self.go(
+                "void foo(); void bar(); void test(void) {",
+                "}",
+                "PERM_RANDOMIZE(bar(); foo();)",
+                "foo(); bar();",
+                threads=threads,
+                pipeline=3,
+            )
+            self.assertEqual(score, 0)
+
+    def test_pipelined_perm(self) -> None:
+        score = self.go(
+            "int test() {",
+            "}",
+            "return PERM_GENERAL(32,64);",
+            "return 64;",
+            pipeline=2,
+        )
+        self.assertEqual(score, 0)
+
+    def test_randomizer_best_of(self) -> None:
+        for threads in [1, 2]:
+            score = self.go(
+                "void foo(); void bar(); void test(void) {",
+                "}",
+                "PERM_RANDOMIZE(bar(); foo();)",
+                "foo(); bar();",
+                threads=threads,
+                best_of=4,
+            )
+            self.assertEqual(score, 0)
+
+    def test_randomizer_adaptive(self) -> None:
+        score = self.go(
+            "void foo(); void bar(); void test(void) {",
+            "}",
+            "bar(); foo();",
+            "foo(); bar();",
+            threads=2,
+            adaptive_weights=True,
+        )
+        self.assertEqual(score, 0)
+
+    def test_randomizer_population(self) -> None:
+        for threads in [1, 2]:
+            score = self.go(
+                "void foo(); void bar(); void test(void) {",
+                "}",
+                "bar(); foo();",
+                "foo(); bar();",
+                threads=threads,
+                search="population",
+            )
+            self.assertEqual(score, 0)
+
+    def test_randomizer_anneal(self) -> None:
+        score = self.go(
+            "void foo(); void bar(); void test(void) {",
+            "}",
+            "bar(); foo();",
+            "foo(); bar();",
+            search="anneal",
+            anneal_iterations=100,
+        )
+        self.assertEqual(score, 0)
+
+    def test_randomizer_tempering(self) -> None:
+        score = self.go(
+            "void foo(); void bar(); void test(void) {",
+            "}",
+            "bar(); foo();",
+            "foo(); bar();",
+            threads=3,
+            search="tempering",
+        )
+        self.assertEqual(score, 0)
+
+    def test_compile_server(self) -> None:
+        server = os.path.abspath("compile_server_example.py")
+        score = self.go(
+            "int test() {",
+            "}",
+            "return PERM_GENERAL(32,64);",
+            "return 64;",
+            settings=f'compile_server = "{server} ./compile.sh"\n',
+            threads=2,
+        )
+        self.assertEqual(score, 0)
+
+    def test_context_pragmas(self) -> None:
+        score = self.go(
+            "#pragma _permuter latedefine start\n"
+            "#pragma _permuter define X 64\n"
+            "#pragma _permuter latedefine end\n"
+            "int x;\n"
+            "int test() {",
+            "}",
+            "return PERM_GENERAL(32,X);",
+            "return 64;",
+        )
+        self.assertEqual(score, 0)
+
+    def test_disk_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = os.path.join(cache_dir, "cache.sqlite3")
+            for run in range(2):
+                score = self.go(
+                    "int test() {",
+                    "}",
+                    "return PERM_GENERAL(32,64);",
+                    "return 64;",
+                    disk_cache=cache,
+                )
+                self.assertEqual(score, 0)
+                conn = sqlite3.connect(cache, isolation_level=None)
+                if run == 0:
+                    # Make the entries stale, so that hits mark them as used.
+                    conn.execute("UPDATE scores SET last_used = 0")
+                else:
+                    # The second run found what the first one stored.
+                    ((touched,),) = conn.execute(
+                        "SELECT COUNT(*) FROM scores WHERE last_used > 0"
+                    )
+                    self.assertGreater(touched, 0)
+                conn.close()
+
+    def test_resume(self) -> None:
+        # The second run picks up after the seed that produced score 0, so
+        # it doesn't output it again.
+        for threads in [1, 2]:
+            score = self.go(
+                "int test() {",
+                "}",
+                "return PERM_GENERAL(32,64);",
+                "return 64;",
+                runs=2,
+                expected_outputs=1,
+                resume=True,
+                threads=threads,
+            )
+            self.assertEqual(score, 0)
+
+    def test_no_checkpoint(self) -> None:
+        # Checkpoints are only written when asked for.
+        with tempfile.TemporaryDirectory() as target_dir:
+            self.write_dir(
+                target_dir,
+                "int test() { return PERM_GENERAL(32,64); }",
+                "int test() { return 64; }",
+            )
+            main.run(main.Options(directories=[target_dir], stop_on_zero=True))
+            self.assertNotIn(CHECKPOINT_FILE, os.listdir(target_dir))
+
+    def test_daemon(self) -> None:
+        daemon = Daemon(2)
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            with tempfile.TemporaryDirectory() as target_dir:
+                self.write_dir(
+                    target_dir,
+                    "int test() { return PERM_GENERAL(32,64); }",
+                    "int test() { return 64; }",
+                )
+                for _ in range(2):
+                    job = daemon.submit(
+                        {"directories": [target_dir], "options": {"stop_on_zero": True}}
+                    )
+                    events: List[Dict[str, object]] = []
+                    daemon.watch({"job": job.id}, events.append)
+                    self.assertEqual(events[-1]["event"], "done")
+                    # Finished jobs only keep a summary of their permuters.
+                    self.assertEqual(job.permuters, [])
+                    functions = job.info()["functions"]
+                    assert isinstance(functions, list)
+                    self.assertEqual(functions[0]["best_score"], 0)
+        finally:
+            daemon.stop()
+            thread.join()
+
+    def test_batch(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            for name, target in [("a", "return 64;"), ("b", "return 92;")]:
+                target_dir = os.path.join(root, name)
+                os.mkdir(target_dir)
+                self.write_dir(
+                    target_dir,
+                    "int test() { return PERM_GENERAL(32,64); }",
+                    "int test() { " + target + " }",
+                )
+            summary = os.path.join(root, "summary.json")
+            opts = main.Options(
+                directories=[root], batch=True, threads=2, batch_summary=summary
+            )
+            entries = run_batch(opts)
+            self.assertEqual([e.status for e in entries], ["matched", "exhausted"])
+            # Retired functions only keep a summary of their permuters.
+            self.assertEqual([e.permuter for e in entries], [None, None])
+            with open(summary) as f:
+                self.assertEqual(json.load(f)["functions"][0]["best_score"], 0)
+
+    def test_api(self) -> None:
+        compiler = Compiler("test/compile.sh", show_errors=True, debug_mode=False)
+        target_o = compiler.compile("int test() { return 64; }", show_errors=True)
+        assert target_o is not None
+        with open(target_o, "rb") as f:
+            target = f.read()
+        os.remove(target_o)
+        function = api.Function(
+            "int test() { return PERM_GENERAL(32,64); }",
+            target,
+            "test/compile.sh",
+            fn_name="test",
+        )
+        with api.PermuterPool(2) as pool:
+            for _ in range(2):
+                events = list(pool.permute(function))
+                self.assertIsInstance(events[-1], api.StatsTick)
+                found = [e for e in events if isinstance(e, api.Improvement)]
+                self.assertEqual(found[-1].score, 0)
+
+            async def collect() -> List[api.Event]:
+                return [e async for e in pool.apermute(function)]
+
+            events = asyncio.run(collect())
+            last = events[-1]
+            assert isinstance(last, api.StatsTick)
+            self.assertEqual(last.best_score, 0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,75 @@
+import importlib.util
+import pickle
+import unittest
+
+from src.candidate import CandidateResult
+from src.profiler import Histogram, Profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def test_percentiles(self) -> None:
+        histogram = Histogram()
+        for ms in range(1, 101):
+            histogram.add(ms / 1000)
+        ratio = 2 ** (1 / Histogram.BUCKETS_PER_DOUBLING)
+        for p in [50, 95, 99]:
+            self.assertLessEqual(histogram.percentile(p), p / 1000 * ratio)
+            self.assertGreaterEqual(histogram.percentile(p), p / 1000 / ratio)
+        self.assertEqual(Histogram().percentile(50), 0.0)
+        histogram.add(0.0)
+        self.assertEqual(histogram.total, 101)
+
+    def test_merge(self) -> None:
+        # Merging profilers from different workers gives the same percentiles
+        # as having recorded everything in one place.
+        merged = Profiler()
+        combined = Profiler()
+        for worker in range(3):
+            profiler = Profiler()
+            for i in range(100):
+                t = (worker * 100 + i + 1) / 10000
+                profiler.add_stat(Profiler.StatType.compile, t)
+                combined.add_stat(Profiler.StatType.compile, t)
+            merged.merge(pickle.loads(pickle.dumps(profiler)))
+        stat = Profiler.StatType.compile
+        self.assertEqual(merged.time_counts[stat], 300)
+        self.assertAlmostEqual(merged.time_stats[stat], combined.time_stats[stat])
+        for p in Profiler.PERCENTILES:
+            self.assertEqual(
+                merged.histograms[stat].percentile(p),
+                combined.histograms[stat].percentile(p),
+            )
+
+    def test_summaries(self) -> None:
+        profiler = Profiler()
+        for stat in Profiler.PHASES:
+            profiler.add_stat(stat, 0.25)
+        profiler.add_stat(Profiler.StatType.objdump, 0.1)
+        self.assertIn("25% compile", profiler.get_str_stats())
+        self.assertIn("objdump", profiler.get_latency_str())
+        timings = profiler.to_json()
+        stats = timings["stats"]
+        assert isinstance(stats, dict)
+        self.assertEqual(stats["objdump"]["count"], 1)
+        self.assertNotIn("diff", stats)
+
+    @unittest.skipUnless(importlib.util.find_spec("nacl"), "needs PyNaCl")
+    def test_from_json(self) -> None:
+        # Finer-grained stats from p@h servers are kept, and ones this version
+        # doesn't know about are skipped.
+        from src.net.client import _result_from_json
+
+        result = _result_from_json(
+            {
+                "score": 10,
+                "profiler": {"compile": 0.5, "score": 0.25},
+                "profiler_detail": {"objdump": 0.125, "newfangled": 1.0},
+            },
+            None,
+        )
+        assert isinstance(result, CandidateResult)
+        profiler = result.profiler
+        assert profiler is not None
+        self.assertEqual(profiler.time_stats[Profiler.StatType.compile], 0.5)
+        self.assertEqual(profiler.time_stats[Profiler.StatType.objdump], 0.125)
+        self.assertEqual(profiler.time_counts[Profiler.StatType.diff], 0)
@@ -0,0 +1,149 @@
+from random import Random
+from typing import List, Mapping, Tuple
+import unittest
+
+from pycparser import c_ast as ca
+
+from src import ast_util
+from src.ast_types import TypeMap, _add_to_typemap, build_typemap
+from src.randomizer import (
+    RANDOMIZATION_PASSES,
+    RandomizationFailure,
+    RandomizationPass,
+    get_randomization_region,
+)
+
+SOURCE = """
+typedef int s32;
+typedef struct Vec { float x, y; struct Vec *next; } Vec;
+enum Mode { MODE_A, MODE_B };
+extern Vec gVecs[4];
+extern s32 gCount;
+s32 helper(s32 n);
+s32 test(Vec *v, s32 n) {
+    s32 i;
+    s32 sum = 0;
+    float f = v->x * 2.0f;
+    for (i = 0; i < n; i++) {
+        sum += helper(i) + gVecs[i & 3].next->y;
+        if (sum > 100) {
+            v->y = f + sum;
+        }
+    }
+    switch (n) {
+    case MODE_A:
+        gCount = sum * 3;
+        break;
+    default:
+        gCount += (s32) v->next->x;
+    }
+    return sum + gCount;
+}
+s32 after(void) { s32 local = gCount; return local; }
+"""
+
+
+def _apply(
+    ast: ca.FileAST, method: RandomizationPass, rng: Random, eager: bool
+) -> bool:
+    """Run a pass the way Randomizer.randomize does, optionally computing node
+    indices before anything gets a chance to change the function. Returns
+    whether the pass applied."""
+    fn = ast_util.extract_fn(ast, "test")[0]
+    indices = ast_util.compute_node_indices(fn)
+    if eager:
+        indices.starts
+    region = get_randomization_region(fn, indices, rng)
+    try:
+        method(fn, ast, indices, region, rng)
+    except RandomizationFailure:
+        return False
+    return True
+
+
+def _typemap_key(typemap: TypeMap) -> Tuple[object, ...]:
+    def items(d: Mapping[str, ca.Node]) -> List[Tuple[str, str]]:
+        # Enumerators get fresh int types on each walk, so compare types by
+        # their generated code rather than by identity.
+        return [(k, ast_util.to_c_raw(v)) for k, v in d.items()]
+
+    return (
+        items(typemap.typedefs),
+        items(typemap.var_types),
+        sorted(typemap.local_vars),
+        [(k, id(v)) for k, v in typemap.struct_defs.items()],
+    )
+
+
+def _fresh_typemap(ast: ca.FileAST, fn: ca.FuncDef) -> TypeMap:
+    ret = TypeMap()
+    _add_to_typemap(ret, ast.ext, fn)
+    return ret
+
+
+class TestRandomizer(unittest.TestCase):
+    def test_lazy_indices(self) -> None:
+        # Passes see the same indices as if they had been computed up front,
+        # also on ASTs that earlier passes have changed.
+        for method in RANDOMIZATION_PASSES:
+            for seed in range(4):
+                lazy = ast_util.parse_c(SOURCE)
+                eager = ast_util.parse_c(SOURCE)
+                lazy_rng = Random(seed)
+                eager_rng = Random(seed)
+                for _ in range(3):
+                    with self.subTest(method=method.__name__, seed=seed):
+                        self.assertEqual(
+                            _apply(lazy, method, lazy_rng, eager=False),
+                            _apply(eager, method, eager_rng, eager=True),
+                        )
+                        self.assertEqual(ast_util.to_c(lazy), ast_util.to_c(eager))
+
+    def test_typemap_cache(self) -> None:
+        # After passes have changed the AST (including adding functions
+        # around the target one), the cached typemap matches a full walk.
+        rng = Random(1)
+        for method in RANDOMIZATION_PASSES:
+            ast = ast_util.parse_c(SOURCE)
+            for _ in range(3):
+                _apply(ast, method, rng, eager=False)
+                fn = ast_util.extract_fn(ast, "test")[0]
+                with self.subTest(method=method.__name__):
+                    self.assertEqual(
+                        _typemap_key(build_typemap(ast, fn)),
+                        _typemap_key(_fresh_typemap(ast, fn)),
+                    )
+
+    def test_typemap_after_clone(self) -> None:
+        ast = ast_util.parse_c(SOURCE)
+        fn = ast_util.extract_fn(ast, "test")[0]
+        original = build_typemap(ast, fn)
+
+        # A deep clone has its own context nodes, so it doesn't get the
+        # original's cached typemap, even when changed in place.
+        cloned = ast_util.clone_ast(ast)
+        assert isinstance(cloned, ca.FileAST)
+        cloned_fn = ast_util.extract_fn(cloned, "test")[0]
+        typedef = cloned.ext[0]
+        assert isinstance(typedef, ca.Typedef)
+        assert isinstance(typedef.type, ca.TypeDecl)
+        assert isinstance(typedef.type.type, ca.IdentifierType)
+        typedef.type.type.names = ["short"]
+        typemap = build_typemap(cloned, cloned_fn)
+        self.assertEqual(
+            _typemap_key(typemap), _typemap_key(_fresh_typemap(cloned, cloned_fn))
+        )
+        self.assertIsNot(typemap.struct_defs["Vec"], original.struct_defs["Vec"])
+        self.assertEqual(ast_util.to_c_raw(typemap.typedefs["s32"]), "short")
+        self.assertEqual(ast_util.to_c_raw(original.typedefs["s32"]), "int")
+
+        # Copies that only clone the function, like Candidate.clone, share
+        # the context and its typemap.
+        shallow = ca.FileAST(list(ast.ext))
+        index = shallow.ext.index(fn)
+        fn_copy = ast_util.clone_ast(fn)
+        assert isinstance(fn_copy, ca.FuncDef)
+        shallow.ext[index] = fn_copy
+        typemap = build_typemap(shallow, fn_copy)
+        self.assertIs(typemap.struct_defs["Vec"], original.struct_defs["Vec"])
+        self.assertEqual(_typemap_key(typemap), _typemap_key(original))
@@ -0,0 +1,75 @@
+from typing import Dict, List
+import unittest
+
+from src.schedule import SeedScheduler
+
+
+def simulate(
+    scheduler: SeedScheduler,
+    latencies: List[float],
+    steps: int,
+    improving: int = -1,
+) -> List[float]:
+    """Run a scheduler over permuters with fixed iteration times, returning
+    the time each one got."""
+    times = [0.0] * len(latencies)
+    active = list(range(len(latencies)))
+    for _ in range(steps):
+        i = scheduler.pick(active)
+        times[i] += latencies[i]
+        scheduler.record(i, latencies[i], improved=i == improving)
+    return times
+
+
+class TestSeedScheduler(unittest.TestCase):
+    def test_equal_time(self) -> None:
+        # A function that compiles 40x slower gets as much time, not as many
+        # iterations.
+        times = simulate(SeedScheduler("time", [1.0, 1.0]), [2.0, 0.05], 4000)
+        self.assertAlmostEqual(times[0] / sum(times), 0.5, delta=0.02)
+
+    def test_priority(self) -> None:
+        times = simulate(SeedScheduler("time", [3.0, 1.0]), [0.1, 0.1], 4000)
+        self.assertAlmostEqual(times[0] / sum(times), 0.75, delta=0.02)
+
+    def test_improvement(self) -> None:
+        times = simulate(
+            SeedScheduler("improvement", [1.0, 1.0]), [0.1, 0.1], 4000, improving=1
+        )
+        self.assertGreater(times[1], 3 * times[0])
+        # Stalled permuters still get some time.
+        self.assertGreater(times[0], 0.0)
+
+    def test_inactive(self) -> None:
+        scheduler = SeedScheduler("time", [1.0, 1.0, 1.0])
+        counts: Dict[int, int] = {}
+        for _ in range(10):
+            i = scheduler.pick([0, 2])
+            counts[i] = counts.get(i, 0) + 1
+            scheduler.record(i, 1.0, improved=False)
+        self.assertEqual(counts, {0: 5, 2: 5})
+
+    def test_add(self) -> None:
+        # A permuter that joins late doesn't get to catch up on the time it
+        # missed.
+        scheduler = SeedScheduler("time", [1.0])
+        for _ in range(100):
+            scheduler.record(scheduler.pick([0]), 1.0, improved=False)
+        self.assertEqual(scheduler.add(1.0, [0]), 1)
+        counts = [0, 0]
+        for _ in range(100):
+            i = scheduler.pick([0, 1])
+            counts[i] += 1
+            scheduler.record(i, 1.0, improved=False)
+        self.assertEqual(counts, [50, 50])
+
+    def test_rejoin(self) -> None:
+        scheduler = SeedScheduler("time", [1.0, 1.0])
+        for _ in range(100):
+            scheduler.record(scheduler.pick([0]), 1.0, improved=False)
+        scheduler.rejoin(1, [0])
+        self.assertAlmostEqual(scheduler._virtual_time[1], 100.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
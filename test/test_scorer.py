@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+from typing import List, Tuple
+import unittest
+
+from src.objdump import Line
+from src.profiler import Profiler
+from src.scorer import Scorer
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "disasm")
+
+
+class TestScorerFastPath(unittest.TestCase):
+    def setUp(self) -> None:
+        self.scorer = Scorer(
+            os.path.join(FIXTURE_DIR, "relocs.o"),
+            stack_differences=False,
+            algorithm="difflib",
+            debug_mode=False,
+            builtin_disasm=True,
+        )
+        self.objdumps: List[str] = []
+        objdump = self.scorer._objdump
+
+        def counting_objdump(o_file: str) -> Tuple[str, List[Line]]:
+            self.objdumps.append(o_file)
+            return objdump(o_file)
+
+        setattr(self.scorer, "_objdump", counting_objdump)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def copy(self, name: str) -> str:
+        # Object files are scored from copies, as candidates would be.
+        path = os.path.join(self.tmp_dir.name, f"{len(self.objdumps)}-{name}")
+        shutil.copy(os.path.join(FIXTURE_DIR, name), path)
+        return path
+
+    def test_exact_match(self) -> None:
+        profiler = Profiler()
+        score = self.scorer.score(self.copy("relocs.o"), profiler)
+        self.assertEqual(score, (0, self.scorer.target_hash))
+        self.assertEqual(self.objdumps, [])
+        self.assertEqual(profiler.counters[Profiler.CounterType.score_exact], 1)
+        self.assertEqual(profiler.time_counts[Profiler.StatType.objdump], 0)
+
+    def test_repeated_raw_hash(self) -> None:
+        profiler = Profiler()
+        first = self.scorer.score(self.copy("branches.o"), profiler)
+        self.assertGreater(first[0], 0)
+        self.assertEqual(len(self.objdumps), 1)
+        self.assertEqual(profiler.counters[Profiler.CounterType.score_cache_miss], 1)
+
+        # The same object file again, under a different name: scored from the
+        # cache, without disassembling it.
+        second = self.scorer.score(self.copy("branches.o"), profiler)
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.objdumps), 1)
+        self.assertEqual(profiler.counters[Profiler.CounterType.score_cache_hit], 1)
+        self.assertEqual(profiler.counters[Profiler.CounterType.score_cache_miss], 1)
+        self.assertEqual(profiler.time_counts[Profiler.StatType.objdump], 1)
+        self.assertEqual(profiler.time_counts[Profiler.StatType.hash], 2)
+
+    def test_debug_mode(self) -> None:
+        # Debug mode wants to see the diff, so it always disassembles.
+        self.scorer.debug_mode = True
+        profiler = Profiler()
+        self.scorer.score(self.copy("relocs.o"), profiler)
+        self.scorer.score(self.copy("relocs.o"), profiler)
+        self.assertEqual(len(self.objdumps), 2)
+        self.assertEqual(profiler.counters[Profiler.CounterType.score_exact], 0)
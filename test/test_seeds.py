@@ -0,0 +1,44 @@
+import unittest
+
+from src.perm.eval import SeedPermutation, perm_gen_all_seeds
+from src.perm.perm import Perm
+
+
+class CountPerm(Perm):
+    def __init__(self, count: int) -> None:
+        self.perm_count = count
+        self.children = []
+
+
+class TestSeeds(unittest.TestCase):
+    def test_bijection(self) -> None:
+        for count in range(1, 70):
+            for key in range(3):
+                order = SeedPermutation(count, key)
+                seeds = [order[i] for i in range(count)]
+                self.assertEqual(sorted(seeds), list(range(count)))
+        self.assertRaises(IndexError, lambda: SeedPermutation(5, 0)[5])
+
+    def test_keyed(self) -> None:
+        perm = CountPerm(1000)
+        first = list(perm_gen_all_seeds(perm, 1))
+        self.assertEqual(first, list(perm_gen_all_seeds(perm, 1)))
+        self.assertNotEqual(first, list(perm_gen_all_seeds(perm, 2)))
+        self.assertNotEqual(first, sorted(first))
+
+    def test_shards(self) -> None:
+        perm = CountPerm(1000)
+        full = list(perm_gen_all_seeds(perm, 7))
+        shards = [
+            list(perm_gen_all_seeds(perm, 7, shard=i, num_shards=3)) for i in range(3)
+        ]
+        self.assertEqual(sorted(sum(shards, [])), list(range(1000)))
+        self.assertEqual(shards[1], full[1::3])
+        resumed = list(perm_gen_all_seeds(perm, 7, start=10, shard=1, num_shards=3))
+        self.assertEqual(resumed, shards[1][10:])
+
+    def test_huge(self) -> None:
+        # Far too many seeds to keep track of individually.
+        count = 10**30
+        seeds = iter(perm_gen_all_seeds(CountPerm(count), 0, start=10**25))
+        self.assertTrue(0 <= next(seeds) < count)